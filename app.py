@@ -1,56 +1,1217 @@
 # app.py — PaintSource PRO (stroke-lock web + letters + persistence + safe HTML)
-import asyncio, json, argparse, time, pathlib
-from typing import Dict, Tuple, Optional
-from fastapi import FastAPI, WebSocket
-from fastapi.responses import HTMLResponse, JSONResponse
+import abc, asyncio, gzip, hashlib, hmac, json, argparse, mmap, multiprocessing, multiprocessing.connection, os, re, signal, socket, threading, time, pathlib, struct, sys, zlib
+from array import array
+from bisect import bisect_left
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from itertools import chain, compress, repeat
+from typing import Awaitable, Callable, Iterable, Iterator, List, Optional, Sequence, Tuple, Union
+from urllib.parse import quote
+from fastapi import FastAPI, Request, WebSocket
+from fastapi.responses import HTMLResponse, JSONResponse, Response, StreamingResponse
 from fastapi.websockets import WebSocketDisconnect
 import uvicorn
+try:
+    import numpy as np
+except ImportError:
+    np = None
 
-def make_app(cols: int, rows: int, scale: int, data_dir: str, autosave_sec: int):
+BLOCK = '█'
+
+class Framebuffer:
+    """Flat array of code points indexed y*W+x; 0 is an empty cell.
+
+    `cells` is an array('I') by default, or any writable native-u32 buffer such as a
+    memoryview over a mapped canvas file (see CanvasFile).
+    """
+    __slots__ = ("w", "h", "cells")
+
+    def __init__(self, w: int, h: int, cells=None):
+        self.w, self.h = int(w), int(h)
+        self.cells = array('I', bytes(4 * self.w * self.h)) if cells is None else cells
+
+    def __len__(self) -> int:
+        if isinstance(self.cells, array):
+            return len(self.cells) - self.cells.count(0)
+        return sum(1 for _ in self.nonzero())
+
+    def get(self, x: int, y: int) -> Optional[str]:
+        cp = self.cells[y*self.w + x]
+        return chr(cp) if cp else None
+
+    def set(self, x: int, y: int, ch: Optional[str]):
+        self.cells[y*self.w + x] = ord(ch[0]) if ch else 0
+
+    def toggle(self, x: int, y: int) -> Optional[str]:
+        i = y*self.w + x
+        self.cells[i] = 0 if self.cells[i] == ord(BLOCK) else ord(BLOCK)
+        return BLOCK if self.cells[i] else None
+
+    def apply(self, points: Iterable[Sequence[int]], chars: Union[None, str, Sequence[Optional[str]]]):
+        """Bulk write of pre-validated points; `chars` is one char for all or one per point."""
+        cells, w = self.cells, self.w
+        if chars is None or isinstance(chars, str):
+            cp = ord(chars[0]) if chars else 0
+            for x, y in points:
+                cells[y*w + x] = cp
+        else:
+            for (x, y), ch in zip(points, chars):
+                cells[y*w + x] = ord(ch[0]) if ch else 0
+
+    def write(self, idx: Sequence[int], cps: Union[int, Sequence[int]]):
+        """Batch write of pre-validated flat indices; `cps` is one code point for all or one per index."""
+        cells = self.cells
+        if np is not None and len(idx) > 64:
+            np.frombuffer(cells, dtype=np.uint32)[np.asarray(idx, dtype=np.intp)] = cps
+        elif isinstance(cps, int):
+            for i in idx: cells[i] = cps
+        else:
+            for i, cp in zip(idx, cps): cells[i] = cp
+
+    def fill_rect(self, x0: int, y0: int, x1: int, y1: int, cp: int):
+        """Set the inclusive rectangle to `cp`: one 2-D numpy store, else one slice store per row."""
+        if np is not None:
+            np.frombuffer(self.cells, dtype=np.uint32).reshape(self.h, self.w)[y0:y1+1, x0:x1+1] = cp
+            return
+        n = x1 - x0 + 1
+        row = array('I', [cp]) * n
+        for y in range(y0, y1 + 1):
+            i = y*self.w + x0
+            self.cells[i:i+n] = row
+
+    def flood(self, x: int, y: int, cp: int, limit: int = 0) -> Optional[List[Tuple[int, int, int]]]:
+        """Scanline fill of the 4-connected region sharing (x, y)'s value; returns its sorted row runs
+        (y, x, n). A region of more than `limit` cells (0: no limit) is left as it was and gives None."""
+        cells, w, h = self.cells, self.w, self.h
+        target = cells[y*w + x]
+        if target == cp: return []
+        flat = np.frombuffer(cells, dtype=np.uint32) if np is not None else None
+        out, stack, count = [], [(x, y)], 0
+        while stack:
+            x, y = stack.pop()
+            row = y*w
+            if cells[row + x] != target: continue
+            if flat is not None:
+                stop = flat[row:row + w] != target
+                left, right = np.flatnonzero(stop[:x]), np.flatnonzero(stop[x:])
+                l = int(left[-1]) + 1 if len(left) else 0
+                r = x + int(right[0]) - 1 if len(right) else w - 1
+            else:
+                l = r = x
+                while l > 0 and cells[row + l - 1] == target: l -= 1
+                while r < w - 1 and cells[row + r + 1] == target: r += 1
+            cells[row + l:row + r + 1] = array('I', [cp]) * (r - l + 1)
+            out.append((y, l, r - l + 1))
+            count += r - l + 1
+            if limit and count > limit:
+                for ry, rx, n in out: cells[ry*w + rx:ry*w + rx + n] = array('I', [target]) * n
+                return None
+            for ny in (y - 1, y + 1):
+                if not 0 <= ny < h: continue
+                nrow = ny*w
+                if flat is not None:   # seed the start of each run of `target` above/below the span
+                    hit = flat[nrow + l:nrow + r + 1] == target
+                    starts = np.flatnonzero(hit[1:] & ~hit[:-1]) + 1
+                    if hit[0]: stack.append((l, ny))
+                    stack.extend((l + int(i), ny) for i in starts)
+                    continue
+                inside = False
+                for nx in range(l, r + 1):
+                    if cells[nrow + nx] == target:
+                        if not inside: stack.append((nx, ny)); inside = True
+                    else:
+                        inside = False
+        out.sort()
+        return out
+
+    def clear(self):
+        if isinstance(self.cells, array):
+            self.cells = array('I', bytes(4 * self.w * self.h)); return
+        raw, step = memoryview(self.cells).cast('B'), 1 << 20
+        for o in range(0, len(raw), step):
+            raw[o:o+step] = bytes(len(raw[o:o+step]))
+
+    def empty(self) -> bool:
+        if np is not None:
+            return not np.frombuffer(self.cells, dtype=np.uint32).any()
+        raw, step = memoryview(self.cells).cast('B'), 1 << 20
+        return all(bytes(raw[o:o+step]).count(0) == len(raw[o:o+step]) for o in range(0, len(raw), step))
+
+    def nonzero(self) -> Iterable[int]:
+        """Flat indices of non-empty cells; skips all-zero chunks without touching them in Python."""
+        cells, n = self.cells, len(self.cells)
+        if np is not None:
+            return np.flatnonzero(np.frombuffer(cells, dtype=np.uint32) != 0).tolist()   # bool input is numpy's fast path
+        return self._nonzero_chunks(cells, n)
+
+    @staticmethod
+    def _nonzero_chunks(cells, n, chunk=128):
+        raw, zero = memoryview(cells).cast('B'), bytes(4 * chunk)
+        for o in range(0, n, chunk):
+            if raw[4*o:4*(o+chunk)] == zero[:4*min(chunk, n-o)]: continue
+            yield from compress(range(o, min(o+chunk, n)), cells[o:o+chunk])
+
+    def region(self, x0: int, y0: int, x1: int, y1: int) -> Iterator[Tuple[int, int]]:
+        """Yield (flat index, code point) for non-empty cells in [x0,x1) x [y0,y1)."""
+        cells, w = self.cells, self.w
+        raw, zero = memoryview(cells).cast('B'), bytes(4 * (x1 - x0))
+        for y in range(y0, y1):
+            o = y*w
+            if raw[4*(o+x0):4*(o+x1)] == zero: continue
+            for i in compress(range(o+x0, o+x1), cells[o+x0:o+x1]):
+                yield i, cells[i]
+
+    def blit(self, w: int, h: int, cells):
+        """Copy the overlapping top-left part of a w x h cell buffer into this canvas."""
+        n = min(w, self.w)
+        with memoryview(self.cells) as dst:
+            for y in range(min(h, self.h)):
+                dst[y*self.w:y*self.w + n] = cells[y*w:y*w + n]
+
+    def items(self) -> Iterator[Tuple[int, int, str]]:
+        """(x, y, char) for every non-empty cell in row-major order.
+
+        With numpy the coordinates come from one divmod over the non-zero indices, each row's
+        y is repeated rather than converted per cell, and each distinct code point becomes a
+        str once; Python only runs the final zip(). Without numpy, empty rows are skipped whole.
+        """
+        cells, w = self.cells, self.w
+        if np is not None:
+            flat = np.frombuffer(cells, dtype=np.uint32)
+            idx = np.flatnonzero(flat != 0)
+            ys, xs = np.divmod(idx, w)
+            rows = chain.from_iterable(map(repeat, range(self.h), np.bincount(ys, minlength=self.h).tolist()))
+            table, inv = np.unique(flat[idx], return_inverse=True)
+            chars = [chr(cp) for cp in table.tolist()]
+            return zip(xs.tolist(), rows, map(chars.__getitem__, inv.tolist()))
+        return chain.from_iterable(self._row_items())
+
+    def _row_items(self) -> Iterator[Iterator[Tuple[int, int, str]]]:
+        cells, w = self.cells, self.w
+        raw, zero, xs = memoryview(cells).cast('B'), bytes(4 * w), list(range(w))
+        for y in range(self.h):
+            o = y*w
+            if raw[4*o:4*(o+w)] == zero: continue
+            row = cells[o:o+w]
+            yield zip(compress(xs, row), repeat(y), map(chr, compress(row, row)))
+
+# Drawing primitives. Clients send these instead of rasterized points, the server checks
+# them with normalize_shape() and broadcasts the normalized op, and every side rasterizes
+# line/rect/text the same way (keep the JS and term_client copies in step with these).
+#   line:       x0, y0, x1, y1, char          Bresenham from (x0,y0) to (x1,y1)
+#   rect:       x0, y0, x1, y1, fill, char    inclusive corners; outline unless fill
+#   text:       x, y, text                    rows split on "\n", clipped; a space erases
+#   flood_fill: x, y, char                    4-connected; published with the row runs it
+#                                             filled added as runs: [[x, y, n], ...]
+# Coordinates must lie on the canvas; char null erases.
+SHAPE_TOOLS = ("line", "rect", "text", "flood_fill")
+MAX_TEXT = 4096
+
+def normalize_shape(op: dict, w: int, h: int) -> Optional[dict]:
+    """The op reduced to its known fields with validated values, or None if it is not usable."""
+    tool = op.get("tool")
+    keys = {"line": ("x0", "y0", "x1", "y1"), "rect": ("x0", "y0", "x1", "y1")}.get(tool, ("x", "y"))
+    try: xy = {k: int(op[k]) for k in keys}
+    except (KeyError, TypeError, ValueError): return None
+    if not all(0 <= v < (w if k.startswith("x") else h) for k, v in xy.items()): return None
+    if tool == "text":
+        text = op.get("text")
+        if not isinstance(text, str) or not text: return None
+        return {"tool": tool, **xy, "text": text[:MAX_TEXT]}
+    char = op.get("char")
+    shape = {"tool": tool, **xy, "char": char[0] if isinstance(char, str) and char else None}
+    if tool == "rect":
+        shape["fill"] = bool(op.get("fill"))
+    return shape
+
+def shape_cells(shape: dict, w: int, h: int) -> int:
+    """Upper bound on the cells a normalized shape writes (flood_fill may reach the whole canvas)."""
+    tool = shape["tool"]
+    if tool == "flood_fill": return w * h
+    if tool == "text": return len(shape["text"])
+    dx, dy = abs(shape["x1"] - shape["x0"]) + 1, abs(shape["y1"] - shape["y0"]) + 1
+    if tool == "line": return max(dx, dy)
+    return dx * dy if shape["fill"] else min(dx * dy, 2 * (dx + dy))
+
+def rasterize(shape: dict, w: int, h: int) -> Tuple[List[int], Union[int, List[int]]]:
+    """Sorted unique flat indices of a line/rect/text shape, and its code point(s)."""
+    tool = shape["tool"]
+    if tool == "text":
+        cells = {}
+        for dy, line in enumerate(shape["text"].split("\n")):
+            y = shape["y"] + dy
+            if y >= h: break
+            for dx, ch in enumerate(line[:w - shape["x"]]):
+                cells[y*w + shape["x"] + dx] = 0 if ch == " " else ord(ch)
+        idx = sorted(cells)
+        return idx, [cells[i] for i in idx]
+    cp = ord(shape["char"]) if shape["char"] else 0
+    x0, y0, x1, y1 = shape["x0"], shape["y0"], shape["x1"], shape["y1"]
+    if tool == "rect":
+        x0, x1 = min(x0, x1), max(x0, x1)
+        y0, y1 = min(y0, y1), max(y0, y1)
+        if shape["fill"] or y1 - y0 < 2:
+            return list(chain.from_iterable(range(y*w + x0, y*w + x1 + 1) for y in range(y0, y1 + 1))), cp
+        idx = list(range(y0*w + x0, y0*w + x1 + 1))
+        for y in range(y0 + 1, y1):
+            idx.append(y*w + x0)
+            if x1 != x0: idx.append(y*w + x1)
+        idx.extend(range(y1*w + x0, y1*w + x1 + 1))
+        return idx, cp
+    dx, dy = abs(x1 - x0), -abs(y1 - y0)
+    sx, sy = (1 if x0 < x1 else -1), (1 if y0 < y1 else -1)
+    err, idx = dx + dy, []
+    while True:
+        idx.append(y0*w + x0)
+        if x0 == x1 and y0 == y1: break
+        e2 = 2*err
+        if e2 >= dy: err += dy; x0 += sx
+        if e2 <= dx: err += dx; y0 += sy
+    return sorted(set(idx)), cp
+
+# Binary protocol, negotiated with /ws?proto=bin. All integers are little-endian.
+#   out op/state: u8 kind, u8 flags, head, u16 ntable, u32 table[ntable],
+#                 u32 nruns, nruns x (u16 y, u16 x, u16 n, n char-table indices)
+#                 head is (u64 version) for BIN_OP, (u32 w, u32 h, u64 version) for BIN_STATE and
+#                 (u32 w, u32 h, u64 version, u16 tile, u32 ntiles, ntiles x (u16 tx, u16 ty)) for BIN_TILES
+#                 indices are u8, u16 with BIN_WIDE, or omitted with BIN_ONECHAR; code point 0 erases.
+#   out clear:    u8 kind, u64 version
+#   in op:        u8 BIN_IN_OP, u8 mode (0 toggle, 1 set), u32 char, n x (u16 x, u16 y)
+BIN_OP, BIN_STATE, BIN_CLEAR, BIN_TILES, BIN_IN_OP = 1, 2, 3, 4, 0x10
+BIN_ONECHAR, BIN_WIDE = 1, 2
+BIN_MAX_DIM = 0xFFFF
+
+def encode_bin_cells(kind: int, cells: Iterable[Tuple[int, int]], w: int, head: bytes = b"") -> bytes:
+    """Encode unique (flat index, code point) pairs as row runs; ascending order packs best."""
+    table, idx, runs = {}, [], []
+    prev = -2
+    for i, cp in cells:
+        t = table.get(cp)
+        if t is None: t = table[cp] = len(table)
+        idx.append(t)
+        if i == prev + 1 and i % w and runs[-1][2] < 0xFFFF: runs[-1][2] += 1
+        else: runs.append([i // w, i % w, 1])
+        prev = i
+    flags = BIN_ONECHAR if len(table) <= 1 else (BIN_WIDE if len(table) > 0xFF else 0)
+    out = bytearray(struct.pack("<BB", kind, flags))
+    out += head
+    out += struct.pack(f"<H{len(table)}I", len(table), *table)
+    out += struct.pack("<I", len(runs))
+    if flags & BIN_ONECHAR:
+        for y, x, n in runs: out += struct.pack("<HHH", y, x, n)
+        return bytes(out)
+    packed = array('H' if flags & BIN_WIDE else 'B', idx)
+    if flags & BIN_WIDE and sys.byteorder == "big": packed.byteswap()
+    raw, step, pos = packed.tobytes(), packed.itemsize, 0
+    for y, x, n in runs:
+        out += struct.pack("<HHH", y, x, n)
+        out += raw[pos*step:(pos+n)*step]; pos += n
+    return bytes(out)
+
+def encode_bin_runs(kind: int, runs: Iterable[Tuple[int, int, int]], cp: int, head: bytes = b"") -> bytes:
+    """Encode row runs (y, x, n) that all hold code point `cp`, as encode_bin_cells would."""
+    body, count = bytearray(), 0
+    for y, x, n in runs:
+        while n > 0:
+            k = min(n, 0xFFFF)
+            body += struct.pack("<HHH", y, x, k); count += 1
+            x += k; n -= k
+    return struct.pack("<BB", kind, BIN_ONECHAR) + head + struct.pack("<HII", 1, cp, count) + bytes(body)
+
+def encode_bin_op(pts: Sequence[Sequence[int]], chars: Sequence[Optional[str]], w: int, version: int = 0) -> bytes:
+    last = {}
+    for (x, y), ch in zip(pts, chars):
+        last[y*w + x] = ord(ch) if ch else 0   # repeated cells collapse to their final value
+    return encode_bin_cells(BIN_OP, sorted(last.items()), w, struct.pack("<Q", version))
+
+def decode_bin_in_op(data: bytes) -> dict:
+    """Decode a client op frame into the same dict shape as the JSON protocol's `op`."""
+    if len(data) < 6 or data[0] != BIN_IN_OP:
+        return {}
+    mode, cp = struct.unpack_from("<BI", data, 1)
+    coords = array('H', data[6:6 + (len(data) - 6) // 4 * 4])
+    if sys.byteorder == "big": coords.byteswap()
+    pts = list(zip(coords[0::2], coords[1::2]))
+    if mode == 0:
+        return {"tool": "toggle", "points": pts}
+    return {"tool": "set", "mode": "set", "points": pts, "char": chr(cp) if 0 < cp <= 0x10FFFF else None}
+
+def encode_bin_in_op(op: dict) -> bytes:
+    """Inverse of decode_bin_in_op; points outside u16 range are dropped."""
+    char = op.get("char", None)
+    if (op.get("tool") == "set" and op.get("mode") == "set") or (op.get("tool") in ("put", "toggle") and char is not None):
+        head = struct.pack("<BBI", BIN_IN_OP, 1, ord(char[0]) if isinstance(char, str) and char else 0)
+    else:
+        head = struct.pack("<BBI", BIN_IN_OP, 0, 0)
+    coords = array('H')
+    for x, y in op.get("points", []):
+        try: x = int(x); y = int(y)
+        except Exception: continue
+        if 0 <= x <= 0xFFFF and 0 <= y <= 0xFFFF: coords.extend((x, y))
+    if sys.byteorder == "big": coords.byteswap()
+    return head + coords.tobytes()
+
+def iter_bin_cells(data: bytes, off: int) -> Iterator[Tuple[int, int, int]]:
+    """Yield (x, y, code point) from the table+runs body of a binary frame starting at `off`."""
+    flags = data[1]
+    (ntable,) = struct.unpack_from("<H", data, off); off += 2
+    table = struct.unpack_from(f"<{ntable}I", data, off); off += 4*ntable
+    (nruns,) = struct.unpack_from("<I", data, off); off += 4
+    fmt = "" if flags & BIN_ONECHAR else ("H" if flags & BIN_WIDE else "B")
+    step = struct.calcsize(fmt) if fmt else 0
+    for _ in range(nruns):
+        y, x, n = struct.unpack_from("<HHH", data, off); off += 6
+        if fmt:
+            idx = struct.unpack_from(f"<{n}{fmt}", data, off); off += n*step
+            for k, t in enumerate(idx): yield x+k, y, table[t]
+        else:
+            for k in range(n): yield x+k, y, table[0]
+
+# Canvas file: fixed 32-byte header, then w*h little-endian u32 code points in row-major order.
+CANVAS_MAGIC, CANVAS_VERSION = b"PSCV", 1
+CANVAS_HEADER = struct.Struct("<4sHHIIQ8x")   # magic, version, header size, w, h, log generation
+
+def cells_le(cells) -> bytes:
+    if sys.byteorder == "little": return cells.tobytes()
+    swapped = array('I', cells); swapped.byteswap()
+    return swapped.tobytes()
+
+def read_canvas(path: pathlib.Path) -> Tuple[int, int, int, array]:
+    """Read a canvas file into memory; returns (w, h, generation, cells)."""
+    with open(path, "rb") as f:
+        magic, _ver, hsize, w, h, gen = CANVAS_HEADER.unpack(f.read(CANVAS_HEADER.size))
+        if magic != CANVAS_MAGIC: raise ValueError(f"{path} is not a canvas file")
+        f.seek(hsize)
+        cells = array('I'); cells.frombytes(f.read(4 * w * h))
+    if len(cells) != w * h: raise ValueError(f"{path} is truncated")
+    if sys.byteorder == "big": cells.byteswap()
+    return w, h, gen, cells
+
+def write_canvas(path: pathlib.Path, w: int, h: int, cells: Optional[bytes], gen: int = 0):
+    """Atomically write a canvas file; `cells=None` makes an empty (sparse) one."""
+    tmp = path.with_suffix(".tmp")
+    with open(tmp, "wb") as f:
+        f.write(CANVAS_HEADER.pack(CANVAS_MAGIC, CANVAS_VERSION, CANVAS_HEADER.size, w, h, gen))
+        if cells is None: f.truncate(CANVAS_HEADER.size + 4 * w * h)
+        else: f.write(cells)
+        f.flush(); os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+def json_pixels(fb: Framebuffer) -> list:
+    return [{"x":x,"y":y,"char":ch} for x, y, ch in fb.items()]
+
+def apply_json_pixels(fb: Framebuffer, pixels: list):
+    """Load a state.json `pixels` list, skipping malformed and out-of-range entries."""
+    pts, chars = [], []
+    for p in pixels:
+        try:
+            x, y = int(p["x"]), int(p["y"]); ch = p.get("char")
+        except Exception:
+            continue
+        if 0 <= x < fb.w and 0 <= y < fb.h and ch:
+            pts.append((x,y)); chars.append(ch)
+    fb.apply(pts, chars)
+
+def convert(src: str, dst: str):
+    """Convert between state.json and a canvas file (canvas.bin / snapshot.bin), by extension."""
+    src_p, dst_p = pathlib.Path(src), pathlib.Path(dst)
+    if src_p.suffix == ".json":
+        data = json.loads(src_p.read_text())
+        fb = Framebuffer(int(data["w"]), int(data["h"]))
+        apply_json_pixels(fb, data.get("pixels", []))
+        write_canvas(dst_p, fb.w, fb.h, cells_le(fb.cells))
+    else:
+        w, h, _gen, cells = read_canvas(src_p)
+        fb = Framebuffer(w, h, cells)
+        data = {"w": w, "h": h, "pixels": json_pixels(fb), "saved_at": int(time.time())}
+        dst_p.write_text(json.dumps(data, ensure_ascii=False))
+
+class CanvasFile:
+    """The canvas as a memory-mapped canvas file, used by --persist mmap.
+
+    Cells are written straight into the mapping, so startup is an mmap() of any size and
+    saving is a flush(). A file with other dimensions is resized (top-left overlap kept)
+    on open. The mapping is used as native u32, so this needs a little-endian host.
+    """
+    def __init__(self, path: pathlib.Path, w: int, h: int):
+        if sys.byteorder != "little":
+            raise RuntimeError("--persist mmap needs a little-endian host")
+        self.created = not path.exists()
+        if self.created:
+            write_canvas(path, w, h, None)
+        else:
+            with open(path, "rb") as f:
+                _m, _v, _hs, fw, fh, _g = CANVAS_HEADER.unpack(f.read(CANVAS_HEADER.size))
+            if (fw, fh) != (w, h):
+                ow, oh, _gen, old = read_canvas(path)
+                fb = Framebuffer(w, h); fb.blit(ow, oh, old)
+                write_canvas(path, w, h, cells_le(fb.cells))
+        self.file = open(path, "r+b")
+        self.mm = mmap.mmap(self.file.fileno(), 0)
+        hs = CANVAS_HEADER.size
+        self.view = memoryview(self.mm)
+        self.framebuffer = Framebuffer(w, h, self.view[hs:hs + 4*w*h].cast('I'))
+
+    def flush(self):
+        self.mm.flush()
+
+    def close(self):
+        self.mm.flush()
+        try:
+            self.framebuffer.cells.release(); self.view.release(); self.mm.close()
+        except BufferError: pass   # a view is still exported somewhere; GC unmaps it later
+        self.file.close()
+
+class OpLog:
+    """Append-only op log with snapshot compaction, used by --persist wal.
+
+    Each applied op is appended as a (u32 length, u32 crc32) framed record holding the
+    same bytes as a BIN_OP / BIN_CLEAR frame. Records are buffered on the event loop and
+    written with one fsync per flush interval on a single I/O thread. Once the log passes
+    `compact_bytes`, the canvas is copied and written as a snapshot on that same thread,
+    and the log segments it covers are deleted. Several logs may share one `io` executor.
+    Recovery loads the snapshot, then replays the segments after it, stopping at the first
+    torn or corrupt record.
+    """
+    RECORD = struct.Struct("<II")
+
+    def __init__(self, data_dir: pathlib.Path, flush_ms: int, compact_bytes: int,
+                 io: Optional[ThreadPoolExecutor] = None):
+        self.dir = data_dir
+        self.snapshot_path = data_dir / "snapshot.bin"
+        self.flush_sec = max(1, int(flush_ms)) / 1000
+        self.compact_bytes = max(1, int(compact_bytes))
+        self.gen = 0              # segment currently appended to; the snapshot covers all before it
+        self.buf = bytearray()
+        self.log_bytes = 0
+        self.own_io = io is None
+        self.io = io or ThreadPoolExecutor(max_workers=1, thread_name_prefix="oplog")
+
+    def _segment(self, gen: int) -> pathlib.Path:
+        return self.dir / f"ops.{gen:08d}.log"
+
+    def _segments(self):
+        out = []
+        for p in self.dir.glob("ops.*.log"):
+            try: out.append((int(p.name.split(".")[1]), p))
+            except ValueError: continue
+        return sorted(out)
+
+    def append(self, payload: bytes):
+        self.buf += self.RECORD.pack(len(payload), zlib.crc32(payload))
+        self.buf += payload
+
+    def recover(self, fb: Framebuffer) -> bool:
+        """Load snapshot + log tail into `fb`; False when there was nothing to recover."""
+        found = False
+        if self.snapshot_path.exists():
+            try:
+                self.gen = self._read_snapshot(fb); found = True
+            except (OSError, ValueError, struct.error):
+                pass
+        last = self.gen - 1
+        for gen, path in self._segments():
+            if gen < self.gen: continue
+            self._replay(path.read_bytes(), fb)
+            found, last = True, gen
+        self.gen = last + 1       # never append after a possibly torn tail
+        return found
+
+    def _read_snapshot(self, fb: Framebuffer) -> int:
+        w, h, gen, cells = read_canvas(self.snapshot_path)
+        if (w, h) == (fb.w, fb.h): fb.cells = cells
+        else: fb.blit(w, h, cells)
+        return gen
+
+    def _replay(self, data: bytes, fb: Framebuffer):
+        off, size = 0, self.RECORD.size
+        while off + size <= len(data):
+            n, crc = self.RECORD.unpack_from(data, off)
+            payload = data[off+size:off+size+n]
+            if len(payload) < n or zlib.crc32(payload) != crc: break
+            off += size + n
+            if payload[0] == BIN_CLEAR:
+                fb.clear()
+            elif payload[0] == BIN_OP:
+                for x, y, cp in iter_bin_cells(payload, 10):
+                    if x < fb.w and y < fb.h: fb.cells[y*fb.w + x] = cp
+
+    def _write(self, gen: int, data: bytes):
+        self.dir.mkdir(parents=True, exist_ok=True)   # a room gets its directory with its first op
+        with open(self._segment(gen), "ab") as f:
+            f.write(data); f.flush(); os.fsync(f.fileno())
+
+    def _write_snapshot(self, cells: bytes, w: int, h: int, gen: int):
+        self.dir.mkdir(parents=True, exist_ok=True)
+        write_canvas(self.snapshot_path, w, h, cells, gen)
+        for g, path in self._segments():
+            if g < gen: path.unlink(missing_ok=True)
+
+    async def flush(self):
+        if not self.buf: return
+        data, self.buf = bytes(self.buf), bytearray()
+        self.log_bytes += len(data)
+        await asyncio.get_running_loop().run_in_executor(self.io, self._write, self.gen, data)
+
+    async def compact(self, fb: Framebuffer):
+        """Rotate to a new segment and snapshot the canvas; only the cell copy runs on the loop."""
+        loop = asyncio.get_running_loop()
+        data, self.buf = bytes(self.buf), bytearray()
+        old, self.gen, self.log_bytes = self.gen, self.gen + 1, 0
+        cells = cells_le(fb.cells)
+        jobs = [loop.run_in_executor(self.io, self._write, old, data)] if data else []
+        jobs.append(loop.run_in_executor(self.io, self._write_snapshot, cells, fb.w, fb.h, self.gen))
+        await asyncio.gather(*jobs)
+
+    async def run(self, fb: Framebuffer):
+        while True:
+            await asyncio.sleep(self.flush_sec)
+            try:
+                await self.flush()
+                if self.log_bytes >= self.compact_bytes: await self.compact(fb)
+            except Exception:
+                pass
+
+    async def close(self, fb: Framebuffer):
+        """Compact whatever the snapshot does not cover yet; nothing is written if it covers all."""
+        if self.buf or self._segments(): await self.compact(fb)
+        if self.own_io: self.io.shutdown(wait=True)
+
+# Backplane: workers share canvas updates by sending every op through a broker that relays
+# each message to all workers, the sender included, so every replica applies ops in one order.
+#   frame:   u32 length, message
+#   Connecting starts with a handshake: the broker sends a random nonce, the worker answers
+#   HMAC-SHA256(key, nonce), and the broker sends "ok" or hangs up. Only then is it relayed to.
+#   message: u8 kind, u8 worker, u16 room length, room (utf-8), body
+#   BP_OP body is a BIN_IN_OP frame, BP_SHAPE a JSON shape op (see SHAPE_TOOLS);
+#   BP_SYNC_REQ body is a u32 request id; a replica repeats the request with a new id until
+#   answered, since one sent before the owner is connected is lost.
+#   BP_SYNC body is the request id it answers, then a BIN_STATE frame for the requesting worker.
+BP_OP, BP_CLEAR, BP_SYNC_REQ, BP_SYNC, BP_SAVE, BP_SHAPE = 1, 2, 3, 4, 5, 6
+BP_HEAD = struct.Struct("<BBH")
+BP_SYNC_ID = struct.Struct("<I")
+BP_FRAME = struct.Struct("<I")
+BP_NONCE, BP_AUTH_SEC = 16, 5
+
+def bp_proof(key: str, nonce: bytes) -> bytes:
+    return hmac.new(key.encode(), nonce, hashlib.sha256).digest()
+
+def encode_bp(kind: int, worker: int, room: str, body: bytes = b"") -> bytes:
+    name = room.encode()
+    return BP_HEAD.pack(kind, worker & 0xFF, len(name)) + name + body
+
+def decode_bp(data: bytes) -> Tuple[int, int, str, bytes]:
+    kind, worker, n = BP_HEAD.unpack_from(data)
+    off = BP_HEAD.size + n
+    return kind, worker, data[BP_HEAD.size:off].decode(), data[off:]
+
+async def _open_stream(addr: str):
+    if addr.startswith("unix:"):
+        return await asyncio.open_unix_connection(addr[5:])
+    host, _, port = addr.removeprefix("tcp:").rpartition(":")
+    return await asyncio.open_connection(host or "127.0.0.1", int(port))
+
+async def _read_frame(reader: asyncio.StreamReader) -> bytes:
+    (n,) = BP_FRAME.unpack(await reader.readexactly(BP_FRAME.size))
+    return await reader.readexactly(n)
+
+class Backplane(abc.ABC):
+    """Transport between workers: `publish()` never awaits, and every published message
+    (including our own) comes back through the `on_message` coroutine in one global order.
+    A transport that is gone for good sets `lost` and calls `on_lost`."""
+    lost = False
+
+    @abc.abstractmethod
+    async def start(self, on_message: Callable[[bytes], Awaitable[None]], on_lost: Callable[[], None]): ...
+
+    @abc.abstractmethod
+    def publish(self, data: bytes): ...
+
+    async def close(self): pass
+
+class LocalBackplane(Backplane):
+    """Client of the bundled broker (run_broker) at "unix:/path" or "tcp:host:port"."""
+    def __init__(self, addr: str, key: str = "", connect_timeout: float = 15):
+        self.addr = addr
+        self.key = key
+        self.connect_timeout = connect_timeout
+        self.writer: Optional[asyncio.StreamWriter] = None
+        self.task: Optional[asyncio.Task] = None
+
+    async def start(self, on_message, on_lost):
+        deadline = time.monotonic() + self.connect_timeout
+        while True:   # the broker may still be starting
+            try:
+                reader, self.writer = await _open_stream(self.addr); break
+            except OSError:
+                if time.monotonic() > deadline: raise
+                await asyncio.sleep(0.1)
+        try:
+            nonce = await asyncio.wait_for(_read_frame(reader), BP_AUTH_SEC)
+            self.publish(bp_proof(self.key, nonce))
+            ok = await asyncio.wait_for(_read_frame(reader), BP_AUTH_SEC) == b"ok"
+        except (asyncio.IncompleteReadError, ConnectionError, asyncio.TimeoutError):
+            ok = False
+        if not ok:
+            self.writer.close()
+            raise RuntimeError(f"backplane {self.addr}: the broker refused us; check --backplane-key")
+        self.task = asyncio.create_task(self._reader(reader, on_message, on_lost))
+
+    async def _reader(self, reader, on_message, on_lost):
+        while True:
+            try: data = await _read_frame(reader)
+            except (asyncio.IncompleteReadError, ConnectionError):
+                print("backplane: broker connection lost", file=sys.stderr)
+                self.lost = True; on_lost(); return
+            try: await on_message(data)
+            except Exception as e: print(f"backplane: dropped message: {e!r}", file=sys.stderr)
+
+    def publish(self, data: bytes):
+        self.writer.write(BP_FRAME.pack(len(data)) + data)
+
+    async def close(self):
+        if self.task: self.task.cancel()
+        if self.writer: self.writer.close()
+
+BACKPLANES = {"unix": LocalBackplane, "tcp": LocalBackplane}
+
+def open_backplane(addr: str, key: str = "") -> Backplane:
+    scheme = addr.split(":", 1)[0]
+    if scheme not in BACKPLANES:
+        raise ValueError(f"unknown backplane {addr!r}; expected one of {sorted(BACKPLANES)}")
+    return BACKPLANES[scheme](addr, key)
+
+async def run_broker(addr: str, key: str = "", max_queue: int = 65536):
+    """Relay every frame from any worker that proves it holds `key` to all such workers, in
+    arrival order.
+
+    Each worker has its own bounded queue drained by its own writer task, so a slow reader
+    only backs up its own queue. One that lets `max_queue` frames pile up is disconnected:
+    it has missed ops, so its replica is stale and it has to restart anyway.
+    """
+    peers = {}   # writer -> (queue of frames, writer task)
+
+    async def send(writer, q: asyncio.Queue):
+        try:
+            while True:
+                writer.write(await q.get())
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            drop(writer)
+
+    def drop(writer):
+        peer = peers.pop(writer, None)
+        if peer is None: return
+        if peer[1] is not asyncio.current_task(): peer[1].cancel()
+        writer.close()
+
+    async def handle(reader, writer):
+        nonce = os.urandom(BP_NONCE)
+        writer.write(BP_FRAME.pack(len(nonce)) + nonce)
+        try:
+            proof = await asyncio.wait_for(_read_frame(reader), BP_AUTH_SEC)
+        except (asyncio.IncompleteReadError, ConnectionError, asyncio.TimeoutError):
+            proof = b""
+        if not hmac.compare_digest(proof, bp_proof(key, nonce)):
+            if proof: print("broker: refused a connection with a bad key", file=sys.stderr)
+            writer.close(); return
+        writer.write(BP_FRAME.pack(2) + b"ok")
+        q = asyncio.Queue(max_queue)
+        peers[writer] = (q, asyncio.create_task(send(writer, q)))
+        try:
+            while writer in peers:
+                data = await _read_frame(reader)
+                frame = BP_FRAME.pack(len(data)) + data
+                for w, (wq, _t) in list(peers.items()):
+                    try: wq.put_nowait(frame)
+                    except asyncio.QueueFull:
+                        print("broker: dropping a worker that fell behind", file=sys.stderr); drop(w)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            drop(writer)
+
+    if addr.startswith("unix:"):
+        path = pathlib.Path(addr[5:])
+        path.unlink(missing_ok=True)
+        server = await asyncio.start_unix_server(handle, str(path))
+    else:
+        host, _, port = addr.removeprefix("tcp:").rpartition(":")
+        if not key and host not in ("", "127.0.0.1", "localhost", "::1"):
+            print(f"broker: listening on {host} without --backplane-key; anyone who can reach it can "
+                  "write to every room", file=sys.stderr)
+        server = await asyncio.start_server(handle, host or "127.0.0.1", int(port))
+    async with server:
+        await server.serve_forever()
+
+SLOW_POLICIES = ("drop", "resync")
+RATE_POLICIES = ("drop", "delay", "disconnect")
+PERSIST_MODES = ("json", "wal", "mmap")
+
+class Peer:
+    """A connected socket with a bounded outbound queue drained by its own writer task.
+
+    `push()` never awaits, so a slow socket only ever backs up its own queue. A peer
+    that stays above `high_water` queued frames for `grace_sec` (or fills the queue)
+    is handled by `policy`: "drop" closes it, "resync" discards the backlog and
+    queues a fresh full state from `resync()` instead. Without a `ws` (an SSE stream)
+    nothing is started; the response reads `queue` itself until `closed`.
+    """
+    def __init__(self, ws: Optional[WebSocket], max_queue: int, high_water: int, grace_sec: float,
+                 policy: str, resync: Callable[[], Union[str, bytes]], proto: str = "json",
+                 metrics: Optional["Metrics"] = None):
+        self.ws = ws
+        self.proto = proto
+        self.queue: asyncio.Queue = asyncio.Queue(max(1, max_queue))
+        self.high_water = max(1, min(high_water, max_queue))
+        self.grace_sec = grace_sec
+        self.policy = policy
+        self.resync = resync
+        self.over_since: Optional[float] = None
+        self.tiles: Optional[set] = None   # subscribed tile ids; None means the whole canvas
+        self.closed = False
+        self.task: Optional[asyncio.Task] = None
+        self.metrics = metrics   # counts slow-client overflows and send failures, if given
+
+    def start(self):
+        self.task = asyncio.create_task(self._writer())
+
+    def push(self, data: Union[str, bytes]):
+        if self.closed: return
+        q = self.queue
+        if q.qsize() >= self.high_water:
+            now = time.monotonic()
+            if self.over_since is None: self.over_since = now
+            if q.full() or now - self.over_since >= self.grace_sec:
+                self._overflow(); return
+        else:
+            self.over_since = None
+        q.put_nowait(data)
+
+    def _overflow(self):
+        self.over_since = None
+        if self.metrics: self.metrics.inc("slow_clients_total")
+        if self.policy == "resync":
+            while not self.queue.empty(): self.queue.get_nowait()
+            self.queue.put_nowait(self.resync())
+        else:
+            self.close()
+
+    def stop(self):
+        self.closed = True
+        if self.task: self.task.cancel()
+
+    def close(self):
+        if self.closed: return
+        self.stop()
+        asyncio.create_task(self._close_socket())
+
+    async def _close_socket(self):
+        if self.ws is None: return
+        try: await self.ws.close(code=1013)
+        except Exception: pass
+
+    async def _writer(self):
+        ws, q = self.ws, self.queue
+        try:
+            while True:
+                data = await q.get()
+                if isinstance(data, bytes): await ws.send_bytes(data)
+                else: await ws.send_text(data)
+        except asyncio.CancelledError:
+            pass
+        except Exception:
+            self.closed = True
+            if self.metrics: self.metrics.inc("send_errors_total")
+
+class TokenBucket:
+    """Allows `rate` units per second on average, holding at most one second's worth; 0 = unlimited.
+
+    A single request for more than one second's worth goes ahead once the bucket is full and is
+    charged in full: the bucket goes into debt, and later requests wait until it is paid off.
+    """
+    def __init__(self, rate: float):
+        self.rate = max(0.0, float(rate))
+        self.tokens = self.rate
+        self.stamp = time.monotonic()
+
+    def wait(self, n: float) -> float:
+        """Seconds until `n` units are available; 0 if they are now."""
+        if not self.rate: return 0.0
+        now = time.monotonic()
+        self.tokens = min(self.rate, self.tokens + (now - self.stamp) * self.rate)
+        self.stamp = now
+        return max(0.0, (min(n, self.rate) - self.tokens) / self.rate)
+
+    def take(self, n: float):
+        if self.rate: self.tokens -= n
+
+class Metrics:
+    """Counters, gauges and latency histograms, rendered in the Prometheus text format.
+
+    Cheap enough to leave on: inc() is a dict update and observe() a bisect, so a timed
+    section costs two perf_counter() calls on top. Gauges are callables read at scrape time.
+    """
+    BUCKETS = (.0001, .00025, .0005, .001, .0025, .005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10)
+
+    def __init__(self, prefix: str = "paintsource", labels: Optional[dict] = None):
+        self.prefix = prefix
+        self.labels = ",".join(f'{k}="{v}"' for k, v in (labels or {}).items())
+        self.kinds = {}     # name -> (type, help), in registration order
+        self.values = {}    # counter name -> total
+        self.hists = {}     # histogram name -> [count per bucket plus +Inf, sum]
+        self.gauges = {}    # gauge name -> callable
+
+    def counter(self, name: str, help: str):
+        self.kinds[name] = ("counter", help); self.values[name] = 0
+
+    def histogram(self, name: str, help: str):
+        self.kinds[name] = ("histogram", help); self.hists[name] = [[0] * (len(self.BUCKETS) + 1), 0.0]
+
+    def gauge(self, name: str, help: str, read: Callable[[], float]):
+        self.kinds[name] = ("gauge", help); self.gauges[name] = read
+
+    def inc(self, name: str, n: float = 1):
+        self.values[name] += n
+
+    def observe(self, name: str, seconds: float):
+        h = self.hists[name]
+        h[0][bisect_left(self.BUCKETS, seconds)] += 1
+        h[1] += seconds
+
+    def _labels(self, extra: str = "") -> str:
+        both = ",".join(l for l in (self.labels, extra) if l)
+        return "{" + both + "}" if both else ""
+
+    def render(self) -> str:
+        out = []
+        for name, (kind, help) in self.kinds.items():
+            full = f"{self.prefix}_{name}"
+            out += [f"# HELP {full} {help}", f"# TYPE {full} {kind}"]
+            if kind == "histogram":
+                counts, total = self.hists[name]
+                acc = 0
+                for le, n in zip(self.BUCKETS + ("+Inf",), counts):
+                    acc += n
+                    out.append(full + "_bucket" + self._labels(f'le="{le}"') + f" {acc}")
+                out += [f"{full}_sum{self._labels()} {total}", f"{full}_count{self._labels()} {acc}"]
+                continue
+            try: value = self.values[name] if kind == "counter" else self.gauges[name]()
+            except Exception: continue
+            out.append(f"{full}{self._labels()} {value}")
+        return "\n".join(out) + "\n"
+
+DEFAULT_ROOM = "paintsource/global"
+ROOM_FILES = ("state.json", "snapshot.bin", "canvas.bin")   # plus ops.*.log; see the persistence modes
+ROOM_RE = re.compile(r"[A-Za-z0-9_.\-/]{1,128}")
+
+def room_dir(data_dir: pathlib.Path, name: str) -> Optional[pathlib.Path]:
+    """Where a room keeps its files; None for an invalid name. The default room uses `data_dir` itself."""
+    if name == DEFAULT_ROOM: return data_dir
+    if not ROOM_RE.fullmatch(name) or name.startswith("."): return None
+    return data_dir / "rooms" / quote(name, safe="")
+
+class Room:
+    """One canvas with its own peers, version history and persistence.
+
+    make_app opens rooms on first use and evicts them (after saving) once they have had
+    no peers for a while, so memory follows the active rooms rather than all of them.
+    """
+    def __init__(self, name: str, path: pathlib.Path, framebuffer: Framebuffer, history: int,
+                 history_cells: int, canvas_file: Optional[CanvasFile] = None, oplog: Optional[OpLog] = None,
+                 replica: bool = False, version_step: int = 1, node: int = 0):
+        self.name = name
+        self.dir = path
+        self.framebuffer = framebuffer
+        self.canvas_file = canvas_file
+        self.oplog = oplog
+        self.replica = replica   # a copy kept in sync over the backplane; another worker persists it
+        self.clients = set()
+        self.dirty = False
+        # Canvas version: +version_step per applied op or clear. It starts from the wall clock so
+        # versions from before a restart are always older than (and never collide with) the new
+        # ones. With several workers the low bits are the worker's `node`, so a version handed
+        # out by one worker is never mistaken for another's.
+        v = time.time_ns() // 1000
+        self.version = v - v % version_step + node
+        self.changes = deque()   # (version, flat indices, chars); indices None = clear or too big to keep
+        self.history = max(0, int(history))               # at most this many changes...
+        self.history_cells = max(0, int(history_cells))   # ...holding at most this many cells in total
+        self.change_cells = 0
+        self.snap_cache = {"version": None}                 # encoded snapshots, valid for one version
+        self.pending = {}     # flat index -> char; last write per cell within the current tick
+        self.spectators = set()   # read-only peers fed from `view` (/ws/view, /stream)
+        # Shared spectator stream: keyframes per protocol, (version, encoded) and built on demand,
+        # then deltas since them, each encoded once for everyone. Reset every keyframe period.
+        self.view = {"version": None, "keys": {}, "deltas": [], "key_at": 0.0}
+        self.task: Optional[asyncio.Task] = None            # op log flush loop (wal mode)
+        self.last_used = time.monotonic()
+
+    def record(self, idx: Optional[Sequence[int]], chars: Optional[Sequence[Optional[str]]]):
+        """Remember the change that made the current version, for delta resync. A change bigger
+        than the whole cell budget is kept as a marker only, like a clear: clients from before
+        it get a snapshot. The oldest changes go first once either limit is passed."""
+        if idx is not None and len(idx) > self.history_cells: idx = chars = None
+        changes = self.changes
+        changes.append((self.version, idx, chars))
+        if idx: self.change_cells += len(idx)
+        while changes and (len(changes) > self.history or self.change_cells > self.history_cells):
+            _v, old, _c = changes.popleft()
+            if old: self.change_cells -= len(old)
+
+def make_app(cols: int, rows: int, scale: int, data_dir: str, autosave_sec: int,
+             send_queue: int = 1024, high_water: int = 256, slow_grace_sec: float = 2.0,
+             slow_policy: str = "drop", tick_ms: int = 0, tile: int = 64,
+             persist: str = "json", wal_flush_ms: int = 50, wal_compact_mb: float = 16,
+             history: int = 4096, history_cells: int = 250000, max_rooms: int = 256, room_idle_sec: float = 60,
+             backplane: Optional[str] = None, backplane_key: str = "", worker_id: int = 0,
+             rate_ops: float = 200, rate_cells: float = 50000, max_points: int = 10000,
+             max_shape_cells: int = 1000000,
+             max_frame_bytes: int = 256 * 1024, rate_policy: str = "drop", loop_lag_ms: int = 0,
+             view_tick_ms: int = 100, keyframe_sec: float = 10, metrics_host: str = "127.0.0.1",
+             metrics_port: int = 0):
     app = FastAPI()
     GRID_W = int(cols)
     GRID_H = int(rows)
     SCALE  = max(1, int(scale))
     AUTOSAVE_SEC = max(1, int(autosave_sec))
-
-    framebuffer: Dict[Tuple[int,int], Optional[str]] = {}
-    clients = set()
+    TILE = max(1, min(int(tile), 0xFFFF))
+    TILES_X = -(-GRID_W // TILE)
+    if slow_policy not in SLOW_POLICIES:
+        raise ValueError(f"slow_policy must be one of {SLOW_POLICIES}")
+    if persist not in PERSIST_MODES:
+        raise ValueError(f"persist must be one of {PERSIST_MODES}")
+    if rate_policy not in RATE_POLICIES:
+        raise ValueError(f"rate_policy must be one of {RATE_POLICIES}")
+    if persist == "wal" and max(GRID_W, GRID_H) > BIN_MAX_DIM:
+        raise ValueError(f"--persist wal supports at most {BIN_MAX_DIM} cells per side")
+    if backplane and max(GRID_W, GRID_H) > BIN_MAX_DIM:
+        raise ValueError(f"--backplane supports at most {BIN_MAX_DIM} cells per side")
 
     DATA_DIR = pathlib.Path(data_dir).expanduser().resolve()
     DATA_DIR.mkdir(parents=True, exist_ok=True)
-    STATE_PATH = DATA_DIR / "state.json"
-    dirty_flag = {"dirty": False}
+    MAX_ROOMS = max(1, int(max_rooms))
+    ROOM_IDLE_SEC = max(0.0, float(room_idle_sec))
+    rooms: "OrderedDict[str, Room]" = OrderedDict()   # resident rooms, least recently used first
+    closing = {}                                       # name -> task saving an evicted room
+    opening = set()                                    # names open_room() is still loading or syncing
+    # With a backplane every op goes through the broker and is applied when it comes back, in
+    # the same order on every worker. Worker 0 owns persistence; the others hold replicas.
+    bp = open_backplane(backplane, backplane_key) if backplane else None
+    app.state.backplane = bp
+    app.state.stop = lambda: signal.raise_signal(signal.SIGTERM)   # serve() stops its server instead
+    WORKER_ID = int(worker_id)
+    OWNER = bp is None or WORKER_ID == 0
+    VERSION_STEP = 256 if bp else 1
+    NODE = WORKER_ID % VERSION_STEP
+    SYNC_TIMEOUT, SYNC_RETRY = 30, 1.0
+    # replica room name -> {"ops": ops seen since our first request came back, or None,
+    #                       "marks": request id -> len(ops) when it came back, "done": future}
+    syncing = {}
+    wal_io = ThreadPoolExecutor(max_workers=1, thread_name_prefix="oplog") if persist == "wal" and OWNER else None
     autosave_task = {"task": None}
+    TICK_SEC = max(0, int(tick_ms)) / 1000
+    # Inbound limits per connection (0 = off). Every message costs one op; ops also cost the
+    # cells they may write. Frames and point lists above the caps are never applied.
+    MAX_POINTS = max(0, int(max_points))
+    MAX_SHAPE = max(0, int(max_shape_cells))   # bigger shapes are refused; a flood fill stops here
+    MAX_FRAME = max(0, int(max_frame_bytes))
+    tick_task = {"task": None}
+    lag_task = {"task": None, "last": 0.0}
+    VIEW_TICK_SEC = max(1, int(view_tick_ms)) / 1000
+    KEYFRAME_SEC = max(0.0, float(keyframe_sec))
+    view_task = {"task": None}
+    LAG_SEC = max(0, int(loop_lag_ms)) / 1000
+    METRICS_PORT = max(0, int(metrics_port))   # this worker's own /metrics listener, if any
+    metrics_server = {"server": None}
+
+    metrics = Metrics(labels={"worker": WORKER_ID} if bp else None)
+    for name, help in (("op_apply_seconds", "Time to validate and apply one client op"),
+                       ("broadcast_seconds", "Time to encode an update and queue it for every peer"),
+                       ("snapshot_encode_seconds", "Time to build a state or tiles snapshot (cache misses)"),
+                       ("save_seconds", "Time save_state() held the event loop"),
+                       ("load_seconds", "Time load_state() held the event loop"),
+                       ("clear_seconds", "Time to clear a room and broadcast it"),
+                       ("view_tick_seconds", "Time to encode and queue one spectator delta or keyframe")):
+        metrics.histogram(name, help)
+    if LAG_SEC:
+        metrics.histogram("loop_lag_seconds", "How late the event loop woke up for a timer")
+        metrics.gauge("loop_lag_last_seconds", "Most recent event loop lag sample", lambda: lag_task["last"])
+    for name, help in (("ops_total", "Client ops applied"),
+                       ("cells_total", "Cells written by client ops"),
+                       ("frames_queued_total", "Frames queued to peers"),
+                       ("snapshot_cache_hits_total", "Snapshots served from the per-version cache"),
+                       ("clears_total", "Room clears"),
+                       ("connections_total", "WebSocket connections accepted"),
+                       ("rate_limited_total", "Client messages over the rate or size limits"),
+                       ("slow_clients_total", "Times a peer overflowed its send queue (dropped or resynced)"),
+                       ("send_errors_total", "Peers whose socket failed while sending")):
+        metrics.counter(name, help)
+    metrics.gauge("clients", "Connected WebSocket clients", lambda: sum(len(r.clients) for r in rooms.values()))
+    metrics.gauge("spectators", "Connected read-only viewers (/ws/view and /stream)",
+                  lambda: sum(len(r.spectators) for r in rooms.values()))
+    metrics.gauge("send_queue_frames", "Frames waiting in peer send queues",
+                  lambda: sum(p.queue.qsize() for r in rooms.values() for p in r.clients))
+    metrics.gauge("rooms", "Resident rooms", lambda: len(rooms))
+    metrics.gauge("framebuffer_bytes", "Memory held by resident framebuffers",
+                  lambda: sum(len(r.framebuffer.cells) * r.framebuffer.cells.itemsize for r in rooms.values()))
+
+    def save_state(room: Room):
+        t = time.perf_counter()
+        try: write_state(room)
+        finally: metrics.observe("save_seconds", time.perf_counter() - t)
 
-    def save_state():
+    def write_state(room: Room):
+        if room.canvas_file:
+            room.canvas_file.flush(); return
+        path = room.dir / "state.json"
+        if room.framebuffer.empty():   # an empty canvas is stored as no file at all
+            path.unlink(missing_ok=True); return
         data = {"w": GRID_W, "h": GRID_H,
-                "pixels": [{"x":x,"y":y,"char":ch} for (x,y), ch in framebuffer.items() if ch],
+                "pixels": json_pixels(room.framebuffer),
                 "saved_at": int(time.time())}
-        tmp = STATE_PATH.with_suffix(".tmp")
+        room.dir.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_suffix(".tmp")
         tmp.write_text(json.dumps(data, ensure_ascii=False))
-        tmp.replace(STATE_PATH)
+        tmp.replace(path)
 
-    def load_state():
-        if not STATE_PATH.exists(): return
+    def load_state(room: Room):
+        t = time.perf_counter()
+        try: read_state(room)
+        finally: metrics.observe("load_seconds", time.perf_counter() - t)
+
+    def read_state(room: Room):
+        path = room.dir / "state.json"
+        if not path.exists(): return
         try:
-            data = json.loads(STATE_PATH.read_text())
+            data = json.loads(path.read_text())
         except Exception:
             return
-        for p in data.get("pixels", []):
+        apply_json_pixels(room.framebuffer, data.get("pixels", []))
+
+    async def open_room(name: str, path: pathlib.Path) -> Room:
+        """Load a room from disk (or start it empty) in the configured persistence mode and make it resident."""
+        ver = {"version_step": VERSION_STEP, "node": NODE}
+        if not OWNER:
+            room = rooms[name] = Room(name, path, Framebuffer(GRID_W, GRID_H), history, history_cells, replica=True, **ver)
+            await sync_room(room)
+        elif persist == "mmap":
+            path.mkdir(parents=True, exist_ok=True)
+            canvas_file = CanvasFile(path / "canvas.bin", GRID_W, GRID_H)
+            room = rooms[name] = Room(name, path, canvas_file.framebuffer, history, history_cells, canvas_file=canvas_file, **ver)
+            if canvas_file.created:
+                load_state(room); canvas_file.flush()   # first open in mmap mode: import state.json
+        elif persist == "wal":
+            room = rooms[name] = Room(name, path, Framebuffer(GRID_W, GRID_H), history, history_cells,
+                                      oplog=OpLog(path, wal_flush_ms, int(wal_compact_mb * 2**20), wal_io), **ver)
+            if not room.oplog.recover(room.framebuffer):
+                load_state(room)   # first open in wal mode: import state.json, then snapshot it
+                if not room.framebuffer.empty(): await room.oplog.compact(room.framebuffer)
+            room.task = asyncio.create_task(room.oplog.run(room.framebuffer))
+        else:
+            room = rooms[name] = Room(name, path, Framebuffer(GRID_W, GRID_H), history, history_cells, **ver)
+            load_state(room)
+        return room
+
+    async def sync_room(room: Room):
+        """Fill a replica with the owner's copy; ops ordered after the answered request are replayed
+        on top. The request is repeated every SYNC_RETRY seconds until the owner answers one."""
+        s = syncing[room.name] = {"ops": None, "marks": {}, "done": asyncio.get_running_loop().create_future()}
+        for attempt in range(max(1, int(SYNC_TIMEOUT / SYNC_RETRY))):
+            bp.publish(encode_bp(BP_SYNC_REQ, WORKER_ID, room.name, BP_SYNC_ID.pack(attempt)))
             try:
-                x, y = int(p["x"]), int(p["y"]); ch = p.get("char")
-            except Exception:
-                continue
-            if 0 <= x < GRID_W and 0 <= y < GRID_H and ch:
-                framebuffer[(x,y)] = ch
+                await asyncio.wait_for(asyncio.shield(s["done"]), SYNC_RETRY); return
+            except asyncio.TimeoutError: pass
+        if syncing.get(room.name) is s: del syncing[room.name]
+        if rooms.get(room.name) is room: del rooms[room.name]
+        s["done"].set_exception(RuntimeError(f"room {room.name!r}: no snapshot from the owner worker"))
+        raise s["done"].exception()
+
+    def finish_sync(name: str, state: bytes, ops: list):
+        s = syncing.pop(name)
+        room = rooms.get(name)
+        if room is not None:
+            fb = room.framebuffer
+            fb.clear()
+            for x, y, cp in iter_bin_cells(state, 18):
+                if x < fb.w and y < fb.h: fb.cells[y*fb.w + x] = cp
+            room.version += VERSION_STEP
+            for kind, body in ops: apply_remote(room, kind, body)
+        s["done"].set_result(None)
+
+    def stored(path: pathlib.Path) -> bool:
+        """Whether a room has anything on disk; one without files is empty in every mode."""
+        return any((path / f).exists() for f in ROOM_FILES) or any(path.glob("ops.*.log"))
+
+    def remove_files(path: pathlib.Path):
+        for f in chain((path / f for f in ROOM_FILES), path.glob("ops.*.log")): f.unlink(missing_ok=True)
+        if path != DATA_DIR:
+            try: path.rmdir()
+            except OSError: pass
+
+    async def close_room(room: Room):
+        if room.task: room.task.cancel()
+        if room.replica: return
+        try:
+            if (room.oplog or room.canvas_file) and room.framebuffer.empty():
+                # Nothing on the canvas: remove its files rather than keep a snapshot of nothing
+                # (state.json too, or the next open would import it again).
+                if room.canvas_file: await asyncio.to_thread(room.canvas_file.close)
+                if room.oplog: room.oplog.buf.clear()
+                io = room.oplog.io if room.oplog else None   # after the log's pending writes
+                await asyncio.get_running_loop().run_in_executor(io, remove_files, room.dir)
+            elif room.oplog: await room.oplog.close(room.framebuffer)
+            elif room.canvas_file: await asyncio.to_thread(room.canvas_file.close)
+            elif room.dirty: save_state(room)
+        except Exception: pass
+
+    def evict(room: Room):
+        rooms.pop(room.name, None)
+        task = closing[room.name] = asyncio.create_task(close_room(room))
+        task.add_done_callback(lambda _t: closing.pop(room.name, None) if closing.get(room.name) is task else None)
+
+    def in_use(room: Room) -> bool:
+        """Whether a room must stay resident: someone is in it, or it is still being opened
+        (evicting a replica before its snapshot arrives would hand out a blank, detached room)."""
+        return bool(room.clients or room.spectators or room.name in opening)
+
+    async def get_room(name: Optional[str]) -> Optional[Room]:
+        """The resident room, opening it on first use; None for an invalid name."""
+        name = name or DEFAULT_ROOM
+        room = rooms.get(name)
+        if room is not None and name in syncing:   # a replica still waiting for its snapshot
+            await asyncio.shield(syncing[name]["done"])
+        if room is None:
+            path = room_dir(DATA_DIR, name)
+            if path is None: return None
+            if name in closing:   # let an eviction finish writing before reading the files back
+                await asyncio.shield(closing[name])
+            room = rooms.get(name)
+            if room is None:
+                opening.add(name)
+                try: room = await open_room(name, path)
+                finally: opening.discard(name)
+                for old in [r for r in rooms.values() if not in_use(r) and r is not room][:max(0, len(rooms) - MAX_ROOMS)]:
+                    evict(old)   # over the cap: drop the least recently used rooms nobody is in
+        if rooms.get(name) is room: rooms.move_to_end(name)
+        room.last_used = time.monotonic()
+        return room
 
     async def autosave_loop():
         while True:
             await asyncio.sleep(AUTOSAVE_SEC)
-            if dirty_flag["dirty"]:
-                try: save_state()
+            now = time.monotonic()
+            for room in list(rooms.values()):
+                if not in_use(room) and now - room.last_used >= ROOM_IDLE_SEC:
+                    evict(room); continue
+                if room.replica or room.oplog or not room.dirty: continue
+                room.dirty = False
+                try:
+                    if room.canvas_file: await asyncio.to_thread(room.canvas_file.flush)   # msync can block on I/O
+                    else: save_state(room)
                 except Exception: pass
-                dirty_flag["dirty"] = False
 
     HTML_TEMPLATE = """<!DOCTYPE html>
 <html>
@@ -58,7 +1219,7 @@ def make_app(cols: int, rows: int, scale: int, data_dir: str, autosave_sec: int)
   <meta charset='utf-8'>
   <title>PaintSource — __GRID_W__×__GRID_H__</title>
   <style>
-    html,body{margin:0;height:100%;background:#111;color:#eee;font-family:ui-monospace, SFMono-Regular, Menlo, Consolas, monospace}
+    html,body{margin:0;height:100%;background:#111;color:#eee;font-family:ui-monospace, SFMono-Regular, Menlo, Consolas, monospace;overflow:hidden}
     #wrap{padding:16px}
     #c{border:1px solid #444;background:#000;image-rendering:pixelated;cursor:crosshair;display:block}
     .status{opacity:.8;margin:8px 16px}
@@ -68,52 +1229,193 @@ def make_app(cols: int, rows: int, scale: int, data_dir: str, autosave_sec: int)
 <div id="wrap">
   <h3 style="padding:16px 16px 0 16px;margin:0">PaintSource — __GRID_W__×__GRID_H__</h3>
   <canvas id="c" width="__CANVAS_W__" height="__CANVAS_H__"></canvas>
-  <div class="status" id="status">WS: connecting… • Mode: idle</div>
+  <div class="status"><select id="tool">
+    <option value="free">free draw</option><option value="line">line</option><option value="rect">rect</option>
+    <option value="rectfill">filled rect</option><option value="flood_fill">flood fill</option><option value="text">text</option>
+  </select> <span id="status">WS: connecting… • Mode: idle</span></div>
 </div>
 <script>
-const W = __GRID_W__, H = __GRID_H__, SCALE = __SCALE__;
+const W = __GRID_W__, H = __GRID_H__, TILE = __TILE__;
+const TILES_X = Math.ceil(W / TILE);
+const ROOM = new URLSearchParams(location.search).get('room') || 'paintsource/global';
+const SPECTATE = new URLSearchParams(location.search).has('spectate');   // read-only, from /ws/view
+document.title += ' — ' + ROOM + (SPECTATE ? ' (spectating)' : '');
+const MIN_SCALE = 2, MAX_SCALE = 40;
+let SCALE = __SCALE__;         // px per cell; changed by zoom
+let camX = 0, camY = 0;        // top-left visible cell; changed by pan
+let viewW = 0, viewH = 0;      // visible cells
 const c = document.getElementById('c');
 const ctx = c.getContext('2d', { alpha: false });
-ctx.imageSmoothingEnabled = false;
-ctx.textBaseline = 'top';
-ctx.font = (SCALE) + 'px ui-monospace, SFMono-Regular, Menlo, Consolas, monospace';
 
-const filled = new Set();
-function key(x,y){ return x+','+y; }
+// Known cells, one Map (flat index -> char) per subscribed tile, so leaving a tile frees it at once.
+const tiles = new Map();
+function tileOf(x,y){ return Math.floor(y/TILE)*TILES_X + Math.floor(x/TILE); }
+function getLocal(x,y){ const t = tiles.get(tileOf(x,y)); return t ? t.get(y*W+x) : undefined; }
 function setLocal(x,y,ch){
-  const k = key(x,y);
-  if(!ch){ filled.delete(k); } else { filled.add(k); }
+  const t = tiles.get(tileOf(x,y));
+  if(!t) return;
+  if(!ch){ t.delete(y*W+x); } else { t.set(y*W+x, ch); }
 }
 
-function drawCell(x,y,ch){
-  ctx.fillStyle = '#000';
-  ctx.fillRect(x*SCALE, y*SCALE, SCALE, SCALE);
-  if(!ch) return;
+// Glyph atlas: each char is drawn once per zoom level into an offscreen canvas, and cells are
+// copied from it with drawImage instead of a fillRect + fillText each.
+const atlas = document.createElement('canvas'), actx = atlas.getContext('2d');
+const ATLAS_COLS = 64, ATLAS_MAX = 4096;
+let glyphs = new Map(), atlasScale = 0;
+function glyph(ch){
+  if(atlasScale !== SCALE || glyphs.size >= ATLAS_MAX){
+    glyphs = new Map(); atlasScale = SCALE;
+    atlas.width = ATLAS_COLS*SCALE; atlas.height = SCALE;
+  }
+  let g = glyphs.get(ch);
+  if(g !== undefined) return g;
+  g = glyphs.size;
+  const gx = (g % ATLAS_COLS)*SCALE, gy = Math.floor(g / ATLAS_COLS)*SCALE;
+  if(gy + SCALE > atlas.height){   // resizing wipes a canvas, so keep a copy to put back
+    const old = document.createElement('canvas');
+    old.width = atlas.width; old.height = atlas.height;
+    old.getContext('2d').drawImage(atlas, 0, 0);
+    atlas.height = Math.max(gy + SCALE, 2*atlas.height);
+    actx.drawImage(old, 0, 0);
+  }
+  actx.fillStyle = '#000'; actx.fillRect(gx, gy, SCALE, SCALE);
+  actx.fillStyle = '#fff';
   if(ch === '█'){
-    ctx.fillStyle = '#fff';
-    ctx.fillRect(x*SCALE, y*SCALE, SCALE, SCALE);
-  } else {
-    ctx.fillStyle = '#fff';
-    ctx.fillText(ch, x*SCALE, y*SCALE);
+    actx.fillRect(gx, gy, SCALE, SCALE);
+  } else if(ch){
+    actx.save(); actx.beginPath(); actx.rect(gx, gy, SCALE, SCALE); actx.clip();
+    actx.font = ctx.font; actx.textBaseline = 'top'; actx.fillText(ch, gx, gy);
+    actx.restore();
   }
-  setLocal(x,y,ch);
+  glyphs.set(ch, g);
+  return g;
+}
+function paintCell(x,y,ch){
+  const px = (x-camX)*SCALE, py = (y-camY)*SCALE;
+  if(px < 0 || py < 0 || px >= c.width || py >= c.height) return;
+  const g = glyph(ch || null);
+  ctx.drawImage(atlas, (g % ATLAS_COLS)*SCALE, Math.floor(g / ATLAS_COLS)*SCALE, SCALE, SCALE, px, py, SCALE, SCALE);
+}
+function redraw(){
+  ctx.fillStyle='#000'; ctx.fillRect(0,0,c.width,c.height);
+  for(const t of tiles.values()) for(const [i,ch] of t) paintCell(i%W, Math.floor(i/W), ch);
+}
+
+// Updates only touch the model and mark cells dirty; the canvas is painted once per animation
+// frame, however many ops arrived in between. Pending stroke cells are sent in the same frame.
+const dirty = new Set();
+let fullRedraw = false, frameQueued = false;
+function queueFrame(){
+  if(!frameQueued){ frameQueued = true; requestAnimationFrame(frame); }
+}
+function drawCell(x,y,ch){ setLocal(x,y,ch); if(!fullRedraw) dirty.add(y*W+x); queueFrame(); }
+function requestRedraw(){ fullRedraw = true; dirty.clear(); queueFrame(); }
+function frame(){
+  frameQueued = false;
+  if(fullRedraw){ fullRedraw = false; redraw(); }
+  for(const i of dirty){ const x = i % W, y = (i - x) / W; paintCell(x, y, getLocal(x, y)); }
+  dirty.clear();
+  flushStroke();
 }
 
-const ws = new WebSocket((location.protocol==='https:'?'wss':'ws')+'://'+location.host+'/ws');
+// Binary frames (see encode_bin_cells): kinds 1=op, 2=state, 3=clear, 4=tiles; 0x10 is a client op.
+const BIN_OP=1, BIN_STATE=2, BIN_CLEAR=3, BIN_TILES=4, BIN_IN_OP=0x10, BIN_ONECHAR=1, BIN_WIDE=2;
+let binary = false;  // set once the server answers in binary
+function decodeBin(buf){
+  const dv = new DataView(buf);
+  const kind = dv.getUint8(0);
+  if(kind===BIN_CLEAR) return {type:'system', event:'clear', version: Number(dv.getBigUint64(1, true))};
+  const flags = dv.getUint8(1);
+  let off = kind===BIN_OP ? 2 : 10;
+  const version = Number(dv.getBigUint64(off, true)); off += 8;
+  const tileList = [];
+  if(kind===BIN_TILES){
+    const n = dv.getUint32(off+2, true); off += 6;
+    for(let i=0;i<n;i++){ tileList.push([dv.getUint16(off, true), dv.getUint16(off+2, true)]); off += 4; }
+  }
+  const ntable = dv.getUint16(off, true); off += 2;
+  const table = [];
+  for(let i=0;i<ntable;i++){ const cp = dv.getUint32(off, true); off += 4; table.push(cp ? String.fromCodePoint(cp) : null); }
+  const nruns = dv.getUint32(off, true); off += 4;
+  const pts = [], chars = [];
+  for(let r=0;r<nruns;r++){
+    const y = dv.getUint16(off, true), x = dv.getUint16(off+2, true), n = dv.getUint16(off+4, true);
+    off += 6;
+    for(let i=0;i<n;i++){
+      let t = 0;
+      if(flags & BIN_WIDE){ t = dv.getUint16(off, true); off += 2; }
+      else if(!(flags & BIN_ONECHAR)){ t = dv.getUint8(off); off += 1; }
+      pts.push([x+i, y]); chars.push(table[t]);
+    }
+  }
+  if(kind===BIN_OP) return {type:'op', version, op:{tool:'frame', points:pts, chars:chars}};
+  const pixels = pts.map((p,i)=>({x:p[0], y:p[1], char:chars[i]}));
+  return kind===BIN_TILES ? {type:'tiles', version, tiles:tileList, pixels} : {type:'state', version, pixels};
+}
+
+// Subscribed cell range: the viewport plus one tile of margin so short pans don't wait on the server.
+function subRange(){
+  return [Math.max(0, camX-TILE), Math.max(0, camY-TILE), Math.min(W, camX+viewW+TILE), Math.min(H, camY+viewH+TILE)];
+}
+function layout(){
+  const cw = Math.max(SCALE, Math.min(W*SCALE, window.innerWidth - 34));
+  const ch = Math.max(SCALE, Math.min(H*SCALE, window.innerHeight - 110));
+  if(c.width !== cw) c.width = cw;      // assigning resets the canvas, so only when it changes
+  if(c.height !== ch) c.height = ch;
+  viewW = Math.ceil(c.width / SCALE); viewH = Math.ceil(c.height / SCALE);
+  camX = Math.max(0, Math.min(W - viewW, camX)); camY = Math.max(0, Math.min(H - viewH, camY));
+  ctx.imageSmoothingEnabled = false;
+  ctx.textBaseline = 'top';
+  ctx.font = (SCALE) + 'px ui-monospace, SFMono-Regular, Menlo, Consolas, monospace';
+}
+layout();
+
 const statusEl = document.getElementById('status');
-function setStatus(conn, mode){ statusEl.textContent = 'WS: ' + conn + ' • Mode: ' + mode; }
-ws.onopen = ()=> setStatus('connected', 'idle');
-ws.onclose = ()=> setStatus('disconnected', 'idle');
-ws.onerror = ()=> setStatus('error', 'idle');
-ws.onmessage = ev => {
-  const m = JSON.parse(ev.data);
+let conn = 'connecting…', modeText = 'idle';
+function setStatus(cn, mode){
+  conn = cn; modeText = mode;
+  statusEl.textContent = 'WS: ' + conn + ' • Mode: ' + mode + ' • View: ' + camX + ',' + camY + ' @' + SCALE + 'px (right-drag/arrows pan, wheel zoom)';
+}
+
+// Reconnect with the last version seen and the range whose tiles we still hold, so the
+// server can answer with just the changes since then instead of a full snapshot.
+let ws = null, lastVersion = null, heldRange = null, retryMs = 500;
+function connect(){
+  binary = false;
+  heldRange = heldRange || subRange();
+  let url = (location.protocol==='https:'?'wss':'ws')+'://'+location.host;
+  url += SPECTATE ? '/ws/view?proto=bin' : '/ws?proto=bin&view='+heldRange.join(',');
+  url += '&room=' + encodeURIComponent(ROOM);
+  if(lastVersion !== null && !SPECTATE) url += '&since=' + lastVersion;
+  ws = new WebSocket(url);
+  ws.binaryType = 'arraybuffer';
+  ws.onopen = ()=>{ retryMs = 500; setStatus('connected', 'idle'); subscribe(); };
+  ws.onclose = ()=>{
+    setStatus('disconnected, retrying', 'idle');
+    setTimeout(connect, retryMs); retryMs = Math.min(10000, retryMs*2);
+  };
+  ws.onerror = ()=> setStatus('error', 'idle');
+  ws.onmessage = onMessage;
+}
+function onMessage(ev){
+  let m;
+  if(ev.data instanceof ArrayBuffer){ binary = true; m = decodeBin(ev.data); }
+  else m = JSON.parse(ev.data);
+  if(m.version !== undefined) lastVersion = m.version;
   if(m.type==='state'){
-    ctx.fillStyle='#000'; ctx.fillRect(0,0,W*SCALE,H*SCALE);
-    filled.clear();
-    for(const p of m.pixels||[]) drawCell(p.x, p.y, p.char);
+    tiles.clear();
+    for(let t=0;t<TILES_X*Math.ceil(H/TILE);t++) tiles.set(t, new Map());
+    for(const p of m.pixels||[]) setLocal(p.x, p.y, p.char);
+    requestRedraw();
+  } else if(m.type==='tiles'){
+    for(const [tx,ty] of m.tiles||[]) tiles.set(ty*TILES_X+tx, new Map());
+    for(const p of m.pixels||[]) setLocal(p.x, p.y, p.char);
+    requestRedraw();
   } else if(m.type==='system' && m.event==='clear'){
-    ctx.fillStyle='#000'; ctx.fillRect(0,0,W*SCALE,H*SCALE);
-    filled.clear();
+    for(const t of tiles.values()) t.clear();
+    requestRedraw();
+  } else if(m.type==='op' && m.op && SHAPES.has(m.op.tool)){
+    for(const [x,y,ch] of rasterize(m.op)) drawCell(x,y,ch);
   } else if(m.type==='op' && m.op){
     const pts = m.op.points||[];
     const chars = m.op.chars||[];
@@ -123,14 +1425,45 @@ ws.onmessage = ev => {
       drawCell(x,y,ch);
     }
   }
-};
+}
+
+let subTimer = null;
+function subscribe(){
+  if(!ws || ws.readyState!==1 || SPECTATE) return;   // spectators get the whole canvas
+  const [x0,y0,x1,y1] = heldRange = subRange();
+  for(const t of [...tiles.keys()]){
+    const tx = t % TILES_X, ty = Math.floor(t / TILES_X);
+    if(tx*TILE >= x1 || (tx+1)*TILE <= x0 || ty*TILE >= y1 || (ty+1)*TILE <= y0) tiles.delete(t);
+  }
+  ws.send(JSON.stringify({type:'subscribe', x0, y0, x1, y1}));
+}
+connect();
+function moveView(nx, ny, nscale){
+  if(nscale !== undefined) SCALE = Math.max(MIN_SCALE, Math.min(MAX_SCALE, nscale));
+  camX = Math.round(nx); camY = Math.round(ny);
+  layout(); requestRedraw(); setStatus(conn, modeText);
+  clearTimeout(subTimer); subTimer = setTimeout(subscribe, 100);
+}
+window.addEventListener('resize', ()=> moveView(camX, camY));
 
 let drawing=false;
+let panning=null;
+let shapeStart=null;   // {x, y, char} while dragging out a line or rect
+const toolEl = document.getElementById('tool');
+if(SPECTATE) toolEl.style.display = 'none';
 let strokeChar = null;
+let strokePts = [];    // free-draw cells not sent yet; flushStroke() sends them once per frame
 let currentBrush = null;
 let lastX=null, lastY=null;
 
+const PAN_KEYS = {ArrowLeft:[-1,0], ArrowRight:[1,0], ArrowUp:[0,-1], ArrowDown:[0,1]};
 window.addEventListener('keydown', (e)=>{
+  if(PAN_KEYS[e.key]){
+    const [dx,dy] = PAN_KEYS[e.key];
+    e.preventDefault();
+    moveView(camX + dx*Math.max(1, viewW>>2), camY + dy*Math.max(1, viewH>>2));
+    return;
+  }
   if(e.key && e.key.length === 1){
     currentBrush = e.key;
     if(!drawing) setStatus('connected', 'char ' + JSON.stringify(currentBrush));
@@ -148,8 +1481,8 @@ function canvasToCell(e){
   const r=c.getBoundingClientRect();
   const lx = Math.floor((e.clientX - r.left)  * (c.width  / r.width));
   const ly = Math.floor((e.clientY - r.top)   * (c.height / r.height));
-  const x = clamp(Math.floor(lx / SCALE), 0, W-1);
-  const y = clamp(Math.floor(ly / SCALE), 0, H-1);
+  const x = clamp(camX + Math.floor(lx / SCALE), 0, W-1);
+  const y = clamp(camY + Math.floor(ly / SCALE), 0, H-1);
   return [x,y];
 }
 
@@ -167,47 +1500,118 @@ function bresenham(x0,y0,x1,y1){
   return pts;
 }
 
+// Same cells as rasterize() in app.py, so line/rect/text travel as a few numbers.
+const SHAPES = new Set(['line', 'rect', 'text', 'flood_fill']);
+function rasterize(op){
+  const out = [];
+  if(op.tool==='flood_fill'){   // filled on the server: the op carries its row runs
+    for(const [x, y, n] of op.runs||[]) for(let i=0;i<n;i++) out.push([x+i, y, op.char]);
+    return out;
+  }
+  if(op.tool==='text'){
+    op.text.split('\n').forEach((line, dy)=>{
+      const y = op.y + dy;
+      if(y < H) [...line].slice(0, W - op.x).forEach((ch, dx)=> out.push([op.x+dx, y, ch===' ' ? null : ch]));
+    });
+    return out;
+  }
+  if(op.tool==='line') return bresenham(op.x0, op.y0, op.x1, op.y1).map(([x,y])=>[x, y, op.char]);
+  const x0 = Math.min(op.x0, op.x1), x1 = Math.max(op.x0, op.x1), y0 = Math.min(op.y0, op.y1), y1 = Math.max(op.y0, op.y1);
+  for(let y=y0;y<=y1;y++) for(let x=x0;x<=x1;x++){
+    if(op.fill || y===y0 || y===y1 || x===x0 || x===x1) out.push([x, y, op.char]);
+  }
+  return out;
+}
+
+function sendOp(op){
+  if(!ws || ws.readyState!==1) return;
+  ws.send(JSON.stringify({v:1, type:'op', room:ROOM, user:{nick:'web'}, ts:Date.now(), op}));
+}
 function sendSet(points, ch){
-  if(ws.readyState!==1 || points.length===0) return;
-  ws.send(JSON.stringify({
-    v:1, type:'op', room:'paintsource/global',
-    user:{nick:'web'}, ts:Date.now(),
-    op:{tool:'set', mode:'set', points:points, char: ch ?? null}
-  }));
+  if(!ws || ws.readyState!==1 || points.length===0) return;
+  if(binary){
+    const dv = new DataView(new ArrayBuffer(6 + 4*points.length));
+    dv.setUint8(0, BIN_IN_OP); dv.setUint8(1, 1); dv.setUint32(2, ch ? ch.codePointAt(0) : 0, true);
+    points.forEach(([x,y], i)=>{ dv.setUint16(6+4*i, x, true); dv.setUint16(8+4*i, y, true); });
+    ws.send(dv.buffer);
+    return;
+  }
+  sendOp({tool:'set', mode:'set', points:points, char: ch ?? null});
+}
+function flushStroke(){
+  if(strokePts.length){ sendSet(strokePts, strokeChar); strokePts = []; }
 }
 
 c.addEventListener('contextmenu', e=>e.preventDefault());
+c.addEventListener('wheel', e=>{
+  e.preventDefault();
+  const r = c.getBoundingClientRect();
+  const fx = (e.clientX - r.left) / r.width, fy = (e.clientY - r.top) / r.height;
+  const next = clamp(SCALE + (e.deltaY < 0 ? 1 : -1) * Math.max(1, SCALE >> 2), MIN_SCALE, MAX_SCALE);
+  if(next === SCALE) return;
+  // keep the cell under the cursor in place
+  const cx = camX + fx*viewW, cy = camY + fy*viewH;
+  const nw = c.width / next, nh = c.height / next;
+  moveView(cx - fx*nw, cy - fy*nh, next);
+}, { passive: false });
 c.addEventListener('mousedown', e=>{
-  drawing=true;
+  if(e.button !== 0){
+    panning = {x: e.clientX, y: e.clientY, camX, camY};
+    return;
+  }
+  if(!ws || ws.readyState!==1 || SPECTATE) return;   // don't paint what the server will never see
   const [x,y]=canvasToCell(e);
+  const tool = toolEl.value, brush = currentBrush && currentBrush.length===1 ? currentBrush : '█';
+  if(tool==='flood_fill'){ sendOp({tool, x, y, char: brush}); return; }
+  if(tool==='text'){
+    const text = prompt('Text to write at ' + x + ',' + y);
+    if(text) sendOp({tool, x, y, text});
+    return;
+  }
+  if(tool!=='free'){ shapeStart = {x, y, char: brush}; return; }   // sent on mouseup
+  drawing=true;
   let targetChar = null;
   if(currentBrush && currentBrush.length===1){
     targetChar = currentBrush;
     setStatus('connected', 'char ' + JSON.stringify(targetChar));
   }else{
-    const wasFilled = filled.has(key(x,y));
+    const wasFilled = !!getLocal(x,y);
     targetChar = wasFilled ? null : '█';
     setStatus('connected', targetChar ? 'WHITE' : 'ERASE');
   }
   strokeChar = targetChar;
   lastX=x; lastY=y;
   drawCell(x,y,targetChar);
-  sendSet([[x,y]], targetChar);
+  strokePts.push([x,y]);
 });
 c.addEventListener('mousemove', e=>{
+  if(panning){
+    const r = c.getBoundingClientRect(), k = c.width / r.width / SCALE;
+    moveView(panning.camX - (e.clientX - panning.x)*k, panning.camY - (e.clientY - panning.y)*k);
+    return;
+  }
   if(!drawing) return;
   const [x,y]=canvasToCell(e);
   if(x===lastX && y===lastY) return;
-  const pts = bresenham(lastX,lastY,x,y);
-  lastX=x; lastY=y;
+  const pts = bresenham(lastX,lastY,x,y).slice(1);
   for(const [px,py] of pts){ drawCell(px,py,strokeChar); }
-  sendSet(pts, strokeChar);
+  strokePts.push(...pts);
+  lastX=x; lastY=y;
 });
 function stopStroke(){
+  flushStroke();
+  panning=null; shapeStart=null;
   drawing=false; strokeChar=null; lastX=lastY=null;
   setStatus('connected', currentBrush ? 'char ' + JSON.stringify(currentBrush) : 'idle');
 }
-c.addEventListener('mouseup',   stopStroke);
+c.addEventListener('mouseup', e=>{
+  if(shapeStart && e.button===0){
+    const [x,y] = canvasToCell(e), s = shapeStart, tool = toolEl.value;
+    if(tool==='line') sendOp({tool, x0:s.x, y0:s.y, x1:x, y1:y, char:s.char});
+    else sendOp({tool:'rect', x0:s.x, y0:s.y, x1:x, y1:y, fill: tool==='rectfill', char:s.char});
+  }
+  stopStroke();
+});
 c.addEventListener('mouseleave',stopStroke);
 </script>
 </body>
@@ -216,111 +1620,628 @@ c.addEventListener('mouseleave',stopStroke);
     HTML = (HTML_TEMPLATE
             .replace("__GRID_W__", str(cols))
             .replace("__GRID_H__", str(rows))
-            .replace("__SCALE__", str(scale))
-            .replace("__CANVAS_W__", str(cols * scale))
-            .replace("__CANVAS_H__", str(rows * scale))
+            .replace("__SCALE__", str(SCALE))
+            .replace("__TILE__", str(TILE))
+            .replace("__CANVAS_W__", str(min(cols * SCALE, 1600)))
+            .replace("__CANVAS_H__", str(min(rows * SCALE, 1000)))
            )
 
-    def set_cell(x:int, y:int, ch: Optional[str]):
-        framebuffer[(x,y)] = ch
-        dirty_flag["dirty"] = True
+    def apply_op(room: Room, op: dict):
+        """Validate an op's points, write them to the room's framebuffer, return (points, chars)."""
+        tool = op.get("tool")
+        char = op.get("char", None)
+        safe_pts = []
+        for x,y in op.get("points", []):
+            try:
+                x = int(x); y = int(y)
+            except Exception:
+                continue
+            if 0 <= x < GRID_W and 0 <= y < GRID_H:
+                safe_pts.append([x,y])
+        if not safe_pts:
+            return safe_pts, []
+        fb = room.framebuffer
+        room.dirty = True
+        if (tool == "set" and op.get("mode") == "set") or (tool in ("put","toggle") and char is not None):
+            fixed = char[0] if isinstance(char, str) and char else None
+            fb.apply(safe_pts, fixed)
+            chars = [fixed] * len(safe_pts)
+        else:
+            chars = [fb.toggle(x,y) for x,y in safe_pts]
+        room.version += VERSION_STEP
+        room.record([y*GRID_W + x for x,y in safe_pts], chars)
+        if room.oplog: room.oplog.append(encode_bin_op(safe_pts, chars, GRID_W, room.version))
+        return safe_pts, chars
+
+    def apply_shape(room: Room, shape: dict) -> int:
+        """Draw a normalized shape into the room's framebuffer; returns the number of cells written.
+
+        Filled rects and flood fills stay row runs of one char: they are logged as runs, and their
+        cells are only listed in the history if they fit. A flood fill's runs are added to `shape`.
+        """
+        fb, tool = room.framebuffer, shape["tool"]
+        runs = None
+        if tool == "flood_fill":
+            cp = ord(shape["char"]) if shape["char"] else 0
+            runs = fb.flood(shape["x"], shape["y"], cp, MAX_SHAPE)
+            if not runs: return 0   # nothing to fill, or over MAX_SHAPE
+            shape["runs"] = [[x, y, n] for y, x, n in runs]
+        elif tool == "rect" and shape["fill"]:
+            cp = ord(shape["char"]) if shape["char"] else 0
+            (x0, x1), (y0, y1) = sorted((shape["x0"], shape["x1"])), sorted((shape["y0"], shape["y1"]))
+            fb.fill_rect(x0, y0, x1, y1, cp)
+            runs = [(y, x0, x1 - x0 + 1) for y in range(y0, y1 + 1)]
+        else:
+            idx, cp = rasterize(shape, GRID_W, GRID_H)
+            if not idx: return 0
+            fb.write(idx, cp)
+        room.dirty = True
+        room.version += VERSION_STEP
+        head = struct.pack("<Q", room.version)
+        if runs is not None:
+            n = sum(k for _y, _x, k in runs)
+            if n <= room.history_cells:
+                room.record(list(chain.from_iterable(range(y*GRID_W + x, y*GRID_W + x + k) for y, x, k in runs)),
+                            [chr(cp) if cp else None] * n)
+            else:
+                room.record(None, None)   # more than the history holds: catching up takes a snapshot
+            if room.oplog: room.oplog.append(encode_bin_runs(BIN_OP, runs, cp, head))
+            return n
+        chars = [chr(cp) if cp else None] * len(idx) if isinstance(cp, int) else [chr(c) if c else None for c in cp]
+        room.record(idx, chars)
+        if room.oplog:
+            room.oplog.append(encode_bin_cells(BIN_OP, zip(idx, repeat(cp) if isinstance(cp, int) else cp), GRID_W, head))
+        return len(idx)
+
+    def changes_since(room: Room, since: int):
+        """Merged (points, chars) of all changes after `since`, or None if only a snapshot will do."""
+        v, changes = room.version, room.changes
+        if (v - since) % VERSION_STEP: return None   # handed out by another worker
+        if since == v: return [], []
+        if since > v or not changes or changes[0][0] > since + VERSION_STEP: return None
+        last = {}
+        for ver, idx, chars in reversed(changes):
+            if ver <= since: break
+            if idx is None: return None     # a clear in between: resend everything
+            for i, ch in zip(reversed(idx), reversed(chars)):
+                last.setdefault(i, ch)
+        items = sorted(last.items())
+        return [[i % GRID_W, i // GRID_W] for i, _ in items], [ch for _, ch in items]
+
+    def cached(room: Room, key, build):
+        """Encoded snapshot for the room's current version, built at most once per version and key."""
+        cache = room.snap_cache
+        if cache["version"] != room.version or len(cache) > 256:
+            cache.clear(); cache["version"] = room.version
+        data = cache.get(key)
+        if data is None:
+            t = time.perf_counter()
+            data = cache[key] = build()
+            metrics.observe("snapshot_encode_seconds", time.perf_counter() - t)
+        else:
+            metrics.inc("snapshot_cache_hits_total")
+        return data
+
+    def serialize_state(room: Room):
+        return {"type":"state", "w": GRID_W, "h": GRID_H, "version": room.version,
+                "pixels": json_pixels(room.framebuffer)}
+
+    def encode_state(room: Room, proto: str) -> Union[str, bytes]:
+        if proto == "bin":
+            fb = room.framebuffer
+            return cached(room, "state-bin", lambda: encode_bin_cells(
+                BIN_STATE, ((i, fb.cells[i]) for i in fb.nonzero()), GRID_W,
+                struct.pack("<IIQ", GRID_W, GRID_H, room.version)))
+        return cached(room, "state-json", lambda: json.dumps(serialize_state(room)))
+
+    def encode(msg: dict, proto: str) -> Union[str, bytes]:
+        if proto != "bin":
+            return json.dumps(msg)
+        if msg["type"] == "op":
+            return encode_bin_op(msg["op"]["points"], msg["op"]["chars"], GRID_W, msg["version"])
+        return struct.pack("<BQ", BIN_CLEAR, msg["version"])
+
+    def view_tiles(x0, y0, x1, y1) -> set:
+        """Tile ids covering the cell rectangle [x0,x1) x [y0,y1), clamped to the canvas."""
+        x0, y0 = max(0, int(x0)), max(0, int(y0))
+        x1, y1 = min(GRID_W, int(x1)), min(GRID_H, int(y1))
+        if x0 >= x1 or y0 >= y1: return set()
+        return {ty*TILES_X + tx for ty in range(y0 // TILE, (y1-1) // TILE + 1)
+                                for tx in range(x0 // TILE, (x1-1) // TILE + 1)}
+
+    def parse_view(spec: str) -> Optional[set]:
+        try: x0, y0, x1, y1 = (int(v) for v in spec.split(","))
+        except ValueError: return None
+        return view_tiles(x0, y0, x1, y1)
+
+    def encode_tiles(room: Room, tiles, proto: str) -> Union[str, bytes]:
+        """Full contents of the given tiles; clients replace those tiles with it."""
+        tiles = frozenset(tiles)
+        return cached(room, ("tiles", proto, tiles), lambda: build_tiles(room, tiles, proto))
+
+    def build_tiles(room: Room, tiles, proto: str) -> Union[str, bytes]:
+        tiles = sorted(tiles)
+        coords = [(t % TILES_X, t // TILES_X) for t in tiles]
+        cells = chain.from_iterable(
+            room.framebuffer.region(tx*TILE, ty*TILE, min(GRID_W, (tx+1)*TILE), min(GRID_H, (ty+1)*TILE))
+            for tx, ty in coords)
+        if proto == "bin":
+            head = struct.pack(f"<IIQHI{2*len(coords)}H", GRID_W, GRID_H, room.version, TILE, len(coords),
+                               *chain.from_iterable(coords))
+            return encode_bin_cells(BIN_TILES, cells, GRID_W, head)
+        pixels = [{"x":i % GRID_W,"y":i // GRID_W,"char":chr(cp)} for i, cp in cells]
+        return json.dumps({"type":"tiles", "w": GRID_W, "h": GRID_H, "version": room.version, "tile": TILE,
+                           "tiles": [list(c) for c in coords], "pixels": pixels})
+
+    def broadcast(room: Room, msg: dict):
+        """Encode once per protocol and queue for every peer in the room; never awaits a socket."""
+        t, sent = time.perf_counter(), 0
+        encoded, clients = {}, room.clients
+        for peer in list(clients):
+            if peer.closed:
+                clients.discard(peer); continue
+            data = encoded.get(peer.proto)
+            if data is None: data = encoded[peer.proto] = encode(msg, peer.proto)
+            peer.push(data); sent += 1
+        metrics.inc("frames_queued_total", sent)
+        metrics.observe("broadcast_seconds", time.perf_counter() - t)
+
+    def broadcast_op(room: Room, tool: str, pts, chars):
+        """Like broadcast(), but peers with a tile subscription only get the cells inside it."""
+        t, sent = time.perf_counter(), 0
+        by_tile, encoded, clients = None, {}, room.clients
+        for peer in list(clients):
+            if peer.closed:
+                clients.discard(peer); continue
+            key = None
+            if peer.tiles is not None:
+                if by_tile is None:
+                    by_tile = {}
+                    for n, (x,y) in enumerate(pts):
+                        by_tile.setdefault((y // TILE)*TILES_X + x // TILE, []).append(n)
+                hit = peer.tiles.intersection(by_tile)
+                if not hit: continue
+                if len(hit) < len(by_tile): key = frozenset(hit)
+            data = encoded.get((peer.proto, key))
+            if data is None:
+                if key is None: sub_pts, sub_chars = pts, chars
+                else:
+                    idx = sorted(n for t in key for n in by_tile[t])
+                    sub_pts, sub_chars = [pts[n] for n in idx], [chars[n] for n in idx]
+                data = encoded[(peer.proto, key)] = encode(
+                    {"type":"op", "version": room.version, "op":{"tool": tool,"points":sub_pts,"chars":sub_chars}},
+                    peer.proto)
+            peer.push(data); sent += 1
+        metrics.inc("frames_queued_total", sent)
+        metrics.observe("broadcast_seconds", time.perf_counter() - t)
+
+    def publish(room: Room, tool: str, pts, chars):
+        """Broadcast an applied op now, or merge it into the room's next tick frame."""
+        if not TICK_SEC:
+            broadcast_op(room, tool, pts, chars)
+            return
+        for (x,y), ch in zip(pts, chars):
+            room.pending[y*GRID_W + x] = ch
+
+    def flush_pending(room: Room):
+        pending = room.pending
+        if not pending: return
+        pts = [[i % GRID_W, i // GRID_W] for i in pending]
+        chars = list(pending.values())
+        pending.clear()
+        broadcast_op(room, "frame", pts, chars)
+
+    async def tick_loop():
+        while True:
+            await asyncio.sleep(TICK_SEC)
+            for room in list(rooms.values()):
+                flush_pending(room)
+
+    def view_state(room: Room, proto: str) -> Union[str, bytes]:
+        if proto == "sse":
+            return cached(room, "state-sse", lambda: b"data: " + encode_state(room, "json").encode() + b"\n\n")
+        return encode_state(room, proto)
+
+    def view_delta(delta: dict, proto: str) -> Union[str, bytes]:
+        data = delta["enc"].get(proto)
+        if data is None:
+            data = delta["enc"][proto] = (b"data: " + encode(delta["msg"], "json").encode() + b"\n\n"
+                                          if proto == "sse" else encode(delta["msg"], proto))
+        return data
+
+    def view_key(room: Room, proto: str):
+        """The current keyframe in `proto` as (version, data), building it from the canvas if needed."""
+        key = room.view["keys"].get(proto)
+        if key is None: key = room.view["keys"][proto] = (room.version, view_state(room, proto))
+        return key
+
+    def join_view(room: Room, peer: Peer):
+        """Start a spectator from the shared keyframe plus the deltas since it; nothing is encoded
+        for it alone unless it is the first of its protocol in this keyframe period."""
+        view = room.view
+        if not room.spectators:
+            view.update(version=room.version, keys={}, deltas=[], key_at=time.monotonic())
+        version, data = view_key(room, peer.proto)
+        peer.push(data)
+        for delta in view["deltas"]:
+            if delta["version"] > version: peer.push(view_delta(delta, peer.proto))
+        room.spectators.add(peer)
+
+    def leave_view(room: Room, peer: Peer):
+        room.spectators.discard(peer)
+        room.last_used = time.monotonic()
+        if rooms.get(room.name) is room: rooms.move_to_end(room.name)
+        peer.stop()
+
+    def view_tick(room: Room):
+        """Send spectators everything that changed since the last tick as one shared frame."""
+        view, now = room.view, time.monotonic()
+        if now - view["key_at"] >= KEYFRAME_SEC:   # new period: the next joiner builds a fresh keyframe
+            view.update(keys={}, deltas=[], key_at=now)
+        if room.version == view["version"]: return
+        t = time.perf_counter()
+        changes = changes_since(room, view["version"])
+        view["version"] = room.version
+        spectators = [p for p in room.spectators if not p.closed]
+        room.spectators.intersection_update(spectators)
+        if changes is None:   # a clear, or more than the history holds: everyone restarts from a keyframe
+            view.update(keys={}, deltas=[], key_at=now)
+            for peer in spectators: peer.push(view_key(room, peer.proto)[1])
+        else:
+            pts, chars = changes
+            delta = {"version": room.version, "enc": {},
+                     "msg": {"type":"op", "version": room.version, "op":{"tool":"frame","points":pts,"chars":chars}}}
+            view["deltas"].append(delta)
+            for peer in spectators: peer.push(view_delta(delta, peer.proto))
+        metrics.inc("frames_queued_total", len(spectators))
+        metrics.observe("view_tick_seconds", time.perf_counter() - t)
+
+    async def view_loop():
+        while True:
+            await asyncio.sleep(VIEW_TICK_SEC)
+            for room in list(rooms.values()):
+                if room.spectators: view_tick(room)
+
+    def shape_tiles(shape: dict) -> set:
+        if shape["tool"] == "flood_fill":
+            runs = shape["runs"]   # sorted by row
+            return view_tiles(min(x for x, _y, _n in runs), runs[0][1], max(x + n for x, _y, n in runs), runs[-1][1] + 1)
+        if shape["tool"] == "text":
+            lines = shape["text"].split("\n")
+            return view_tiles(shape["x"], shape["y"], shape["x"] + max(map(len, lines)), shape["y"] + len(lines))
+        return view_tiles(min(shape["x0"], shape["x1"]), min(shape["y0"], shape["y1"]),
+                          max(shape["x0"], shape["x1"]) + 1, max(shape["y0"], shape["y1"]) + 1)
+
+    def publish_shape(room: Room, shape: dict):
+        """Send a shape as the compact op (one JSON frame for every protocol); clients rasterize
+        it themselves. A flood fill depends on canvas state, so it carries the runs it filled."""
+        flush_pending(room)   # keep the tick's earlier cells ahead of the shape
+        t, sent = time.perf_counter(), 0
+        tiles, data = shape_tiles(shape), None
+        for peer in list(room.clients):
+            if peer.closed:
+                room.clients.discard(peer); continue
+            if peer.tiles is not None and peer.tiles.isdisjoint(tiles): continue
+            if data is None: data = json.dumps({"type":"op", "version": room.version, "op": shape})
+            peer.push(data); sent += 1
+        metrics.inc("frames_queued_total", sent)
+        metrics.observe("broadcast_seconds", time.perf_counter() - t)
+
+    def handle_op(room: Room, op: dict):
+        """Apply a client op (points or shape) and publish the result."""
+        t = time.perf_counter()
+        if op.get("tool") in SHAPE_TOOLS:
+            shape = normalize_shape(op, GRID_W, GRID_H)
+            if shape is None: return
+            written = apply_shape(room, shape)
+        else:
+            shape = None
+            pts, chars = apply_op(room, op)
+            written = len(pts)
+        metrics.observe("op_apply_seconds", time.perf_counter() - t)
+        metrics.inc("ops_total"); metrics.inc("cells_total", written)
+        if not written: return
+        if shape: publish_shape(room, shape)
+        else: publish(room, op.get("tool") or "put", pts, chars)
+
+    def clear_room(room: Room):
+        t = time.perf_counter()
+        room.framebuffer.clear()
+        room.dirty = True
+        room.version += VERSION_STEP
+        room.record(None, None)
+        if room.oplog: room.oplog.append(bytes([BIN_CLEAR]))
+        room.pending.clear()
+        broadcast(room, {"type":"system","event":"clear","version":room.version})
+        metrics.inc("clears_total")
+        metrics.observe("clear_seconds", time.perf_counter() - t)
+
+    async def save_room(room: Room):
+        if room.oplog: await room.oplog.compact(room.framebuffer)
+        else: save_state(room)
+        room.dirty = False
 
-    def toggle_cell(x:int, y:int):
-        cur = framebuffer.get((x,y))
-        framebuffer[(x,y)] = None if cur == '█' else '█'
-        dirty_flag["dirty"] = True
+    def apply_remote(room: Room, kind: int, body: bytes):
+        if kind == BP_OP:
+            handle_op(room, decode_bin_in_op(body))
+        elif kind == BP_SHAPE:
+            handle_op(room, json.loads(body))
+        elif kind == BP_CLEAR:
+            clear_room(room)
 
-    def serialize_state():
-        pixels = [{"x":x,"y":y,"char":ch} for (x,y), ch in framebuffer.items() if ch]
-        return {"type":"state", "w": GRID_W, "h": GRID_H, "pixels": pixels}
+    def backplane_lost():
+        # Without the broker this replica can only go stale: shut down the normal way, so the
+        # rooms are saved, and serve() exits non-zero to let the supervisor restart us.
+        app.state.stop()
+
+    async def on_backplane(data: bytes):
+        """Apply one message from the broker; called in broker order, one at a time."""
+        kind, worker, name, body = decode_bp(data)
+        if kind == BP_SYNC_REQ:
+            if OWNER:
+                room = await get_room(name)
+                if room: bp.publish(encode_bp(BP_SYNC, worker, name, body[:BP_SYNC_ID.size] + encode_state(room, "bin")))
+            elif worker == NODE and name in syncing:
+                # The owner's answer to this request covers everything before this point.
+                s = syncing[name]
+                if s["ops"] is None: s["ops"] = []
+                s["marks"][BP_SYNC_ID.unpack_from(body)[0]] = len(s["ops"])
+            return
+        if kind == BP_SYNC:
+            s = syncing.get(name) if worker == NODE else None
+            mark = s["marks"].get(BP_SYNC_ID.unpack_from(body)[0]) if s is not None else None
+            if mark is not None: finish_sync(name, body[BP_SYNC_ID.size:], s["ops"][mark:])
+            return
+        if OWNER:   # the owner applies every op so its files stay complete, opening rooms as needed
+            room = await get_room(name)
+            if room and kind == BP_SAVE: await save_room(room)
+        else:
+            s = syncing.get(name)
+            if s is not None:
+                if s["ops"] is not None: s["ops"].append((kind, body))
+                return
+            room = rooms.get(name)
+        if room: apply_remote(room, kind, body)
+
+    async def lag_loop():
+        """Sample event loop lag: how much later than asked a short sleep comes back."""
+        loop = asyncio.get_running_loop()
+        while True:
+            t = loop.time()
+            await asyncio.sleep(LAG_SEC)
+            lag_task["last"] = lag = max(0.0, loop.time() - t - LAG_SEC)
+            metrics.observe("loop_lag_seconds", lag)
+
+    def bad_room():
+        return JSONResponse({"ok": False, "error": "invalid room name"}, status_code=400)
 
     @app.get("/", response_class=HTMLResponse)
     async def index():
         return HTML
 
+    def empty_state(tiles) -> dict:
+        """/state of a room that has nothing stored, answered without opening it."""
+        msg = {"type": "state", "w": GRID_W, "h": GRID_H, "version": 0, "pixels": []}
+        if tiles is not None:
+            msg.update(type="tiles", tile=TILE, tiles=[[t % TILES_X, t // TILES_X] for t in sorted(tiles)])
+        return msg
+
     @app.get("/state")
-    async def state():
-        return JSONResponse(serialize_state())
+    async def state(request: Request, view: Optional[str] = None, room: Optional[str] = None):
+        name = room or DEFAULT_ROOM
+        path = room_dir(DATA_DIR, name)
+        if path is None: return bad_room()
+        tiles = parse_view(view) if view else None
+        if OWNER and name not in rooms and name not in closing and not stored(path):
+            return JSONResponse(empty_state(tiles), headers={"Cache-Control": "no-cache"})
+        room = await get_room(name)
+        if room is None: return bad_room()
+        v = room.version
+        gz = "gzip" in request.headers.get("accept-encoding", "")
+        headers = {"ETag": f'"{v}-gz"' if gz else f'"{v}"', "Vary": "Accept-Encoding", "Cache-Control": "no-cache"}
+        seen = {t.strip().removeprefix("W/") for t in request.headers.get("if-none-match", "").split(",")}
+        if seen & {f'"{v}"', f'"{v}-gz"', "*"}:
+            return Response(status_code=304, headers=headers)
+        body = (lambda: encode_state(room, "json")) if tiles is None else (lambda: encode_tiles(room, tiles, "json"))
+        if gz:
+            headers["Content-Encoding"] = "gzip"
+            key = ("state-gz", None if tiles is None else frozenset(tiles))
+            return Response(cached(room, key, lambda: gzip.compress(body().encode(), 6)),
+                            media_type="application/json", headers=headers)
+        return Response(body(), media_type="application/json", headers=headers)
+
+    @app.get("/metrics")
+    async def metrics_endpoint():
+        return Response(metrics.render(), media_type="text/plain; version=0.0.4")
+
+    async def serve_metrics(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """Minimal HTTP on METRICS_PORT: GET /metrics for this worker alone, whoever owns the main port."""
+        try:
+            head = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), 5)
+            method, path = (head.split(b" ", 2) + [b""])[:2]
+            ok = method == b"GET" and path.split(b"?")[0] == b"/metrics"
+            body = metrics.render().encode() if ok else b"not found\n"
+            writer.write(b"HTTP/1.1 %s\r\nContent-Type: text/plain; version=0.0.4\r\nContent-Length: %d\r\n"
+                         b"Connection: close\r\n\r\n" % (b"200 OK" if ok else b"404 Not Found", len(body)) + body)
+            await writer.drain()
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, asyncio.TimeoutError, ConnectionError):
+            pass
+        finally:
+            writer.close()
 
     @app.post("/clear")
-    async def clear():
-        framebuffer.clear()
-        dirty_flag["dirty"] = True
-        msg = {"type":"system","event":"clear"}
-        dead = []
-        for ws in list(clients):
-            try: await ws.send_text(json.dumps(msg))
-            except Exception: dead.append(ws)
-        for ws in dead:
-            clients.discard(ws)
+    async def clear(room: Optional[str] = None):
+        room = await get_room(room)
+        if room is None: return bad_room()
+        if bp: bp.publish(encode_bp(BP_CLEAR, NODE, room.name))
+        else: clear_room(room)
         return {"ok": True}
 
     @app.post("/save")
-    async def manual_save():
-        save_state()
-        dirty_flag["dirty"] = False
+    async def manual_save(room: Optional[str] = None):
+        room = await get_room(room)
+        if room is None: return bad_room()
+        if room.replica: bp.publish(encode_bp(BP_SAVE, NODE, room.name))
+        else: await save_room(room)
         return {"ok": True}
 
     @app.websocket("/ws")
     async def ws_endpoint(ws: WebSocket):
         await ws.accept()
-        await ws.send_text(json.dumps(serialize_state()))
-        clients.add(ws)
+        room = await get_room(ws.query_params.get("room"))
+        if room is None:
+            await ws.close(code=1008); return
+        proto = "bin" if ws.query_params.get("proto") == "bin" and max(GRID_W, GRID_H) <= BIN_MAX_DIM else "json"
+        peer = Peer(ws, send_queue, high_water, slow_grace_sec, slow_policy,
+                    lambda: encode_state(room, proto) if peer.tiles is None else encode_tiles(room, peer.tiles, proto),
+                    proto, metrics)
+        metrics.inc("connections_total")
+        view = ws.query_params.get("view")
+        peer.tiles = parse_view(view) if view else None
+        # A reconnecting client sends the last version it saw and gets only what changed since.
+        try: delta = changes_since(room, int(ws.query_params["since"]))
+        except (KeyError, ValueError): delta = None
+        if delta is None:
+            peer.push(peer.resync())
+        else:
+            pts, chars = delta
+            if peer.tiles is not None:
+                keep = [n for n, (x,y) in enumerate(pts) if (y // TILE)*TILES_X + x // TILE in peer.tiles]
+                pts, chars = [pts[n] for n in keep], [chars[n] for n in keep]
+            peer.push(encode({"type":"op", "version": room.version,
+                              "op":{"tool":"delta","points":pts,"chars":chars}}, proto))
+        peer.start()
+        room.clients.add(peer)
+        op_bucket, cell_bucket = TokenBucket(rate_ops), TokenBucket(rate_cells)
         try:
             while True:
-                raw = await ws.receive_text()
-                msg = json.loads(raw)
-                op = msg.get("op", {})
-                tool = op.get("tool")
-                pts = op.get("points", [])
-                char = op.get("char", None)
-                mode = op.get("mode")
-
-                safe_pts, chars = [], []
-                for x,y in pts:
-                    try:
-                        x = int(x); y = int(y)
-                    except Exception:
-                        continue
-                    if not (0 <= x < GRID_W and 0 <= y < GRID_H):
-                        continue
-                    if tool == "set" and mode == "set":
-                        set_cell(x,y,char if char else None)
-                    elif tool in ("put","toggle"):
-                        if "char" in op and op["char"] is not None:
-                            set_cell(x,y,op["char"])
+                message = await ws.receive()
+                if message["type"] == "websocket.disconnect":
+                    break
+                data = message.get("bytes")
+                if MAX_FRAME and len(data if data is not None else message.get("text") or "") > MAX_FRAME:
+                    metrics.inc("rate_limited_total")
+                    await ws.close(code=1009); break
+                # Parse just enough to know what the message costs before doing any of the work.
+                msg, op, n = {}, None, 0
+                if data is not None:
+                    n = max(0, (len(data) - 6) // 4)
+                else:
+                    msg = json.loads(message["text"])
+                    if msg.get("type") != "subscribe":
+                        op = msg.get("op", {})
+                        if op.get("tool") in SHAPE_TOOLS:
+                            op = normalize_shape(op, GRID_W, GRID_H)
+                            if op is None: continue
+                            n = shape_cells(op, GRID_W, GRID_H)
+                            if op["tool"] == "flood_fill" and MAX_SHAPE: n = min(n, MAX_SHAPE)   # the fill stops there
                         else:
-                            toggle_cell(x,y)
-                    else:
-                        toggle_cell(x,y)
-                    safe_pts.append([x,y])
-                    chars.append(framebuffer.get((x,y)))
-
-                if not safe_pts:
+                            n = len(op.get("points") or ())
+                limit = MAX_SHAPE if op is not None and op.get("tool") in SHAPE_TOOLS else MAX_POINTS
+                if limit and n > limit:
+                    metrics.inc("rate_limited_total")
+                    if rate_policy == "disconnect":
+                        await ws.close(code=1009); break
                     continue
-                enriched = {"type":"op", "op":{"tool": tool or "put","points":safe_pts,"chars":chars}}
-                dead = []
-                for peer in list(clients):
-                    try: await peer.send_text(json.dumps(enriched))
-                    except Exception: dead.append(peer)
-                for peer in dead:
-                    clients.discard(peer)
+                wait = max(op_bucket.wait(1), cell_bucket.wait(n))
+                if wait:
+                    metrics.inc("rate_limited_total")
+                    if rate_policy == "disconnect":
+                        await ws.close(code=1008); break
+                    if rate_policy == "drop": continue
+                    await asyncio.sleep(wait)   # stop reading; the client's socket backs up instead of ours
+                    op_bucket.wait(1); cell_bucket.wait(n)
+                op_bucket.take(1); cell_bucket.take(n)
+                if msg.get("type") == "subscribe":
+                    try: tiles = view_tiles(msg["x0"], msg["y0"], msg["x1"], msg["y1"])
+                    except (KeyError, TypeError, ValueError): continue
+                    added = set() if peer.tiles is None else tiles - peer.tiles
+                    peer.tiles = tiles
+                    if added: peer.push(encode_tiles(room, added, proto))
+                    continue
+                if data is not None: op = decode_bin_in_op(data)
+                if bp and op.get("tool") in SHAPE_TOOLS:
+                    bp.publish(encode_bp(BP_SHAPE, NODE, room.name, json.dumps(op).encode()))
+                elif bp:
+                    bp.publish(encode_bp(BP_OP, NODE, room.name, data or encode_bin_in_op(op)))
+                else:
+                    handle_op(room, op)
+        except WebSocketDisconnect:
+            pass
+        finally:
+            room.clients.discard(peer)
+            room.last_used = time.monotonic()
+            if rooms.get(room.name) is room: rooms.move_to_end(room.name)
+            peer.stop()
+
+    @app.websocket("/ws/view")
+    async def ws_view(ws: WebSocket):
+        """Read-only viewer: the room's shared keyframe + delta stream; anything it sends is ignored."""
+        await ws.accept()
+        room = await get_room(ws.query_params.get("room"))
+        if room is None:
+            await ws.close(code=1008); return
+        proto = "bin" if ws.query_params.get("proto") == "bin" and max(GRID_W, GRID_H) <= BIN_MAX_DIM else "json"
+        peer = Peer(ws, send_queue, high_water, slow_grace_sec, slow_policy,
+                    lambda: view_state(room, proto), proto, metrics)
+        metrics.inc("connections_total")
+        join_view(room, peer)
+        peer.start()
+        try:
+            while (await ws.receive())["type"] != "websocket.disconnect":
+                pass
         except WebSocketDisconnect:
             pass
         finally:
-            clients.discard(ws)
+            leave_view(room, peer)
+
+    @app.get("/stream")
+    async def stream(room: Optional[str] = None):
+        """Server-sent events version of /ws/view; each event's data is a JSON protocol message."""
+        name = room or DEFAULT_ROOM
+        if room_dir(DATA_DIR, name) is None: return bad_room()
+
+        async def events():
+            # Join only once the response is streaming: a client gone before the first chunk
+            # never runs this generator, so a peer joined earlier would never leave.
+            room = await get_room(name)
+            peer = Peer(None, send_queue, high_water, slow_grace_sec, slow_policy,
+                        lambda: view_state(room, "sse"), "sse", metrics)
+            metrics.inc("connections_total")
+            join_view(room, peer)
+            try:
+                yield b"retry: 2000\n\n"
+                while not peer.closed:
+                    try: yield await asyncio.wait_for(peer.queue.get(), 15)
+                    except asyncio.TimeoutError: yield b": keepalive\n\n"   # keeps proxies from timing out
+            finally:
+                leave_view(room, peer)
+        return StreamingResponse(events(), media_type="text/event-stream",
+                                 headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
 
     @app.on_event("startup")
     async def _startup():
-        load_state()
+        if bp: await bp.start(on_backplane, backplane_lost)
+        await get_room(DEFAULT_ROOM)
         autosave_task["task"] = asyncio.create_task(autosave_loop())
+        if TICK_SEC:
+            tick_task["task"] = asyncio.create_task(tick_loop())
+        if LAG_SEC:
+            lag_task["task"] = asyncio.create_task(lag_loop())
+        view_task["task"] = asyncio.create_task(view_loop())
+        if METRICS_PORT:
+            metrics_server["server"] = await asyncio.start_server(serve_metrics, metrics_host, METRICS_PORT)
 
     @app.on_event("shutdown")
     async def _shutdown():
-        try: save_state()
-        except Exception: pass
-        t = autosave_task.get("task")
-        if t: t.cancel()
+        if metrics_server["server"]: metrics_server["server"].close()
+        for t in (autosave_task.get("task"), tick_task.get("task"), lag_task.get("task"), view_task.get("task")):
+            if t: t.cancel()
+        if bp: await bp.close()
+        for room in list(rooms.values()):
+            evict(room)   # saves the dirty ones
+        if closing: await asyncio.gather(*closing.values(), return_exceptions=True)
+        if wal_io: wal_io.shutdown(wait=True)
 
     return app
 
@@ -333,10 +2254,126 @@ def main():
     ap.add_argument("--port", "-p", type=int, default=7100, help="Bind port")
     ap.add_argument("--data", default="./data", help="Directory for saved JSON state")
     ap.add_argument("--autosave-sec", type=int, default=3, help="Autosave interval (seconds)")
+    ap.add_argument("--send-queue", type=int, default=1024, help="Max queued outbound frames per client")
+    ap.add_argument("--high-water", type=int, default=256, help="Queued frames above which a client counts as slow")
+    ap.add_argument("--slow-grace-sec", type=float, default=2.0, help="How long a client may stay above --high-water")
+    ap.add_argument("--slow-policy", choices=SLOW_POLICIES, default="drop", help="What to do with slow clients")
+    ap.add_argument("--tick-ms", type=int, default=0, help="Coalesce ops into one frame per tick (0 = send each op)")
+    ap.add_argument("--tile", type=int, default=64, help="Tile size (cells) for viewport subscriptions")
+    ap.add_argument("--persist", choices=PERSIST_MODES, default="json",
+                    help="json: rewrite state.json on autosave; wal: op log + snapshot; "
+                         "mmap: canvas.bin mapped in memory (wal and mmap import state.json once)")
+    ap.add_argument("--wal-flush-ms", type=int, default=50, help="Op log write+fsync interval (wal mode)")
+    ap.add_argument("--wal-compact-mb", type=float, default=16, help="Op log size that triggers a snapshot (wal mode)")
+    ap.add_argument("--history", type=int, default=4096, help="Recent ops kept for delta resync of reconnecting clients")
+    ap.add_argument("--history-cells", type=int, default=250000,
+                    help="Cells those ops may hold in total; bigger ops make older clients reload the canvas")
+    ap.add_argument("--rate-ops", type=float, default=200, help="Messages/sec allowed per client (0 = unlimited)")
+    ap.add_argument("--rate-cells", type=float, default=50000, help="Cells/sec a client may draw (0 = unlimited)")
+    ap.add_argument("--max-points", type=int, default=10000, help="Max points in one op (0 = unlimited)")
+    ap.add_argument("--max-shape-cells", type=int, default=1000000,
+                    help="Max cells one shape may write; bigger shapes are refused like ops over --max-points "
+                         "and bigger flood fills are not applied (0 = unlimited)")
+    ap.add_argument("--max-frame-bytes", type=int, default=256 * 1024, help="Max inbound WebSocket message size (0 = unlimited)")
+    ap.add_argument("--rate-policy", choices=RATE_POLICIES, default="drop",
+                    help="What to do with a client over --rate-ops/--rate-cells (drop, delay or disconnect)")
+    ap.add_argument("--loop-lag-ms", type=int, default=0,
+                    help="Sample event loop lag every N ms for /metrics (0 = off)")
+    ap.add_argument("--metrics-port", type=int, default=0,
+                    help="Also serve each worker's own /metrics on this port plus its index on this host (0 = off)")
+    ap.add_argument("--metrics-host", default="127.0.0.1", help="Interface for --metrics-port")
+    ap.add_argument("--view-tick-ms", type=int, default=100, help="How often spectators get the changes as one frame")
+    ap.add_argument("--keyframe-sec", type=float, default=10,
+                    help="How long spectators joining late share one keyframe before a new one is built")
+    ap.add_argument("--max-rooms", type=int, default=256, help="Rooms kept in memory; idle ones beyond this are evicted first")
+    ap.add_argument("--room-idle-sec", type=float, default=60, help="Evict a room after it has had no clients for this long")
+    ap.add_argument("--workers", type=int, default=1,
+                    help="Worker processes sharing the port; they sync through a local broker unless --backplane is set")
+    ap.add_argument("--backplane", default=None,
+                    help="Broker to sync workers through (unix:/path or tcp:host:port); needed to span hosts")
+    ap.add_argument("--worker-id", type=int, default=0,
+                    help="Id of the first worker on this host; worker 0 owns persistence, ids must be unique")
+    ap.add_argument("--broker", default=None, metavar="ADDR", help="Only run a backplane broker on ADDR")
+    ap.add_argument("--backplane-key", default=os.environ.get("PAINTSOURCE_BACKPLANE_KEY", ""),
+                    help="Shared secret the broker and workers authenticate with "
+                         "(default: $PAINTSOURCE_BACKPLANE_KEY); set it whenever the broker listens on TCP")
+    ap.add_argument("--convert", nargs=2, metavar=("SRC", "DST"),
+                    help="Convert between state.json and canvas.bin/snapshot.bin (by extension), then exit")
     args = ap.parse_args()
 
-    app = make_app(args.cols, args.rows, args.scale, args.data, args.autosave_sec)
-    uvicorn.run(app, host=args.host, port=args.port)
+    if args.convert:
+        convert(*args.convert)
+        return
+    if args.broker:
+        asyncio.run(run_broker(args.broker, args.backplane_key))
+        return
+    if args.workers <= 1:
+        serve(build_app(args, args.backplane, args.worker_id), args)
+        return
+
+    # Several workers: bind once and fork, so the kernel spreads accepts over the processes.
+    backplane = args.backplane
+    if backplane is None:
+        backplane = "unix:" + str(pathlib.Path(args.data).expanduser().resolve() / "backplane.sock")
+        pathlib.Path(backplane[5:]).parent.mkdir(parents=True, exist_ok=True)
+    sock = socket.socket(socket.AF_INET6 if ":" in args.host else socket.AF_INET)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((args.host, args.port))
+    sock.listen(2048)
+    ctx = multiprocessing.get_context("fork")
+    procs = [ctx.Process(target=run_worker, args=(args, backplane, args.worker_id + i, sock))
+             for i in range(args.workers)]
+    for p in procs: p.start()
+    # Only start the broker thread once every worker is forked: forking a process that runs
+    # other threads can copy locks they hold. Workers retry until the broker is listening.
+    if args.backplane is None:
+        threading.Thread(target=asyncio.run, args=(run_broker(backplane, args.backplane_key),), daemon=True).start()
+
+    stopping = {"signal": False}
+
+    def stop(signum=None, _frame=None):
+        if signum: stopping["signal"] = True
+        for p in procs:
+            if p.is_alive(): p.terminate()
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, lambda *_: None)   # Ctrl-C reaches the workers directly
+    multiprocessing.connection.wait([p.sentinel for p in procs])
+    crashed = not stopping["signal"]
+    stop()   # one worker gone means the set is incomplete: stop all and let the supervisor restart us
+    for p in procs: p.join()
+    sys.exit(1 if crashed else 0)
+
+def build_app(args, backplane: Optional[str], worker_id: int):
+    return make_app(args.cols, args.rows, args.scale, args.data, args.autosave_sec,
+                    send_queue=args.send_queue, high_water=args.high_water,
+                    slow_grace_sec=args.slow_grace_sec, slow_policy=args.slow_policy,
+                    tick_ms=args.tick_ms, tile=args.tile, persist=args.persist,
+                    wal_flush_ms=args.wal_flush_ms, wal_compact_mb=args.wal_compact_mb,
+                    history=args.history, history_cells=args.history_cells, max_rooms=args.max_rooms, room_idle_sec=args.room_idle_sec,
+                    backplane=backplane, backplane_key=args.backplane_key, worker_id=worker_id, rate_ops=args.rate_ops,
+                    rate_cells=args.rate_cells, max_points=args.max_points,
+                    max_shape_cells=args.max_shape_cells,
+                    max_frame_bytes=args.max_frame_bytes, rate_policy=args.rate_policy,
+                    loop_lag_ms=args.loop_lag_ms, view_tick_ms=args.view_tick_ms,
+                    keyframe_sec=args.keyframe_sec, metrics_host=args.metrics_host,
+                    metrics_port=args.metrics_port + worker_id - args.worker_id if args.metrics_port else 0)
+
+def uvicorn_options(args) -> dict:
+    # ws_max_size: refuse oversized messages before they are buffered (uvicorn default: 16 MiB).
+    # timeout_graceful_shutdown: /stream responses never finish on their own, so stop waiting
+    # for them after a few seconds and go on to save the rooms.
+    return {"ws_max_size": args.max_frame_bytes if args.max_frame_bytes > 0 else 1 << 30,
+            "timeout_graceful_shutdown": 3}
+
+def serve(app: FastAPI, args, sockets: Optional[List[socket.socket]] = None):
+    """Run uvicorn until it is stopped; exits non-zero if that was because the backplane was lost."""
+    server = uvicorn.Server(uvicorn.Config(app, host=args.host, port=args.port, **uvicorn_options(args)))
+    app.state.stop = lambda: setattr(server, "should_exit", True)
+    server.run(sockets=sockets)
+    if app.state.backplane and app.state.backplane.lost: sys.exit(1)
+
+def run_worker(args, backplane: str, worker_id: int, sock: socket.socket):
+    serve(build_app(args, backplane, worker_id), args, [sock])
 
 if __name__ == "__main__":
     main()
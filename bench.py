@@ -0,0 +1,460 @@
+# bench.py — PaintSource micro-benchmarks (run: python3 bench.py <name> --help)
+import argparse, asyncio, json, os, random, shlex, shutil, socket, struct, subprocess, sys, tempfile, time, tracemalloc, urllib.request
+from collections import deque
+
+from app import BIN_STATE, Framebuffer, OpLog, cells_le, encode_bin_cells, encode_bin_op, json_pixels
+
+def _timeit(fn, repeat=3):
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter(); fn(); best = min(best, time.perf_counter() - t0)
+    return best
+
+def _random_cells(w, h, density, seed=1):
+    rnd = random.Random(seed)
+    n = int(w * h * density)
+    return [(rnd.randrange(w), rnd.randrange(h)) for _ in range(n)]
+
+def bench_framebuffer(args):
+    """Memory and full-scan time: legacy tuple-keyed dict vs Framebuffer."""
+    results = []
+    for size in args.sizes:
+        w, h = (int(v) for v in size.lower().split("x"))
+        pts = _random_cells(w, h, args.density)
+        row = {"size": f"{w}x{h}", "touched": len(pts)}
+
+        if not args.skip_dict:
+            tracemalloc.start()
+            fb_dict = {}
+            for x, y in pts: fb_dict[(x, y)] = '█'
+            for x, y in pts[::4]: fb_dict[(x, y)] = None   # erased cells stay behind
+            row["dict_bytes"] = tracemalloc.get_traced_memory()[0]
+            tracemalloc.stop()
+            row["dict_scan_s"] = _timeit(lambda: [(x, y, ch) for (x, y), ch in fb_dict.items() if ch])
+            row["dict_pixels_s"] = _timeit(lambda: [{"x":x,"y":y,"char":ch} for (x, y), ch in fb_dict.items() if ch])
+            del fb_dict
+
+        tracemalloc.start()
+        fb = Framebuffer(w, h)
+        fb.apply(pts, '█'); fb.apply(pts[::4], None)
+        row["array_bytes"] = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        row["array_scan_s"] = _timeit(lambda: list(fb.items()))
+        row["array_pixels_s"] = _timeit(lambda: json_pixels(fb))   # what /state and JSON saves build
+        row["array_apply_s"] = _timeit(lambda: fb.apply(pts, '█'))
+        results.append(row)
+        print(json.dumps(row), flush=True)
+    return results
+
+def _bresenham(x0, y0, x1, y1):
+    pts = []
+    dx, dy = abs(x1-x0), -abs(y1-y0)
+    sx, sy = (1 if x0 < x1 else -1), (1 if y0 < y1 else -1)
+    err = dx + dy
+    while True:
+        pts.append([x0, y0])
+        if x0 == x1 and y0 == y1: return pts
+        e2 = 2*err
+        if e2 >= dy: err += dy; x0 += sx
+        if e2 <= dx: err += dx; y0 += sy
+
+def bench_protocol(args):
+    """Bytes and encode/decode time per message: JSON vs the binary protocol."""
+    from term_client import decode_bin
+    rnd = random.Random(1)
+    w, h = args.cols, args.rows
+    strokes = []
+    for _ in range(args.ops):
+        x, y = rnd.randrange(w-4), rnd.randrange(h-4)
+        strokes.append(_bresenham(x, y, x + rnd.randint(0, 3), y + rnd.randint(0, 3)))
+    lines = [_bresenham(rnd.randrange(w), rnd.randrange(h), rnd.randrange(w), rnd.randrange(h)) for _ in range(args.ops // 10)]
+    cases = {"stroke": [(p, ['█']*len(p)) for p in strokes],
+             "line": [(p, ['█']*len(p)) for p in lines],
+             "mixed_chars": [(p, [rnd.choice("abc█") for _ in p]) for p in lines]}
+    results = []
+    for name, ops in cases.items():
+        js = [json.dumps({"type":"op","op":{"tool":"set","points":p,"chars":c}}) for p, c in ops]
+        bn = [encode_bin_op(p, c, w) for p, c in ops]
+        row = {"case": name, "ops": len(ops), "points_per_op": sum(len(p) for p, _ in ops) / len(ops),
+               "json_bytes_per_op": sum(map(len, (m.encode() for m in js))) / len(ops),
+               "bin_bytes_per_op": sum(map(len, bn)) / len(ops),
+               "json_encode_us": 1e6 * _timeit(lambda: [json.dumps({"type":"op","op":{"tool":"set","points":p,"chars":c}}) for p, c in ops]) / len(ops),
+               "bin_encode_us": 1e6 * _timeit(lambda: [encode_bin_op(p, c, w) for p, c in ops]) / len(ops),
+               "json_decode_us": 1e6 * _timeit(lambda: [json.loads(m) for m in js]) / len(ops),
+               "bin_decode_us": 1e6 * _timeit(lambda: [decode_bin(m) for m in bn]) / len(ops)}
+        results.append(row)
+        print(json.dumps(row), flush=True)
+
+    fb = Framebuffer(w, h)
+    fb.apply(_random_cells(w, h, args.density), '█')
+    state = {"type":"state","w":w,"h":h,"pixels":[{"x":x,"y":y,"char":ch} for x, y, ch in fb.items()]}
+    enc_bin = lambda: encode_bin_cells(BIN_STATE, ((i, fb.cells[i]) for i in fb.nonzero()), w, struct.pack("<IIQ", w, h, 0))
+    js, bn = json.dumps(state), enc_bin()
+    row = {"case": "state", "cells": len(fb), "json_bytes": len(js.encode()), "bin_bytes": len(bn),
+           "json_encode_s": _timeit(lambda: json.dumps({"type":"state","w":w,"h":h,
+                                                         "pixels":[{"x":x,"y":y,"char":ch} for x, y, ch in fb.items()]})),
+           "bin_encode_s": _timeit(enc_bin),
+           "json_decode_s": _timeit(lambda: json.loads(js)),
+           "bin_decode_s": _timeit(lambda: decode_bin(bn))}
+    results.append(row)
+    print(json.dumps(row), flush=True)
+    return results
+
+def bench_persist(args):
+    """Event-loop stall per save: full state.json rewrite vs op log + snapshot."""
+    import pathlib
+    results = []
+    for size in args.sizes:
+        w, h = (int(v) for v in size.lower().split("x"))
+        fb = Framebuffer(w, h)
+        fb.apply(_random_cells(w, h, args.density), '█')
+        tmp = pathlib.Path(tempfile.mkdtemp(prefix="paintsource-bench-"))
+        try:
+            def json_save():   # what save_state() does, all of it on the event loop
+                data = {"w": w, "h": h, "pixels": [{"x":x,"y":y,"char":ch} for x, y, ch in fb.items()],
+                        "saved_at": int(time.time())}
+                (tmp / "state.tmp").write_text(json.dumps(data, ensure_ascii=False))
+                (tmp / "state.tmp").replace(tmp / "state.json")
+
+            rnd = random.Random(2)
+            ops = [[[rnd.randrange(w), rnd.randrange(h)] for _ in range(3)] for _ in range(args.ops)]
+            log = OpLog(tmp, 50, 1 << 30)
+            t_append = _timeit(lambda: [log.append(encode_bin_op(p, ['█']*3, w)) for p in ops], repeat=1)
+
+            async def flush_and_compact():
+                t0 = time.perf_counter(); await log.flush()
+                t1 = time.perf_counter(); await log.compact(fb)
+                return t1 - t0, time.perf_counter() - t1
+
+            flush_total, compact_total = asyncio.run(flush_and_compact())
+            log.io.shutdown(wait=True)
+            row = {"size": f"{w}x{h}", "cells": len(fb),
+                   "json_save_stall_s": _timeit(json_save, repeat=1),
+                   "wal_append_us_per_op": 1e6 * t_append / len(ops),
+                   "wal_flush_total_s": flush_total,
+                   "wal_compact_stall_s": _timeit(lambda: cells_le(fb.cells)),   # the only on-loop part
+                   "wal_compact_total_s": compact_total}
+        finally:
+            shutil.rmtree(tmp, ignore_errors=True)
+        results.append(row)
+        print(json.dumps(row), flush=True)
+    return results
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0)); return s.getsockname()[1]
+
+def _spawn_server(port, data, *extra):
+    """Start app.py on `data` in a subprocess and wait until it accepts connections.
+    If it never does, `data` is removed; otherwise the caller removes it once done."""
+    here = os.path.dirname(os.path.abspath(__file__))
+    proc = subprocess.Popen([sys.executable, os.path.join(here, "app.py"), "--port", str(port),
+                             "--data", data, *map(str, extra)],
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.time() + 15
+    while time.time() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=0.2).close(); return proc
+        except OSError:
+            time.sleep(0.1)
+    proc.kill(); proc.wait()
+    shutil.rmtree(data, ignore_errors=True)
+    raise RuntimeError("server did not start")
+
+def _cpu_seconds(pid):
+    """utime+stime of a process, from /proc (Linux only)."""
+    with open(f"/proc/{pid}/stat") as f:
+        fields = f.read().rsplit(")", 1)[1].split()
+    return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+
+async def _paint_load(url, painters, viewers, seconds, rate, w, h):
+    import websockets
+    frames = [0] * viewers
+    stop = time.monotonic() + seconds
+
+    async def painter(i):
+        rnd = random.Random(i)
+        async with websockets.connect(url, max_size=None) as ws:
+            await ws.recv()
+            x, y = rnd.randrange(w), rnd.randrange(h)
+            while time.monotonic() < stop:
+                pts = []
+                for _ in range(rnd.randint(1, 3)):
+                    x = min(w-1, max(0, x + rnd.choice((-1, 0, 1))))
+                    y = min(h-1, max(0, y + rnd.choice((-1, 0, 1))))
+                    pts.append([x, y])
+                await ws.send(json.dumps({"v":1,"type":"op","room":"paintsource/global",
+                                          "op":{"tool":"set","mode":"set","points":pts,"char":"█"}}))
+                await asyncio.sleep(1 / rate)
+
+    async def viewer(i):
+        async with websockets.connect(url, max_size=None) as ws:
+            await ws.recv()
+            while time.monotonic() < stop:
+                try: await asyncio.wait_for(ws.recv(), timeout=max(0.01, stop - time.monotonic()))
+                except asyncio.TimeoutError: break
+                frames[i] += 1
+
+    await asyncio.gather(*[viewer(i) for i in range(viewers)], *[painter(i) for i in range(painters)])
+    return frames
+
+def bench_tick(args):
+    """Frames/sec seen by each viewer and server CPU, with and without --tick-ms."""
+    results = []
+    for tick in args.ticks:
+        port = _free_port()
+        data = tempfile.mkdtemp(prefix="paintsource-bench-")
+        proc = _spawn_server(port, data, "--cols", args.cols, "--rows", args.rows, "--tick-ms", tick)
+        try:
+            cpu0 = _cpu_seconds(proc.pid)
+            frames = asyncio.run(_paint_load(f"ws://127.0.0.1:{port}/ws", args.painters, args.viewers,
+                                             args.seconds, args.rate, args.cols, args.rows))
+            cpu = _cpu_seconds(proc.pid) - cpu0
+        finally:
+            proc.terminate(); proc.wait()
+            shutil.rmtree(data, ignore_errors=True)
+        row = {"tick_ms": tick, "painters": args.painters, "viewers": args.viewers,
+               "frames_per_sec_per_viewer": sum(frames) / max(1, len(frames)) / args.seconds,
+               "server_cpu_pct": 100 * cpu / args.seconds}
+        results.append(row)
+        print(json.dumps(row), flush=True)
+    return results
+
+def _rss_mb(pid):
+    """Current and peak resident set size of a process in MiB, from /proc (Linux only)."""
+    with open(f"/proc/{pid}/status") as f:
+        kv = dict(line.split(":", 1) for line in f if ":" in line)
+    return int(kv["VmRSS"].split()[0]) / 1024, int(kv["VmHWM"].split()[0]) / 1024
+
+def _http(port, method, path):
+    req = urllib.request.Request(f"http://127.0.0.1:{port}{path}", method=method)
+    with urllib.request.urlopen(req, timeout=30) as r: return r.read()
+
+def _server_counter(port, name):
+    """One unlabelled series from the server's /metrics."""
+    for line in _http(port, "GET", "/metrics").decode().splitlines():
+        if line.startswith(f"paintsource_{name} "): return float(line.split()[1])
+    return 0.0
+
+def _pct(values, p):
+    if not values: return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(p / 100 * len(values)))]
+
+async def _synthetic_clients(port, clients, seconds, rate, w, h, proto, seed, admin, state_every, clear_every):
+    """`clients` sockets drawing like the web page and term_client, timing the echo of their own ops.
+
+    Each client repeats strokes: Bresenham drags (JSON: line ops like the page, binary: point
+    runs like term_client), letter brushes, and single-cell toggles. The server applies one
+    socket's ops in order, so an echo that covers the oldest unanswered op's cells answers it.
+    Ops with no echo after 5 s (rate limited, or hidden by a clear) count as lost.
+    """
+    import websockets
+    from app import BIN_IN_OP, rasterize
+    from term_client import decode_bin
+    stop = time.monotonic() + seconds
+    out = {"sent": 0, "lost": 0, "latencies": [], "state_latencies": [], "clear_latencies": []}
+
+    async def client(i):
+        rnd = random.Random(seed * 100003 + i)
+        binary = proto == "bin" or (proto == "mix" and i % 2 == 1)
+        pending = deque()   # (sent at, flat indices) per op not echoed yet
+        async with websockets.connect(f"ws://127.0.0.1:{port}/ws" + ("?proto=bin" if binary else ""), max_size=None) as ws:
+            await ws.recv()
+
+            async def reader():
+                async for data in ws:
+                    msg = decode_bin(data) if isinstance(data, bytes) else json.loads(data)
+                    if msg.get("type") != "op" or not pending: continue
+                    op, now = msg["op"], time.perf_counter()
+                    got = set(rasterize(op, w, h)[0]) if op.get("tool") in ("line", "rect", "text") else \
+                          {y*w + x for x, y in op["points"]}
+                    while pending and (pending[0][1] <= got or now - pending[0][0] > 5):
+                        sent_at, cells = pending.popleft()
+                        if cells <= got: out["latencies"].append(now - sent_at)
+                        else: out["lost"] += 1
+
+            task = asyncio.create_task(reader())
+            x, y = rnd.randrange(w), rnd.randrange(h)
+            try:
+                while time.monotonic() < stop:
+                    kind = rnd.random()
+                    brush = "█" if kind < .6 else (chr(rnd.randint(97, 122)) if kind < .85 else None)
+                    for _ in range(rnd.randint(5, 30) if brush else 1):
+                        nx = min(w-1, max(0, x + rnd.randint(-3, 3)))
+                        ny = min(h-1, max(0, y + rnd.randint(-3, 3)))
+                        pts = _bresenham(x, y, nx, ny) if brush else [[nx, ny]]
+                        if binary:
+                            frame = struct.pack("<BBI", BIN_IN_OP, 1 if brush else 0, ord(brush) if brush else 0) + \
+                                    b"".join(struct.pack("<HH", px, py) for px, py in pts)
+                        elif brush:
+                            frame = json.dumps({"v":1, "type":"op", "op":{"tool":"line", "x0":x, "y0":y, "x1":nx, "y1":ny, "char":brush}})
+                        else:
+                            frame = json.dumps({"v":1, "type":"op", "op":{"tool":"toggle", "points":pts}})
+                        pending.append((time.perf_counter(), frozenset(py*w + px for px, py in pts)))
+                        await ws.send(frame)
+                        out["sent"] += 1
+                        x, y = nx, ny
+                        await asyncio.sleep(1 / rate)
+                        if time.monotonic() >= stop: break
+                await asyncio.sleep(1)   # let the last echoes arrive
+            finally:
+                task.cancel()
+                out["lost"] += len(pending)
+
+    async def housekeeping():
+        """Periodic /state reads and /clear calls, like page loads and an operator."""
+        next_clear = time.monotonic() + clear_every
+        while time.monotonic() < stop:
+            await asyncio.sleep(state_every)
+            t = time.perf_counter(); await asyncio.to_thread(_http, port, "GET", "/state")
+            out["state_latencies"].append(time.perf_counter() - t)
+            if clear_every and time.monotonic() >= next_clear:
+                t = time.perf_counter(); await asyncio.to_thread(_http, port, "POST", "/clear")
+                out["clear_latencies"].append(time.perf_counter() - t)
+                next_clear += clear_every
+
+    await asyncio.gather(*[client(i) for i in range(clients)], *([housekeeping()] if admin else []))
+    return out
+
+def _synthetic_worker(job):
+    return asyncio.run(_synthetic_clients(*job))
+
+def bench_load(args):
+    """Ops/sec, echo latency and server CPU/RSS for synthetic painters, per canvas size and client count."""
+    import multiprocessing
+    results = []
+    for size in args.sizes:
+        w, h = (int(v) for v in size.lower().split("x"))
+        for n in args.clients:
+            port = _free_port()
+            data = tempfile.mkdtemp(prefix="paintsource-bench-")
+            proc = _spawn_server(port, data, "--cols", w, "--rows", h, "--tick-ms", args.tick_ms, *shlex.split(args.server_args))
+            try:
+                ops0, cpu0 = _server_counter(port, "ops_total"), _cpu_seconds(proc.pid)
+                procs = max(1, min(args.procs, n))
+                jobs = [(port, n // procs + (k < n % procs), args.seconds, args.rate, w, h, args.proto, k,
+                         k == 0, args.state_every, args.clear_every) for k in range(procs)]
+                t0 = time.monotonic()
+                if procs == 1:
+                    parts = [_synthetic_worker(jobs[0])]
+                else:
+                    with multiprocessing.get_context("spawn").Pool(procs) as pool:
+                        parts = pool.map(_synthetic_worker, jobs)
+                elapsed = time.monotonic() - t0
+                cpu, ops = _cpu_seconds(proc.pid) - cpu0, _server_counter(port, "ops_total") - ops0
+                rss, peak = _rss_mb(proc.pid)
+            finally:
+                proc.terminate(); proc.wait()
+                shutil.rmtree(data, ignore_errors=True)
+            lat = [v for p in parts for v in p["latencies"]]
+            state = [v for p in parts for v in p["state_latencies"]]
+            ms = lambda v: None if v is None else round(1000 * v, 3)
+            row = {"size": f"{w}x{h}", "clients": n, "proto": args.proto, "tick_ms": args.tick_ms,
+                   "seconds": args.seconds, "sent_ops_per_sec": sum(p["sent"] for p in parts) / args.seconds,
+                   "server_ops_per_sec": ops / args.seconds,
+                   "echo_p50_ms": ms(_pct(lat, 50)), "echo_p95_ms": ms(_pct(lat, 95)), "echo_p99_ms": ms(_pct(lat, 99)),
+                   "echoed": len(lat), "lost": sum(p["lost"] for p in parts),
+                   "state_p50_ms": ms(_pct(state, 50)), "state_p99_ms": ms(_pct(state, 99)),
+                   "clears": sum(len(p["clear_latencies"]) for p in parts),
+                   "server_cpu_pct": 100 * cpu / elapsed, "server_rss_mb": rss, "server_peak_rss_mb": peak}
+            results.append(row)
+            print(json.dumps(row), flush=True)
+    return results
+
+def _load_worker(job):
+    return asyncio.run(_paint_load(*job))
+
+def bench_workers(args):
+    """Frames/sec delivered to many viewers as --workers grows; load comes from --procs processes."""
+    import multiprocessing
+    results = []
+    for n in args.workers:
+        port = _free_port()
+        data = tempfile.mkdtemp(prefix="paintsource-bench-")
+        proc = _spawn_server(port, data, "--cols", args.cols, "--rows", args.rows, "--tick-ms", args.tick_ms, "--workers", n)
+        try:
+            time.sleep(1)   # let every worker finish joining the backplane
+            job = (f"ws://127.0.0.1:{port}/ws", max(1, args.painters // args.procs), max(1, args.viewers // args.procs),
+                   args.seconds, args.rate, args.cols, args.rows)
+            with multiprocessing.get_context("spawn").Pool(args.procs) as pool:
+                frames = [f for part in pool.map(_load_worker, [job] * args.procs) for f in part]
+        finally:
+            proc.terminate(); proc.wait()
+            shutil.rmtree(data, ignore_errors=True)
+        row = {"workers": n, "painters": job[1] * args.procs, "viewers": len(frames),
+               "frames_per_sec_total": sum(frames) / args.seconds,
+               "frames_per_sec_per_viewer": sum(frames) / max(1, len(frames)) / args.seconds}
+        results.append(row)
+        print(json.dumps(row), flush=True)
+    return results
+
+def main():
+    ap = argparse.ArgumentParser(description="PaintSource benchmarks")
+    sub = ap.add_subparsers(dest="bench", required=True)
+
+    p = sub.add_parser("framebuffer", help="Framebuffer memory and scan time")
+    p.add_argument("--sizes", nargs="+", default=["160x48", "1000x1000", "4000x4000"])
+    p.add_argument("--density", type=float, default=0.1, help="Fraction of cells touched")
+    p.add_argument("--skip-dict", action="store_true", help="Skip the legacy dict baseline")
+    p.set_defaults(func=bench_framebuffer)
+
+    p = sub.add_parser("tick", help="Frames/sec and server CPU under many painters, per --tick-ms")
+    p.add_argument("--ticks", type=int, nargs="+", default=[0, 16])
+    p.add_argument("--painters", type=int, default=20)
+    p.add_argument("--viewers", type=int, default=20)
+    p.add_argument("--rate", type=float, default=60, help="Ops/sec per painter")
+    p.add_argument("--seconds", type=float, default=5)
+    p.add_argument("--cols", type=int, default=160)
+    p.add_argument("--rows", type=int, default=48)
+    p.set_defaults(func=bench_tick)
+
+    p = sub.add_parser("protocol", help="JSON vs binary protocol size and codec time")
+    p.add_argument("--ops", type=int, default=2000)
+    p.add_argument("--cols", type=int, default=1000)
+    p.add_argument("--rows", type=int, default=1000)
+    p.add_argument("--density", type=float, default=0.1, help="Fraction of cells filled for the state case")
+    p.set_defaults(func=bench_protocol)
+
+    p = sub.add_parser("persist", help="Event-loop stall per save: state.json vs --persist wal")
+    p.add_argument("--sizes", nargs="+", default=["160x48", "1000x1000", "4000x4000"])
+    p.add_argument("--density", type=float, default=0.1, help="Fraction of cells filled")
+    p.add_argument("--ops", type=int, default=10000, help="3-point ops appended to the log")
+    p.set_defaults(func=bench_persist)
+
+    p = sub.add_parser("workers", help="Fan-out throughput per --workers count (multi-process + backplane)")
+    p.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    p.add_argument("--procs", type=int, default=4, help="Load generator processes")
+    p.add_argument("--painters", type=int, default=40)
+    p.add_argument("--viewers", type=int, default=400)
+    p.add_argument("--rate", type=float, default=30, help="Ops/sec per painter")
+    p.add_argument("--seconds", type=float, default=5)
+    p.add_argument("--tick-ms", type=int, default=0)
+    p.add_argument("--cols", type=int, default=160)
+    p.add_argument("--rows", type=int, default=48)
+    p.set_defaults(func=bench_workers)
+
+    p = sub.add_parser("load", help="Synthetic painters: ops/sec, echo latency p50/p95/p99, server CPU/RSS")
+    p.add_argument("--sizes", nargs="+", default=["160x48", "1000x1000"])
+    p.add_argument("--clients", type=int, nargs="+", default=[10, 50, 200])
+    p.add_argument("--rate", type=float, default=20, help="Ops/sec per client")
+    p.add_argument("--seconds", type=float, default=10)
+    p.add_argument("--proto", choices=("json", "bin", "mix"), default="mix", help="Client protocol (mix = half each)")
+    p.add_argument("--state-every", type=float, default=1, help="Seconds between GET /state calls")
+    p.add_argument("--clear-every", type=float, default=5, help="Seconds between POST /clear calls (0 = never)")
+    p.add_argument("--tick-ms", type=int, default=0)
+    p.add_argument("--procs", type=int, default=1, help="Load generator processes")
+    p.add_argument("--server-args", default="", help='Extra app.py flags, e.g. "--persist wal"')
+    p.set_defaults(func=bench_load)
+
+    for p in sub.choices.values():
+        p.add_argument("--out", metavar="FILE", help="Also write the results, with the arguments used, as JSON")
+    args = ap.parse_args()
+    results = args.func(args)
+    if args.out:
+        params = {k: v for k, v in vars(args).items() if k not in ("bench", "func", "out")}
+        with open(args.out, "w") as f:
+            json.dump({"bench": args.bench, "args": params, "time": int(time.time()), "results": results}, f, indent=1)
+
+if __name__ == "__main__":
+    main()
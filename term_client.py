@@ -1,97 +1,345 @@
 # term_client.py — PRO TTY (BrushChar-compatible with server features)
-import asyncio, curses, json, websockets, uuid, time, argparse, string
+import asyncio, curses, json, websockets, uuid, sys, time, argparse, string, struct
+from urllib.parse import quote
 
 def parse_args():
     ap = argparse.ArgumentParser(description="PaintSource TTY client")
     ap.add_argument("--ws", default="ws://127.0.0.1:7100/ws", help="WebSocket URL")
     ap.add_argument("--cols", type=int, default=None, help="Force grid width (else learn from server)")
     ap.add_argument("--rows", type=int, default=None, help="Force grid height (else learn from server)")
+    ap.add_argument("--room", default="paintsource/global", help="Room (canvas) to join")
+    ap.add_argument("--proto", choices=("json", "bin"), default="bin", help="Wire protocol to request")
+    ap.add_argument("--fps", type=int, default=30, help="Max screen redraws per second")
+    ap.add_argument("--send-ms", type=int, default=30, help="Batch a drag's points into one op per this many ms")
     return ap.parse_args()
 
+# Binary frames (see app.py): kinds 1=op, 2=state, 3=clear, 4=tiles; 0x10 is a client op.
+BIN_OP, BIN_STATE, BIN_CLEAR, BIN_TILES, BIN_IN_OP = 1, 2, 3, 4, 0x10
+BIN_ONECHAR, BIN_WIDE = 1, 2
+
+def decode_bin(data):
+    """Decode a server binary frame into the JSON protocol's message shape."""
+    kind = data[0]
+    if kind == BIN_CLEAR:
+        return {"type": "system", "event": "clear", "version": struct.unpack_from("<Q", data, 1)[0]}
+    flags, off = data[1], 2
+    msg = {}
+    if kind in (BIN_STATE, BIN_TILES):
+        msg["w"], msg["h"] = struct.unpack_from("<II", data, off); off += 8
+    (msg["version"],) = struct.unpack_from("<Q", data, off); off += 8
+    if kind == BIN_TILES:
+        msg["tile"], n = struct.unpack_from("<HI", data, off); off += 6
+        flat = struct.unpack_from(f"<{2*n}H", data, off); off += 4*n
+        msg["tiles"] = [list(flat[i:i+2]) for i in range(0, 2*n, 2)]
+    (ntable,) = struct.unpack_from("<H", data, off); off += 2
+    table = [chr(cp) if cp else None for cp in struct.unpack_from(f"<{ntable}I", data, off)]; off += 4*ntable
+    (nruns,) = struct.unpack_from("<I", data, off); off += 4
+    idx_fmt = "" if flags & BIN_ONECHAR else ("H" if flags & BIN_WIDE else "B")
+    pts, chars = [], []
+    for _ in range(nruns):
+        y, x, n = struct.unpack_from("<HHH", data, off); off += 6
+        pts.extend([x+i, y] for i in range(n))
+        if idx_fmt:
+            chars.extend(table[i] for i in struct.unpack_from(f"<{n}{idx_fmt}", data, off))
+            off += n * struct.calcsize(idx_fmt)
+        else:
+            chars.extend([table[0]] * n)
+    if kind in (BIN_STATE, BIN_TILES):
+        msg.update(type="state" if kind == BIN_STATE else "tiles", pixels=[{"x":x,"y":y,"char":ch} for (x,y), ch in zip(pts, chars)])
+    else:
+        msg.update(type="op", op={"tool":"frame","points":pts,"chars":chars})
+    return msg
+
+def encode_bin_op(points, brush):
+    if brush: head = struct.pack("<BBI", BIN_IN_OP, 1, ord(brush))
+    else: head = struct.pack("<BBI", BIN_IN_OP, 0, 0)
+    return head + b"".join(struct.pack("<HH", x, y) for x, y in points)
+
+# Same cells as rasterize() in app.py; shapes arrive as the compact op.
+SHAPES = ("line", "rect", "text", "flood_fill")
+TOOLS = ("free", "line", "rect", "rectfill", "flood_fill")
+
+def rasterize(op, w, h):
+    if op["tool"] == "flood_fill":   # filled on the server: the op carries its row runs
+        for x, y, n in op.get("runs", []):
+            for i in range(n): yield x + i, y, op.get("char")
+        return
+    if op["tool"] == "text":
+        for dy, line in enumerate(op["text"].split("\n")):
+            if op["y"] + dy >= h: break
+            for dx, ch in enumerate(line[:w - op["x"]]):
+                yield op["x"] + dx, op["y"] + dy, None if ch == " " else ch
+        return
+    x0, y0, x1, y1, ch = op["x0"], op["y0"], op["x1"], op["y1"], op.get("char")
+    if op["tool"] == "rect":
+        for y in range(min(y0, y1), max(y0, y1) + 1):
+            for x in range(min(x0, x1), max(x0, x1) + 1):
+                if op.get("fill") or y in (y0, y1) or x in (x0, x1): yield x, y, ch
+        return
+    dx, dy = abs(x1 - x0), -abs(y1 - y0)
+    sx, sy = (1 if x0 < x1 else -1), (1 if y0 < y1 else -1)
+    err = dx + dy
+    while True:
+        yield x0, y0, ch
+        if x0 == x1 and y0 == y1: break
+        e2 = 2*err
+        if e2 >= dy: err += dy; x0 += sx
+        if e2 <= dx: err += dx; y0 += sy
+
 def draw_cell(stdscr, x, y, ch):
     if ch is None: ch = " "
     try: stdscr.addstr(y, x, ch)
     except curses.error: pass
 
-def draw_status(stdscr, grid_w, grid_h, brush):
+def draw_status(stdscr, grid):
     rows, cols = stdscr.getmaxyx()
-    msg = f"Target: {grid_w}x{grid_h} • Brush: {repr(brush) if brush else 'toggle(█/ )'} • q=quit"
-    try: stdscr.addstr(0, 0, msg[:max(0, cols-1)])
+    if grid["notice"]:
+        msg = grid["notice"]
+    elif grid["text"] is not None:
+        msg = f"Text: {grid['text']}_ • Enter=write at last click • Esc=cancel"
+    else:
+        brush = grid["brush"]
+        msg = (f"Target: {grid['w'] or 80}x{grid['h'] or 24} • Brush: {repr(brush) if brush else 'toggle(█/ )'} • "
+               f"Tool: {grid['tool']} (Tab) • Enter=text • q=quit")
+    try: stdscr.addstr(0, 0, msg[:max(0, cols-1)].ljust(max(0, cols-1)))
     except curses.error: pass
 
+def mark(grid, x, y, ch):
+    """Queue a cell for the next frame; render_loop draws it."""
+    grid["cells"][(x, y)] = ch
+    grid["changed"].set()
+
+def wipe(grid):
+    grid["cells"].clear(); grid["wipe"] = True
+    grid["changed"].set()
+
+async def render_loop(stdscr, grid, fps):
+    """Draw what changed since the last frame, at most `fps` frames a second; idle while nothing changes."""
+    frame = 1 / max(1, fps)
+    while True:
+        await grid["changed"].wait()
+        grid["changed"].clear()
+        if grid["wipe"]:
+            stdscr.erase(); grid["wipe"] = False
+        cells, grid["cells"] = grid["cells"], {}
+        for (x, y), ch in cells.items():
+            draw_cell(stdscr, x, y, ch)
+        draw_status(stdscr, grid)
+        stdscr.noutrefresh(); curses.doupdate()   # one write to the terminal per frame
+        await asyncio.sleep(frame)
+
 async def recv_loop(stdscr, ws, grid):
     while True:
-        m = json.loads(await ws.recv())
+        raw = await ws.recv()
+        if isinstance(raw, bytes):
+            grid["binary"] = True
+            m = decode_bin(raw)
+        else:
+            m = json.loads(raw)
+        if m.get("version") is not None:
+            grid["version"] = m["version"]
         t = m.get("type")
+        if t in ("state", "tiles") and (grid["w"] is None or grid["h"] is None):
+            grid["w"] = int(m.get("w", 80))
+            grid["h"] = int(m.get("h", 24))
         if t == "state":
-            if grid["w"] is None or grid["h"] is None:
-                grid["w"] = int(m.get("w", 80))
-                grid["h"] = int(m.get("h", 24))
-            stdscr.clear()
+            wipe(grid)
             for p in m.get("pixels", []):
-                draw_cell(stdscr, p["x"], p["y"], p.get("char", "█"))
-            draw_status(stdscr, grid["w"], grid["h"], grid.get("brush"))
-            stdscr.refresh()
+                mark(grid, p["x"], p["y"], p.get("char", "█"))
+        elif t == "tiles":
+            size = int(m.get("tile", 64))
+            rows, cols = stdscr.getmaxyx()
+            for tx, ty in m.get("tiles", []):   # blank the visible part of each tile, then fill it in
+                for y in range(ty*size, min(rows, (ty+1)*size)):
+                    for x in range(tx*size, min(cols - 1, (tx+1)*size)):
+                        mark(grid, x, y, None)
+            for p in m.get("pixels", []):
+                mark(grid, p["x"], p["y"], p.get("char", "█"))
         elif t == "system" and m.get("event") == "clear":
-            stdscr.clear(); draw_status(stdscr, grid["w"], grid["h"], grid.get("brush")); stdscr.refresh()
+            wipe(grid)
+        elif t == "op" and m.get("op", {}).get("tool") in SHAPES:
+            for x, y, ch in rasterize(m["op"], grid["w"] or 80, grid["h"] or 24):
+                mark(grid, x, y, ch)
         elif t == "op":
             pts = m.get("op", {}).get("points", [])
             chars = m.get("op", {}).get("chars", [])
             if chars and len(chars)==len(pts):
                 for (x,y), ch in zip(pts, chars):
-                    draw_cell(stdscr, x, y, ch if ch is not None else " ")
-                draw_status(stdscr, grid["w"], grid["h"], grid.get("brush"))
-                stdscr.refresh()
-
-async def send_draw(ws, x, y, brush):
-    op = {"tool":"put","points":[[x,y]]}
-    if brush and len(brush)==1:
-        op["char"] = brush
-    msg = {"v":1,"type":"op","room":"paintsource/global","user":{"id":str(uuid.uuid4()),"nick":"tty"},
+                    mark(grid, x, y, ch)
+
+async def send_op(ws, op, room="paintsource/global"):
+    msg = {"v":1,"type":"op","room":room,"user":{"id":str(uuid.uuid4()),"nick":"tty"},
            "ts":int(time.time()*1000),"op":op}
     await ws.send(json.dumps(msg))
 
+MAX_OP_POINTS = 1000
+
+async def send_points(ws, points, brush, binary=False, room="paintsource/global"):
+    """Paint (or toggle, without a brush) `points` in as few messages as the server's caps allow."""
+    brush = brush if brush and len(brush)==1 else None
+    for i in range(0, len(points), MAX_OP_POINTS):
+        chunk = points[i:i + MAX_OP_POINTS]
+        if binary:
+            await ws.send(encode_bin_op(chunk, brush)); continue
+        op = {"tool":"put","points":[list(p) for p in chunk]}
+        if brush: op["char"] = brush
+        await send_op(ws, op, room)
+
+async def resubscribe(stdscr, ws, grid):
+    # Only subscribe to the part of the canvas the terminal can show.
+    rows, cols = stdscr.getmaxyx()
+    grid["view"] = (0, 0, cols, rows)
+    await ws.send(json.dumps({"type":"subscribe","x0":0,"y0":0,"x1":cols,"y1":rows}))
+
+async def session_loop(stdscr, args, grid, conn):
+    """Keep a connection up, resuming from the last version seen after a drop."""
+    delay = 0.5
+    while True:
+        rows, cols = stdscr.getmaxyx()
+        # Reconnect with the view whose cells are still on screen, so a delta is enough.
+        view = grid["view"] or (0, 0, cols, rows)
+        grid["view"] = view
+        url = args.ws + ("&" if "?" in args.ws else "?") + "view=" + ",".join(map(str, view))
+        url += "&room=" + quote(args.room, safe="")
+        if args.proto == "bin":
+            url += "&proto=bin"
+        if grid["version"] is not None:
+            url += f"&since={grid['version']}"
+        try:
+            # Only send binary once the server has answered in binary; older servers ignore ?proto=bin.
+            async with websockets.connect(url, max_size=None) as ws:
+                grid["binary"] = False
+                conn["ws"], delay = ws, 0.5
+                grid["notice"] = None; grid["changed"].set()
+                await resubscribe(stdscr, ws, grid)
+                await recv_loop(stdscr, ws, grid)
+        except (OSError, websockets.WebSocketException):
+            pass   # refused, dropped, or a bad handshake (e.g. a proxy's 502 while the server restarts)
+        except (ValueError, KeyError, TypeError, struct.error):
+            pass   # a frame we could not decode: reconnect, and the server resends from our version
+        conn["ws"] = None
+        grid["notice"] = f"Disconnected, retrying in {delay:.1f}s…"; grid["changed"].set()
+        await asyncio.sleep(delay)
+        grid["notice"] = None
+        delay = min(10.0, delay * 2)
+
+def interpolate(x0, y0, x1, y1):
+    """Cells after (x0,y0) up to (x1,y1), so a fast drag leaves no gaps."""
+    line = {"tool":"line","x0":x0,"y0":y0,"x1":x1,"y1":y1}
+    return [(x, y) for x, y, _ in rasterize(line, 0, 0)][1:]   # w/h only matter for text
+
 async def main(stdscr, args):
     curses.curs_set(0); stdscr.nodelay(True); stdscr.keypad(True)
     curses.mouseinterval(0)
     try: curses.mousemask(curses.ALL_MOUSE_EVENTS | curses.REPORT_MOUSE_POSITION)
     except Exception: pass
 
-    grid = {"w": args.cols, "h": args.rows, "brush": None}
-    draw_status(stdscr, grid.get("w") or 80, grid.get("h") or 24, grid["brush"])
-    stdscr.refresh()
+    grid = {"w": args.cols, "h": args.rows, "brush": None, "binary": False, "version": None, "view": None,
+            "tool": "free", "text": None, "last": None, "start": None, "notice": None,
+            "cells": {}, "wipe": False, "changed": asyncio.Event()}
+    stroke = {"points": [], "brush": None, "drawing": False}   # free-draw cells not sent yet
+
+    def status():
+        grid["changed"].set()
+    status()
+
+    # Wake on stdin instead of polling getch(); the timeout only picks up KEY_RESIZE, which
+    # curses reports from its SIGWINCH handler without stdin becoming readable.
+    loop = asyncio.get_running_loop()
+    ready = asyncio.Event()
+    loop.add_reader(sys.stdin.fileno(), ready.set)
+    conn = {"ws": None}
+    tasks = [asyncio.create_task(session_loop(stdscr, args, grid, conn)),
+             asyncio.create_task(render_loop(stdscr, grid, args.fps))]
+    send_sec, next_send = max(0, args.send_ms) / 1000, 0.0
+
+    async def flush_stroke():
+        points, stroke["points"] = list(dict.fromkeys(stroke["points"])), []
+        if points and conn["ws"]:
+            await send_points(conn["ws"], points, stroke["brush"], grid["binary"], args.room)
+
+    async def handle_key(k) -> bool:
+        """React to one key or mouse event; False means quit."""
+        ws = conn["ws"]
+        if grid["text"] is not None:   # typing a text op; Enter writes it at the last clicked cell
+            if k in (10, 13, curses.KEY_ENTER):
+                if ws and grid["last"] and grid["text"]:
+                    x, y = grid["last"]
+                    await send_op(ws, {"tool":"text","x":x,"y":y,"text":grid["text"]}, args.room)
+                grid["text"] = None
+            elif k == 27: grid["text"] = None
+            elif k in (curses.KEY_BACKSPACE, 127, 8): grid["text"] = grid["text"][:-1]
+            elif 32 <= k <= 126: grid["text"] += chr(k)
+            status(); return True
+        if k in (ord('q'), 27):
+            return False
+        if k == curses.KEY_RESIZE:
+            if ws: await resubscribe(stdscr, ws, grid)
+            return True
+        if k == 9:
+            grid["tool"] = TOOLS[(TOOLS.index(grid["tool"]) + 1) % len(TOOLS)]
+            status(); return True
+        if k in (10, 13, curses.KEY_ENTER):
+            grid["text"] = ""; status(); return True
+
+        if 32 <= k <= 126:
+            ch = chr(k)
+            if ch in string.printable and len(ch) == 1:
+                grid["brush"] = ch
+                status()
+                return True
+
+        if k == curses.KEY_MOUSE and grid["w"] and grid["h"] and ws:
+            try: _id, mx, my, _z, bstate = curses.getmouse()
+            except curses.error: return True
+            if not (0 <= mx < grid["w"] and 0 <= my < grid["h"]): return True
+            brush, tool = grid["brush"], grid["tool"]
+            if bstate & (curses.BUTTON1_PRESSED | curses.BUTTON1_CLICKED):
+                grid["last"] = (mx, my)
+                if tool == "flood_fill":
+                    await send_op(ws, {"tool":"flood_fill","x":mx,"y":my,"char":brush or "█"}, args.room)
+                elif tool != "free":
+                    grid["start"] = (mx, my)   # sent on release
+                else:
+                    stroke.update(drawing=True, brush=brush)
+                    stroke["points"].append((mx, my))
+            elif stroke["drawing"] and (bstate & getattr(curses, "REPORT_MOUSE_POSITION", 0) or bstate & getattr(curses, "BUTTON1_PRESSED", 0)):
+                lx, ly = grid["last"]
+                stroke["points"].extend(interpolate(lx, ly, mx, my))
+                grid["last"] = (mx, my)
+            if bstate & getattr(curses, "BUTTON1_RELEASED", 0):
+                if grid["start"]:
+                    (sx, sy), grid["start"] = grid["start"], None
+                    op = {"tool":"line" if tool == "line" else "rect","x0":sx,"y0":sy,"x1":mx,"y1":my,
+                          "char":brush or "█"}
+                    if tool != "line": op["fill"] = tool == "rectfill"
+                    await send_op(ws, op, args.room)
+                if stroke["drawing"]:
+                    if grid["last"] != (mx, my): stroke["points"].extend(interpolate(*grid["last"], mx, my))
+                    stroke["drawing"] = False
+                    await flush_stroke()
+                grid["brush"] = None
+                status()
+        return True
 
-    async with websockets.connect(args.ws) as ws:
-        asyncio.create_task(recv_loop(stdscr, ws, grid))
-        drawing=False
+    try:
         while True:
-            k = stdscr.getch()
-            if k == -1:
-                await asyncio.sleep(0.01); continue
-            if k in (ord('q'), 27):
-                break
-
-            if 32 <= k <= 126:
-                ch = chr(k)
-                if ch in string.printable and len(ch) == 1:
-                    grid["brush"] = ch
-                    draw_status(stdscr, grid.get("w") or 80, grid.get("h") or 24, grid["brush"])
-                    stdscr.refresh()
-                    continue
-
-            if k == curses.KEY_MOUSE and grid["w"] and grid["h"]:
-                try: _id, mx, my, _z, bstate = curses.getmouse()
-                except curses.error: continue
-                if not (0 <= mx < grid["w"] and 0 <= my < grid["h"]): continue
-                if bstate & (curses.BUTTON1_PRESSED | curses.BUTTON1_CLICKED):
-                    drawing=True; await send_draw(ws, mx, my, grid["brush"])
-                elif drawing and (bstate & getattr(curses, "REPORT_MOUSE_POSITION", 0) or bstate & getattr(curses, "BUTTON1_PRESSED", 0)):
-                    await send_draw(ws, mx, my, grid["brush"])
-                if bstate & getattr(curses, "BUTTON1_RELEASED", 0):
-                    drawing=False
-                    grid["brush"] = None
-                    draw_status(stdscr, grid.get("w") or 80, grid.get("h") or 24, grid["brush"])
-                    stdscr.refresh()
+            # With a stroke in progress come back in time to send it; otherwise sleep until input.
+            timeout = max(0.0, next_send - loop.time()) if stroke["points"] else 1.0
+            try: await asyncio.wait_for(ready.wait(), timeout)
+            except asyncio.TimeoutError: pass
+            ready.clear()
+            try:
+                while (k := stdscr.getch()) != -1:   # drain everything that arrived together
+                    if not await handle_key(k): return
+                if stroke["points"] and loop.time() >= next_send:
+                    await flush_stroke()
+                    next_send = loop.time() + send_sec
+            except websockets.ConnectionClosed:
+                stroke["points"] = []   # session_loop notices the drop and reconnects
+    finally:
+        loop.remove_reader(sys.stdin.fileno())
+        for t in tasks: t.cancel()
 
 if __name__ == "__main__":
     args = parse_args()
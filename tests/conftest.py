@@ -0,0 +1,42 @@
+import pathlib, sys
+
+import pytest
+
+# The modules live at the repository root rather than in a package.
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent.parent))
+
+@pytest.fixture
+def serve(tmp_path):
+    """Start make_app() under a TestClient (startup and shutdown included): serve(**options) -> client.
+    Options are make_app() keywords plus cols/rows and data (default: a fresh tmp dir)."""
+    from fastapi.testclient import TestClient
+    from app import make_app
+    clients = []
+
+    def start(cols=16, rows=8, data=tmp_path, autosave_sec=60, **options):
+        client = TestClient(make_app(cols, rows, 1, str(data), autosave_sec, **options))
+        clients.append(client.__enter__())
+        return client
+    yield start
+    for client in reversed(clients): client.__exit__(None, None, None)
+
+@pytest.fixture
+def gauge():
+    """gauge(client, name) -> current value of the paintsource_<name> gauge from /metrics."""
+    def read(client, name: str) -> float:
+        for line in client.get("/metrics").text.splitlines():
+            if line.split("{")[0].split(" ")[0] == f"paintsource_{name}":
+                return float(line.rsplit(" ", 1)[1])
+        raise KeyError(name)
+    return read
+
+@pytest.fixture
+def paint():
+    """paint(client, room, points, char="x"): draw through a /ws client and wait for the echo,
+    so the op has been applied (and broadcast) by the time it returns."""
+    def draw(client, room: str, pts, char: str = "x"):
+        with client.websocket_connect(f"/ws?room={room}") as ws:
+            ws.receive_json()
+            ws.send_json({"type": "op", "op": {"tool": "set", "mode": "set", "points": pts, "char": char}})
+            while ws.receive_json()["type"] != "op": pass
+    return draw
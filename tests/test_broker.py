@@ -0,0 +1,65 @@
+import asyncio
+
+import pytest
+
+from app import BP_FRAME, LocalBackplane, _read_frame, bp_proof, run_broker
+
+KEY = "s3cret"
+
+def frame(data):
+    return BP_FRAME.pack(len(data)) + data
+
+async def connect(path, key=KEY):
+    """A raw connection that has passed the broker's handshake."""
+    for _ in range(100):   # the broker may still be binding
+        try: reader, writer = await asyncio.open_unix_connection(str(path)); break
+        except OSError: await asyncio.sleep(0.01)
+    writer.write(frame(bp_proof(key, await _read_frame(reader))))
+    assert await _read_frame(reader) == b"ok"
+    return reader, writer
+
+def test_slow_worker_does_not_stall_the_others(tmp_path):
+    sock = tmp_path / "bp.sock"
+
+    async def run():
+        broker = asyncio.create_task(run_broker(f"unix:{sock}", KEY, max_queue=8))
+        fast_r, fast_w = await connect(sock)
+        slow_r, slow_w = await connect(sock)   # never reads until the end
+        payload = bytes(64 * 1024)
+        for i in range(64):
+            fast_w.write(frame(bytes([i]) + payload))
+            got = await asyncio.wait_for(_read_frame(fast_r), 5)
+            assert got[0] == i
+        # The slow worker was cut off once its queue filled: it reads what was buffered, then EOF.
+        n = 0
+        try:
+            while True: await asyncio.wait_for(_read_frame(slow_r), 5); n += 1
+        except asyncio.IncompleteReadError:
+            pass
+        assert n < 64
+        broker.cancel()
+        fast_w.close(); slow_w.close()
+
+    asyncio.run(run())
+
+def test_wrong_key_is_refused(tmp_path):
+    sock = tmp_path / "bp.sock"
+
+    async def run():
+        broker = asyncio.create_task(run_broker(f"unix:{sock}", KEY))
+        good_r, good_w = await connect(sock)
+        with pytest.raises(RuntimeError, match="refused"):
+            await LocalBackplane(f"unix:{sock}", "guess").start(None, None)
+        bp, got = LocalBackplane(f"unix:{sock}", KEY), []
+
+        async def on_message(data): got.append(data)
+        await bp.start(on_message, None)
+        good_w.write(frame(b"hello"))
+        assert await asyncio.wait_for(_read_frame(good_r), 5) == b"hello"
+        for _ in range(100):
+            if got: break
+            await asyncio.sleep(0.01)
+        assert got == [b"hello"]
+        await bp.close(); broker.cancel(); good_w.close()
+
+    asyncio.run(run())
@@ -0,0 +1,49 @@
+import json, pathlib, subprocess, sys
+
+from app import CanvasFile, read_canvas
+
+APP = pathlib.Path(__file__).resolve().parent.parent / "app.py"
+
+def cells(fb):
+    return {(x, y): ch for x, y, ch in fb.items()}
+
+def test_writes_survive_reopen(tmp_path):
+    path = tmp_path / "canvas.bin"
+    cf = CanvasFile(path, 8, 4)
+    assert cf.created
+    cf.framebuffer.set(1, 2, "x"); cf.framebuffer.set(7, 3, "é"); cf.framebuffer.set(0, 0, "🎨")
+    cf.close()
+    cf = CanvasFile(path, 8, 4)
+    assert not cf.created
+    assert cells(cf.framebuffer) == {(0, 0): "🎨", (1, 2): "x", (7, 3): "é"}
+    cf.close()
+
+def test_other_dimensions_keep_the_top_left_overlap(tmp_path):
+    path = tmp_path / "canvas.bin"
+    cf = CanvasFile(path, 8, 4)
+    for x, y in ((1, 1), (7, 0), (0, 3), (3, 3)): cf.framebuffer.set(x, y, "x")
+    cf.close()
+    cf = CanvasFile(path, 4, 6)   # narrower and taller
+    assert cells(cf.framebuffer) == {(1, 1): "x", (0, 3): "x", (3, 3): "x"}
+    cf.close()
+    w, h, _gen, _cells = read_canvas(path)
+    assert (w, h) == (4, 6)
+    cf = CanvasFile(path, 2, 2)
+    assert cells(cf.framebuffer) == {(1, 1): "x"}
+    cf.close()
+
+def test_convert_round_trip(tmp_path, serve):
+    pixels = [{"x": 0, "y": 0, "char": "a"}, {"x": 15, "y": 7, "char": "é"}, {"x": 3, "y": 2, "char": "🎨"}]
+    (tmp_path / "state.json").write_text(json.dumps({"w": 16, "h": 8, "pixels": pixels}, ensure_ascii=False))
+    run = lambda src, dst: subprocess.run([sys.executable, str(APP), "--convert", str(tmp_path / src), str(tmp_path / dst)],
+                                          check=True, timeout=60)
+    run("state.json", "canvas.bin")
+    run("canvas.bin", "back.json")
+    back = json.loads((tmp_path / "back.json").read_text())
+    key = lambda p: (p["y"], p["x"])
+    assert (back["w"], back["h"]) == (16, 8)
+    assert sorted(back["pixels"], key=key) == sorted(pixels, key=key)
+    # and --persist mmap serves the converted file as it is
+    (tmp_path / "state.json").unlink()
+    client = serve(persist="mmap")
+    assert sorted(client.get("/state").json()["pixels"], key=key) == sorted(pixels, key=key)
@@ -0,0 +1,79 @@
+import pytest
+
+import app
+from app import Framebuffer
+
+def board(rows):
+    """A framebuffer from strings; "." is an empty cell."""
+    fb = Framebuffer(len(rows[0]), len(rows))
+    for y, row in enumerate(rows):
+        for x, ch in enumerate(row):
+            if ch != ".": fb.set(x, y, ch)
+    return fb
+
+def text(fb):
+    return ["".join(fb.get(x, y) or "." for x in range(fb.w)) for y in range(fb.h)]
+
+ROWS = ["..#...",
+        "..#.#.",
+        "###.#.",
+        "....#."]
+
+def test_flood_returns_row_runs():
+    fb = board(ROWS)
+    assert fb.flood(0, 0, ord("o")) == [(0, 0, 2), (1, 0, 2)]
+    assert text(fb)[:2] == ["oo#...", "oo#.#."]
+
+def test_flood_follows_the_region():
+    fb = board(ROWS)
+    runs = fb.flood(5, 0, ord("o"))
+    assert runs == [(0, 3, 3), (1, 3, 1), (1, 5, 1), (2, 3, 1), (2, 5, 1), (3, 0, 4), (3, 5, 1)]
+    assert text(fb) == ["..#ooo", "..#o#o", "###o#o", "oooo#o"]
+
+def test_flood_over_the_limit_changes_nothing():
+    fb = board(ROWS)
+    assert fb.flood(5, 0, ord("o"), limit=11) is None
+    assert text(fb) == ROWS
+    assert fb.flood(5, 0, ord("o"), limit=12)
+
+def test_flood_with_the_same_char():
+    fb = board(ROWS)
+    assert fb.flood(2, 0, ord("#")) == []
+
+@pytest.fixture(params=["numpy", "no numpy"])
+def numpy_mode(request, monkeypatch):
+    """Runs a test with numpy, then again on the pure-Python paths."""
+    if request.param == "no numpy": monkeypatch.setattr(app, "np", None)
+    elif app.np is None: pytest.skip("numpy is not installed")
+
+def make(kind, w, h):
+    """An empty framebuffer over array('I') cells, or over a writable memoryview as CanvasFile uses."""
+    return Framebuffer(w, h, None if kind == "array" else memoryview(bytearray(4 * w * h)).cast("I"))
+
+@pytest.mark.parametrize("kind", ["array", "memoryview"])
+def test_operations_on_every_cell_type(numpy_mode, kind):
+    fb = make(kind, 6, 4)
+    cells = fb.cells
+    assert fb.empty() and list(fb.nonzero()) == [] and list(fb.items()) == [] and len(fb) == 0
+    fb.write([2, 8, 10, 12, 13, 14, 16, 22], ord("#"))
+    assert text(fb) == ROWS
+    assert not fb.empty() and len(fb) == 8
+    assert list(fb.nonzero()) == [2, 8, 10, 12, 13, 14, 16, 22]
+    assert list(fb.items())[:3] == [(2, 0, "#"), (2, 1, "#"), (4, 1, "#")]
+    assert fb.flood(5, 0, ord("o"), limit=11) is None and text(fb) == ROWS
+    assert fb.flood(5, 0, ord("o")) == [(0, 3, 3), (1, 3, 1), (1, 5, 1), (2, 3, 1), (2, 5, 1), (3, 0, 4), (3, 5, 1)]
+    fb.fill_rect(0, 0, 1, 1, ord("x"))
+    assert text(fb) == ["xx#ooo", "xx#o#o", "###o#o", "oooo#o"]
+    fb.clear()
+    assert fb.empty() and list(fb.items()) == [] and text(fb) == ["." * 6] * 4
+    if kind == "memoryview": assert fb.cells is cells   # cleared in place, still the mapped buffer
+
+@pytest.mark.parametrize("kind", ["array", "memoryview"])
+def test_batch_write_on_every_cell_type(numpy_mode, kind):
+    fb = make(kind, 20, 10)
+    idx = list(range(1, 200, 2))   # more than numpy's cut-over
+    fb.write(idx, [ord("a") + i % 26 for i in idx])
+    assert list(fb.nonzero()) == idx
+    assert list(fb.items()) == [(i % 20, i // 20, chr(ord("a") + i % 26)) for i in idx]
+    fb.write(idx[:70], 0)
+    assert list(fb.nonzero()) == idx[70:] and len(fb) == 30
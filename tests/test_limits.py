@@ -0,0 +1,33 @@
+import pytest
+
+import app
+from app import TokenBucket
+
+class Clock:
+    def __init__(self): self.t = 100.0
+    def __call__(self): return self.t
+
+def bucket(rate, monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(app.time, "monotonic", clock)
+    return TokenBucket(rate), clock
+
+def test_charges_up_to_the_rate(monkeypatch):
+    b, clock = bucket(10, monkeypatch)
+    assert b.wait(4) == 0; b.take(4)
+    assert b.wait(10) == pytest.approx(0.4)
+    clock.t += 0.4
+    assert b.wait(10) == 0
+
+def test_big_request_goes_into_debt(monkeypatch):
+    b, clock = bucket(10, monkeypatch)
+    assert b.wait(50) == 0   # a full bucket lets it through...
+    b.take(50)
+    assert b.wait(1) == pytest.approx(4.1)   # ...and the next unit waits until the other 40 are paid off
+    clock.t += 4.2
+    assert b.wait(1) == 0
+
+def test_zero_rate_is_unlimited(monkeypatch):
+    b, _clock = bucket(0, monkeypatch)
+    b.take(10**9)
+    assert b.wait(10**9) == 0
@@ -0,0 +1,27 @@
+import asyncio, socket
+
+from app import make_app
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0)); return s.getsockname()[1]
+
+async def get(port, path):
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    writer.write(f"GET {path} HTTP/1.1\r\nHost: x\r\n\r\n".encode())
+    data = await reader.read()
+    writer.close()
+    return data.decode()
+
+def test_metrics_port_serves_this_worker(tmp_path):
+    port = free_port()
+    web = make_app(16, 8, 1, str(tmp_path), 60, metrics_port=port)
+
+    async def run():
+        async with web.router.lifespan_context(web):
+            got = await get(port, "/metrics")
+            assert got.startswith("HTTP/1.1 200 OK")
+            assert "# TYPE paintsource_ops_total counter" in got
+            assert (await get(port, "/state")).startswith("HTTP/1.1 404")
+
+    asyncio.run(run())
@@ -0,0 +1,111 @@
+import asyncio, struct
+
+import pytest
+
+from app import BIN_CLEAR, Framebuffer, OpLog, encode_bin_op
+
+W, H = 16, 8
+
+def record(pts, char, version):
+    return encode_bin_op(pts, [char] * len(pts), W, version)
+
+def new_log(path):
+    return OpLog(path, flush_ms=10, compact_bytes=1 << 20)
+
+def write_ops(path, ops):
+    """Append `ops` (payloads) to a fresh log in `path` and flush them; returns the log."""
+    log = new_log(path)
+    log.recover(Framebuffer(W, H))
+    for payload in ops: log.append(payload)
+    asyncio.run(log.flush())
+    log.io.shutdown(wait=True)
+    return log
+
+def recovered(path):
+    fb, log = Framebuffer(W, H), new_log(path)
+    found = log.recover(fb)
+    log.io.shutdown(wait=True)
+    return fb, log, found
+
+def cells(fb):
+    return {(x, y): ch for x, y, ch in fb.items()}
+
+OPS = [record([(0, 0), (1, 0)], "a", 1), record([(2, 2)], "b", 2), record([(0, 0)], None, 3)]
+
+def test_replays_every_record(tmp_path):
+    write_ops(tmp_path, OPS)
+    fb, log, found = recovered(tmp_path)
+    assert found
+    assert cells(fb) == {(1, 0): "a", (2, 2): "b"}
+    assert log.gen == 1   # never appends to the segment it replayed
+
+def test_empty_dir_has_nothing_to_recover(tmp_path):
+    fb, log, found = recovered(tmp_path)
+    assert not found and len(fb) == 0 and log.gen == 0
+
+@pytest.mark.parametrize("cut", [1, 5, 8, 9])
+def test_torn_tail_is_dropped(tmp_path, cut):
+    write_ops(tmp_path, OPS)
+    seg = tmp_path / "ops.00000000.log"
+    seg.write_bytes(seg.read_bytes()[:-cut])   # partial header or payload of the last record
+    fb, _log, _found = recovered(tmp_path)
+    assert cells(fb) == {(0, 0): "a", (1, 0): "a", (2, 2): "b"}
+
+def test_corrupt_record_stops_replay(tmp_path):
+    write_ops(tmp_path, OPS)
+    seg = tmp_path / "ops.00000000.log"
+    data = bytearray(seg.read_bytes())
+    second = OpLog.RECORD.size + len(OPS[0])
+    data[second + OpLog.RECORD.size + 3] ^= 0xFF   # flip a byte in the second payload
+    seg.write_bytes(bytes(data))
+    fb, _log, _found = recovered(tmp_path)
+    assert cells(fb) == {(0, 0): "a", (1, 0): "a"}   # the third record is after the bad one
+
+def test_appends_after_torn_tail_go_to_a_new_segment(tmp_path):
+    write_ops(tmp_path, OPS[:2])
+    seg = tmp_path / "ops.00000000.log"
+    seg.write_bytes(seg.read_bytes()[:-2])
+    write_ops(tmp_path, [record([(5, 5)], "c", 4)])
+    assert (tmp_path / "ops.00000001.log").exists()
+    fb, _log, _found = recovered(tmp_path)
+    assert cells(fb) == {(0, 0): "a", (1, 0): "a", (5, 5): "c"}
+
+def test_clear_record(tmp_path):
+    write_ops(tmp_path, [OPS[0], bytes([BIN_CLEAR]), OPS[1]])
+    fb, _log, _found = recovered(tmp_path)
+    assert cells(fb) == {(2, 2): "b"}
+
+def test_compaction_keeps_the_canvas(tmp_path):
+    write_ops(tmp_path, OPS)
+    fb, _log, _found = recovered(tmp_path)
+    log = new_log(tmp_path); log.recover(fb)   # a live log again, appending to segment 1
+
+    async def run():
+        await log.compact(fb)
+        log.append(record([(7, 7)], "z", 4))
+        await log.flush()
+    asyncio.run(run()); log.io.shutdown(wait=True)
+
+    assert (tmp_path / "snapshot.bin").exists()
+    assert not (tmp_path / "ops.00000000.log").exists()   # covered by the snapshot
+    got, log, found = recovered(tmp_path)
+    assert found and log.gen == 3
+    assert cells(got) == {(1, 0): "a", (2, 2): "b", (7, 7): "z"}
+
+def test_bad_snapshot_falls_back_to_segments(tmp_path):
+    write_ops(tmp_path, OPS[:2])
+    (tmp_path / "snapshot.bin").write_bytes(b"not a canvas" + bytes(40))
+    fb, _log, found = recovered(tmp_path)
+    assert found and cells(fb) == {(0, 0): "a", (1, 0): "a", (2, 2): "b"}
+
+def test_record_framing(tmp_path):
+    write_ops(tmp_path, OPS[:1])
+    data = (tmp_path / "ops.00000000.log").read_bytes()
+    n, _crc = struct.unpack_from("<II", data)
+    assert n == len(OPS[0]) and data[8:] == OPS[0]
+
+def test_close_writes_nothing_when_covered(tmp_path):
+    room_dir = tmp_path / "room"
+    log = new_log(room_dir); log.recover(Framebuffer(W, H))
+    asyncio.run(log.close(Framebuffer(W, H)))
+    assert not room_dir.exists()   # an untouched room leaves no directory behind
@@ -0,0 +1,117 @@
+import asyncio
+
+import pytest
+
+import app
+from app import Peer
+
+class Clock:
+    def __init__(self): self.t = 100.0
+    def __call__(self): return self.t
+
+class Socket:
+    """Stands in for a WebSocket: records what is sent and how it was closed."""
+    def __init__(self, fail=False):
+        self.sent, self.close_code, self.fail = [], None, fail
+
+    async def send_text(self, data):
+        if self.fail: raise ConnectionError
+        self.sent.append(data)
+
+    async def send_bytes(self, data):
+        if self.fail: raise ConnectionError
+        self.sent.append(data)
+
+    async def close(self, code=1000):
+        self.close_code = code
+
+class Counts:
+    def __init__(self): self.counts = {}
+    def inc(self, name, n=1): self.counts[name] = self.counts.get(name, 0) + n
+
+def peer(policy="drop", max_queue=8, high_water=4, grace_sec=1.0, ws=None):
+    return Peer(ws or Socket(), max_queue, high_water, grace_sec, policy, lambda: "full state", "json", Counts())
+
+def queued(p):
+    return list(p.queue._queue)
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(app.time, "monotonic", clock)
+    return clock
+
+def test_writer_sends_in_order():
+    async def run():
+        p = peer()
+        p.start()
+        for data in ("a", b"b", "c"): p.push(data)
+        while not p.queue.empty(): await asyncio.sleep(0)
+        await asyncio.sleep(0)
+        p.stop()
+        return p.ws.sent
+    assert asyncio.run(run()) == ["a", b"b", "c"]
+
+def test_above_high_water_is_allowed_for_the_grace_period(clock):
+    p = peer(high_water=2, grace_sec=1.0)
+    for n in range(4): p.push(n)   # two over high water, but only just
+    clock.t += 0.9
+    p.push(4)
+    assert queued(p) == [0, 1, 2, 3, 4] and not p.closed
+
+def test_grace_restarts_once_below_high_water(clock):
+    p = peer(high_water=2, grace_sec=1.0)
+    for n in range(3): p.push(n)
+    clock.t += 0.9
+    p.queue.get_nowait(); p.queue.get_nowait()   # the writer catches up
+    p.push(3)
+    clock.t += 0.9
+    p.push(4); p.push(5)   # over again, but its grace started just now
+    assert not p.closed and p.metrics.counts == {}
+
+def test_drop_after_the_grace_period(clock):
+    async def run():
+        p = peer(high_water=2, grace_sec=1.0)
+        for n in range(3): p.push(n)
+        clock.t += 1.0
+        p.push(3)
+        await asyncio.sleep(0)   # let the close go out
+        p.push(4)                # ignored once closed
+        return p
+    p = asyncio.run(run())
+    assert p.closed and p.ws.close_code == 1013
+    assert p.metrics.counts == {"slow_clients_total": 1}
+    assert queued(p) == [0, 1, 2]
+
+def test_resync_replaces_the_backlog(clock):
+    p = peer(policy="resync", high_water=2, grace_sec=1.0)
+    for n in range(3): p.push(n)
+    clock.t += 1.0
+    p.push(3)
+    assert queued(p) == ["full state"] and not p.closed
+    assert p.metrics.counts == {"slow_clients_total": 1}
+    p.push(4)   # back under high water: business as usual
+    assert queued(p) == ["full state", 4]
+
+@pytest.mark.parametrize("policy, left", [("drop", [0, 1, 2]), ("resync", ["full state"])])
+def test_full_queue_overflows_at_once(clock, policy, left):
+    async def run():
+        p = peer(policy=policy, max_queue=3, high_water=3, grace_sec=60)
+        for n in range(4): p.push(n)   # no time passes: the grace period does not apply to a full queue
+        await asyncio.sleep(0)
+        return p
+    p = asyncio.run(run())
+    assert queued(p) == left and p.metrics.counts == {"slow_clients_total": 1}
+    assert p.closed == (policy == "drop")
+
+def test_send_failure_closes_the_peer():
+    async def run():
+        p = peer(ws=Socket(fail=True))
+        p.start()
+        p.push("a")
+        await p.task
+        p.push("b")
+        return p
+    p = asyncio.run(run())
+    assert p.closed and p.metrics.counts == {"send_errors_total": 1}
+    assert queued(p) == []
@@ -0,0 +1,96 @@
+import json, random, struct
+
+import pytest
+
+from app import (BIN_CLEAR, BIN_IN_OP, BIN_ONECHAR, BIN_OP, BIN_STATE, BIN_WIDE, decode_bin_in_op,
+                 encode_bin_cells, encode_bin_in_op, encode_bin_op, encode_bin_runs, iter_bin_cells)
+from term_client import decode_bin
+
+W, H = 50, 20
+
+def random_op(rnd, n, alphabet):
+    pts = [[rnd.randrange(W), rnd.randrange(H)] for _ in range(n)]
+    return pts, [rnd.choice(alphabet) for _ in pts]
+
+def last_write(pts, chars):
+    """What a JSON op leaves on the canvas: the last char written to each cell."""
+    out = {}
+    for (x, y), ch in zip(pts, chars): out[(x, y)] = ch
+    return out
+
+ALPHABETS = {
+    "onechar": ["█"],
+    "erase": [None],
+    "narrow": ["a", "b", "█", None],
+    "wide": [chr(0x4e00 + i) for i in range(300)] + [None],
+}
+
+@pytest.mark.parametrize("name", ALPHABETS)
+def test_bin_op_matches_json(name):
+    rnd = random.Random(name)
+    pts, chars = random_op(rnd, 400, ALPHABETS[name])
+    data = encode_bin_op(pts, chars, W, version=7)
+    msg = decode_bin(data)
+    assert msg["type"] == "op" and msg["version"] == 7
+    got = {tuple(p): ch for p, ch in zip(msg["op"]["points"], msg["op"]["chars"])}
+    assert got == last_write(json.loads(json.dumps(pts)), chars)
+
+@pytest.mark.parametrize("name, flags", [("onechar", BIN_ONECHAR), ("erase", BIN_ONECHAR),
+                                         ("narrow", 0), ("wide", BIN_WIDE)])
+def test_table_variants(name, flags):
+    pts, chars = random_op(random.Random(1), 2000, ALPHABETS[name])   # enough distinct chars left for "wide"
+    data = encode_bin_op(pts, chars, W)
+    assert data[1] == flags
+    cells = {(x, y): cp for x, y, cp in iter_bin_cells(data, 10)}
+    assert cells == {p: ord(ch) if ch else 0 for p, ch in last_write(pts, chars).items()}
+
+def test_runs_split_at_row_ends():
+    cells = [(y*W + x, ord("x")) for y in (3, 4) for x in range(W)]
+    data = encode_bin_cells(BIN_OP, cells, W, struct.pack("<Q", 0))
+    assert struct.unpack_from("<I", data, 10 + 2 + 4)[0] == 2   # one run per row
+    assert [(x, y) for x, y, _ in iter_bin_cells(data, 10)] == [(i % W, i // W) for i, _ in cells]
+
+def test_runs_match_cells():
+    runs = [(0, 3, 5), (2, 0, W), (4, 10, 1)]
+    head = struct.pack("<Q", 5)
+    cells = [(y*W + x + i, ord("#")) for y, x, n in runs for i in range(n)]
+    assert encode_bin_runs(BIN_OP, runs, ord("#"), head) == encode_bin_cells(BIN_OP, cells, W, head)
+
+def test_long_runs_are_split():
+    data = encode_bin_runs(BIN_OP, [(1, 0, 70000)], 0, struct.pack("<Q", 0))
+    assert struct.unpack_from("<I", data, 10 + 2 + 4)[0] == 2
+    assert sum(1 for _ in iter_bin_cells(data, 10)) == 70000
+
+def test_state_frame():
+    cells = [(0, ord("a")), (1, ord("b")), (W*H - 1, ord("█"))]
+    data = encode_bin_cells(BIN_STATE, cells, W, struct.pack("<IIQ", W, H, 42))
+    msg = decode_bin(data)
+    assert (msg["type"], msg["w"], msg["h"], msg["version"]) == ("state", W, H, 42)
+    assert msg["pixels"] == [{"x": 0, "y": 0, "char": "a"}, {"x": 1, "y": 0, "char": "b"},
+                             {"x": W - 1, "y": H - 1, "char": "█"}]
+    assert list(iter_bin_cells(data, 18)) == [(0, 0, ord("a")), (1, 0, ord("b")), (W - 1, H - 1, ord("█"))]
+
+def test_empty_and_clear():
+    msg = decode_bin(encode_bin_op([], [], W, version=3))
+    assert msg["op"]["points"] == [] and msg["version"] == 3
+    assert decode_bin(struct.pack("<BQ", BIN_CLEAR, 9)) == {"type": "system", "event": "clear", "version": 9}
+
+@pytest.mark.parametrize("op, expected", [
+    ({"tool": "toggle", "points": [[1, 2], [3, 4]]}, {"tool": "toggle", "points": [(1, 2), (3, 4)]}),
+    ({"tool": "set", "mode": "set", "points": [[0, 0], [65535, 7]], "char": "é"},
+     {"tool": "set", "mode": "set", "points": [(0, 0), (65535, 7)], "char": "é"}),
+    ({"tool": "set", "mode": "set", "points": [[5, 5]], "char": None},
+     {"tool": "set", "mode": "set", "points": [(5, 5)], "char": None}),
+    ({"tool": "put", "points": [[1, 1], [-1, 0], [70000, 1]], "char": "😀"},
+     {"tool": "set", "mode": "set", "points": [(1, 1)], "char": "😀"}),
+])
+def test_client_op_round_trip(op, expected):
+    data = encode_bin_in_op(op)
+    assert data[0] == BIN_IN_OP
+    assert decode_bin_in_op(data) == expected
+
+def test_client_op_rejects_other_frames():
+    assert decode_bin_in_op(b"") == {}
+    assert decode_bin_in_op(struct.pack("<BBI", BIN_OP, 1, 65)) == {}
+    # a trailing partial point is ignored
+    assert decode_bin_in_op(struct.pack("<BBIHHH", BIN_IN_OP, 1, 65, 1, 2, 3))["points"] == [(1, 2)]
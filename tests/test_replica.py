@@ -0,0 +1,57 @@
+import asyncio, struct
+
+import httpx
+
+import app
+from app import (BIN_STATE, BP_OP, BP_SYNC, BP_SYNC_REQ, Backplane, decode_bp, encode_bin_cells,
+                 encode_bin_in_op, encode_bp, make_app)
+
+W, H = 16, 8
+
+class FakeBackplane(Backplane):
+    """Plays the broker and the owner worker: echoes sync requests and answers them with
+    `cells`, except for rooms in `held`, whose requests wait for release()."""
+    def __init__(self, addr, key=""):
+        self.held, self.on_message = {}, None
+
+    async def start(self, on_message, on_lost):
+        self.on_message = on_message
+
+    def publish(self, data):
+        kind, _worker, name, _body = decode_bp(data)
+        if kind != BP_SYNC_REQ: return
+        if name in self.held: self.held[name].append(data)
+        else: asyncio.get_running_loop().create_task(self.answer(data, ()))
+
+    async def answer(self, req, cells):
+        _kind, worker, name, body = decode_bp(req)
+        await self.on_message(req)
+        state = encode_bin_cells(BIN_STATE, cells, W, struct.pack("<IIQ", W, H, 0))
+        await self.on_message(encode_bp(BP_SYNC, worker, name, body[:4] + state))
+
+    async def release(self, name, cells):
+        await self.answer(self.held.pop(name)[-1], cells)
+
+def pixels(resp):
+    return {(p["x"], p["y"]): p["char"] for p in resp.json()["pixels"]}
+
+def test_syncing_replica_is_not_evicted(tmp_path, monkeypatch):
+    monkeypatch.setitem(app.BACKPLANES, "fake", FakeBackplane)
+    web = make_app(W, H, 1, str(tmp_path), 60, backplane="fake:", worker_id=1, max_rooms=1)
+    bp = web.state.backplane
+
+    async def run():
+        transport = httpx.ASGITransport(app=web)
+        async with web.router.lifespan_context(web), httpx.AsyncClient(transport=transport, base_url="http://t") as client:
+            bp.held["a"] = []
+            first = asyncio.create_task(client.get("/state", params={"room": "a"}))
+            while not bp.held["a"]: await asyncio.sleep(0.01)
+            await client.get("/state", params={"room": "b"})   # over max_rooms=1 while "a" still syncs
+            await bp.release("a", [(0, ord("x"))])
+            assert pixels(await first) == {(0, 0): "x"}
+            # "a" is still the resident replica, so ops from the backplane reach it
+            op = encode_bin_in_op({"tool": "set", "mode": "set", "points": [[1, 0]], "char": "y"})
+            await bp.on_message(encode_bp(BP_OP, 0, "a", op))
+            assert pixels(await client.get("/state", params={"room": "a"})) == {(0, 0): "x", (1, 0): "y"}
+
+    asyncio.run(run())
@@ -0,0 +1,29 @@
+import pathlib
+
+from app import Framebuffer, Room
+
+def make_room(history, history_cells):
+    return Room("t", pathlib.Path("."), Framebuffer(4, 4), history, history_cells)
+
+def changes(room):
+    return [(idx, chars) for _v, idx, chars in room.changes]
+
+def test_history_is_capped_by_ops():
+    room = make_room(2, 100)
+    for i in range(3):
+        room.version += 1; room.record([i], ["a"])
+    assert changes(room) == [([1], ["a"]), ([2], ["a"])]
+
+def test_history_is_capped_by_cells():
+    room = make_room(100, 5)
+    for n in (2, 2, 3):
+        room.version += 1; room.record(list(range(n)), ["a"] * n)
+    assert [len(idx) for idx, _ in changes(room)] == [2, 3]
+    assert room.change_cells == 5
+
+def test_oversized_change_becomes_a_marker():
+    room = make_room(100, 5)
+    room.version += 1; room.record([0, 1], ["a", "b"])
+    room.version += 1; room.record(list(range(6)), ["x"] * 6)
+    assert changes(room) == [([0, 1], ["a", "b"]), (None, None)]
+    assert room.change_cells == 2
@@ -0,0 +1,77 @@
+import asyncio, pathlib, time
+
+import pytest
+from starlette.websockets import WebSocketDisconnect
+
+import app
+from app import DEFAULT_ROOM, room_dir
+
+def pixels(resp):
+    return {(p["x"], p["y"]): p["char"] for p in resp.json()["pixels"]}
+
+def wait_for(cond, timeout=5.0):
+    end = time.monotonic() + timeout
+    while not cond():
+        assert time.monotonic() < end, "timed out"
+        time.sleep(0.02)
+
+@pytest.mark.parametrize("name", ["..", "../x", ".", ".hidden", "a b", "a\\b", "", "x" * 129, "é"])
+def test_room_dir_rejects(name):
+    assert room_dir(pathlib.Path("data"), name) is None
+
+@pytest.mark.parametrize("name", ["a", "team/board-1", "a/../b", "a/..", "v1.2"])
+def test_room_dir_stays_one_level_under_rooms(name):
+    path = room_dir(pathlib.Path("data"), name)
+    assert path.parent == pathlib.Path("data/rooms") and path.name not in (".", "..")
+
+def test_default_room_uses_the_data_dir():
+    assert room_dir(pathlib.Path("data"), DEFAULT_ROOM) == pathlib.Path("data")
+
+def test_bad_room_names_are_refused(serve):
+    client = serve()
+    assert client.get("/state", params={"room": "../x"}).status_code == 400
+    assert client.post("/clear", params={"room": ".x"}).status_code == 400
+    with pytest.raises(WebSocketDisconnect) as exc:
+        with client.websocket_connect("/ws?room=..") as ws: ws.receive_json()
+    assert exc.value.code == 1008
+
+def test_rooms_are_isolated(serve, paint):
+    client = serve()
+    with client.websocket_connect("/ws?room=b") as b:
+        b.receive_json()
+        paint(client, "a", [[1, 1]])
+        paint(client, "b", [[2, 2]], "y")
+        assert b.receive_json()["op"]["points"] == [[2, 2]]   # a's op never reached b
+    assert pixels(client.get("/state", params={"room": "a"})) == {(1, 1): "x"}
+    assert pixels(client.get("/state", params={"room": "b"})) == {(2, 2): "y"}
+    assert pixels(client.get("/state")) == {}
+
+def test_idle_rooms_are_saved_and_evicted(serve, paint, gauge, tmp_path):
+    client = serve(room_idle_sec=0, autosave_sec=1)
+    paint(client, "a", [[1, 1]])
+    wait_for(lambda: gauge(client, "rooms") == 0)
+    assert (room_dir(tmp_path, "a") / "state.json").exists()
+    assert pixels(client.get("/state", params={"room": "a"})) == {(1, 1): "x"}
+
+def test_max_rooms_evicts_least_recently_used(serve, paint, gauge, tmp_path):
+    client = serve(max_rooms=2)
+    paint(client, "a", [[1, 1]])
+    paint(client, "b", [[1, 1]])
+    client.get("/state", params={"room": "a"})   # "b" is now the least recently used
+    paint(client, "c", [[1, 1]])
+    assert gauge(client, "rooms") == 2
+    wait_for(lambda: (room_dir(tmp_path, "b") / "state.json").exists())
+    assert not (room_dir(tmp_path, "a") / "state.json").exists()   # still resident, not yet saved
+
+def test_reopening_waits_for_the_eviction_save(serve, paint, monkeypatch):
+    close = app.OpLog.close
+
+    async def slow_close(self, fb):
+        await asyncio.sleep(0.3)
+        await close(self, fb)
+    monkeypatch.setattr(app.OpLog, "close", slow_close)
+    # With flushes a minute apart, a's ops are only on disk once its eviction has compacted them.
+    client = serve(max_rooms=1, persist="wal", wal_flush_ms=60000)
+    paint(client, "a", [[1, 1]])
+    paint(client, "b", [[2, 2]])   # evicts "a", which takes a while to save
+    assert pixels(client.get("/state", params={"room": "a"})) == {(1, 1): "x"}
@@ -0,0 +1,116 @@
+import asyncio, json, time
+
+import httpx
+
+from app import make_app
+from term_client import decode_bin
+
+def cells(msg):
+    if "pixels" in msg: return {(p["x"], p["y"]): p["char"] for p in msg["pixels"]}
+    return {tuple(p): ch for p, ch in zip(msg["op"]["points"], msg["op"]["chars"])}
+
+def test_late_joiner_gets_keyframe_then_newer_deltas(serve, paint):
+    client = serve(view_tick_ms=20)
+    with client.websocket_connect("/ws/view?room=r") as a:
+        assert cells(a.receive_json()) == {}
+        paint(client, "r", [[1, 1]], "a")
+        d1 = a.receive_json()
+        assert cells(d1) == {(1, 1): "a"}
+        with client.websocket_connect("/ws/view?room=r") as c, \
+             client.websocket_connect("/ws/view?room=r&proto=bin") as b:
+            # c shares this period's JSON keyframe, from before the op, and catches up with d1
+            assert cells(c.receive_json()) == {}
+            assert c.receive_json() == d1
+            # b is the period's first binary spectator: its keyframe is fresh, so d1 is not resent
+            assert cells(decode_bin(b.receive_bytes())) == {(1, 1): "a"}
+            paint(client, "r", [[2, 2]], "b")
+            d2 = a.receive_json()
+            assert c.receive_json() == d2
+            assert cells(decode_bin(b.receive_bytes())) == {(2, 2): "b"}
+
+def test_new_keyframe_period(serve, paint):
+    client = serve(view_tick_ms=20, keyframe_sec=0.2)
+    with client.websocket_connect("/ws/view?room=r") as a:
+        a.receive_json()
+        paint(client, "r", [[1, 1]])
+        a.receive_json()
+        time.sleep(0.3)   # a tick past keyframe_sec drops the old keyframe and its deltas
+        with client.websocket_connect("/ws/view?room=r") as c:
+            assert cells(c.receive_json()) == {(1, 1): "x"}
+            paint(client, "r", [[2, 2]])
+            assert cells(c.receive_json()) == {(2, 2): "x"}
+
+def test_clear_sends_everyone_a_keyframe(serve, paint):
+    client = serve(view_tick_ms=20)
+    with client.websocket_connect("/ws/view?room=r") as a, \
+         client.websocket_connect("/ws/view?room=r&proto=bin") as b:
+        a.receive_json(); b.receive_bytes()
+        paint(client, "r", [[1, 1]])
+        a.receive_json(); b.receive_bytes()
+        client.post("/clear", params={"room": "r"})
+        msg = a.receive_json()
+        assert msg["type"] == "state" and msg["pixels"] == []
+        msg = decode_bin(b.receive_bytes())
+        assert msg["type"] == "state" and msg["pixels"] == []
+
+def test_rooms_with_spectators_stay_resident(serve, gauge, paint):
+    client = serve(max_rooms=1, room_idle_sec=0, autosave_sec=1, view_tick_ms=20)
+    with client.websocket_connect("/ws/view?room=r") as v:
+        v.receive_json()
+        paint(client, "a", [[0, 0]])   # over max_rooms, but "r" has a spectator
+        paint(client, "b", [[0, 0]])   # so "a" is the one to go
+        assert gauge(client, "rooms") == 2
+        time.sleep(1.2)                # an idle check passes over "r" too
+        paint(client, "r", [[3, 3]])
+        assert cells(v.receive_json()) == {(3, 3): "x"}
+
+STREAM = {"type": "http", "method": "GET", "path": "/stream", "query_string": b"room=r", "headers": [],
+          "http_version": "1.1", "scheme": "http", "server": ("t", 80), "client": ("c", 1), "root_path": ""}
+
+async def stream(web, until, start_delay=0.0):
+    """Call /stream directly; the client disconnects once `until(body)` holds (at once if None)."""
+    body, done = bytearray(), asyncio.Event()
+    if until is None: done.set()
+
+    async def receive():
+        await done.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(msg):
+        if msg["type"] == "http.response.start": await asyncio.sleep(start_delay)
+        body.extend(msg.get("body", b""))
+        if until is not None and until(bytes(body)): done.set()
+    await asyncio.wait_for(web(dict(STREAM), receive, send), 5)
+    return bytes(body)
+
+def test_sse_framing(tmp_path):
+    web = make_app(16, 8, 1, str(tmp_path), 60, view_tick_ms=20)
+
+    async def run():
+        transport = httpx.ASGITransport(app=web)
+        async with web.router.lifespan_context(web), httpx.AsyncClient(transport=transport, base_url="http://t") as client:
+            async def clear_when_joined():
+                while "paintsource_spectators 1" not in (await client.get("/metrics")).text: await asyncio.sleep(0.01)
+                await client.post("/clear", params={"room": "r"})
+            clearing = asyncio.create_task(clear_when_joined())
+            body = await stream(web, lambda b: b.count(b"\n\n") >= 3)
+            await clearing
+        return body
+
+    events = asyncio.run(run()).split(b"\n\n")
+    assert events[0] == b"retry: 2000"
+    for event in events[1:3]:   # the keyframe, then the one the clear forces
+        assert event.startswith(b"data: ") and b"\n" not in event
+        msg = json.loads(event[6:])
+        assert msg["type"] == "state" and msg["pixels"] == []
+
+def test_stream_left_before_first_chunk_does_not_stay_joined(tmp_path):
+    web = make_app(16, 8, 1, str(tmp_path), 60)
+
+    async def run():
+        transport = httpx.ASGITransport(app=web)
+        async with web.router.lifespan_context(web), httpx.AsyncClient(transport=transport, base_url="http://t") as client:
+            await stream(web, None, start_delay=0.05)
+            return (await client.get("/metrics")).text
+
+    assert "paintsource_spectators 0" in asyncio.run(run())
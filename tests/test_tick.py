@@ -0,0 +1,14 @@
+def op(points, char):
+    return {"type": "op", "op": {"tool": "set", "mode": "set", "points": points, "char": char}}
+
+def test_ops_within_a_tick_merge_into_one_frame(serve, paint):
+    client = serve(tick_ms=500)
+    with client.websocket_connect("/ws?room=r") as watcher, client.websocket_connect("/ws?room=r") as painter:
+        watcher.receive_json(); painter.receive_json()
+        painter.send_json(op([[1, 1], [2, 1]], "a"))
+        painter.send_json(op([[1, 1]], "b"))   # same cell, same tick: only the last write goes out
+        msg = watcher.receive_json()
+        assert msg["op"]["tool"] == "frame"
+        assert dict(zip(map(tuple, msg["op"]["points"]), msg["op"]["chars"])) == {(1, 1): "b", (2, 1): "a"}
+        paint(client, "r", [[3, 3]], "c")   # the next frame holds only the next tick's op
+        assert watcher.receive_json()["op"]["points"] == [[3, 3]]
@@ -0,0 +1,64 @@
+import pytest
+
+def cells(msg):
+    if "pixels" in msg: return {(p["x"], p["y"]): p["char"] for p in msg["pixels"]}
+    return {tuple(p): ch for p, ch in zip(msg["op"]["points"], msg["op"]["chars"])}
+
+@pytest.fixture
+def client(serve):
+    return serve(cols=16, rows=8, tile=4)   # 4 x 2 tiles
+
+def test_subscriber_only_gets_its_tiles(client, paint):
+    with client.websocket_connect("/ws?room=r&view=0,0,4,4") as ws:
+        msg = ws.receive_json()
+        assert msg["type"] == "tiles" and msg["tiles"] == [[0, 0]]
+        paint(client, "r", [[1, 1], [5, 1], [1, 5]])
+        assert cells(ws.receive_json()) == {(1, 1): "x"}
+        paint(client, "r", [[10, 6]])   # nowhere near the view: nothing is sent
+        paint(client, "r", [[2, 2]], "y")
+        assert cells(ws.receive_json()) == {(2, 2): "y"}
+
+def test_resubscribe_sends_only_new_tiles(client, paint):
+    paint(client, "r", [[1, 1], [5, 1], [9, 1]])
+    with client.websocket_connect("/ws?room=r&view=0,0,4,4") as ws:
+        assert cells(ws.receive_json()) == {(1, 1): "x"}
+        ws.send_json({"type": "subscribe", "x0": 0, "y0": 0, "x1": 8, "y1": 4})
+        msg = ws.receive_json()
+        assert msg["tiles"] == [[1, 0]] and cells(msg) == {(5, 1): "x"}
+        ws.send_json({"type": "subscribe", "x0": 0, "y0": 0, "x1": 4, "y1": 4})   # shrinking adds nothing
+        paint(client, "r", [[5, 1]], "y")
+        paint(client, "r", [[1, 1]], "y")
+        assert cells(ws.receive_json()) == {(1, 1): "y"}
+
+def test_whole_canvas_peer_subscribing_gets_no_tiles_frame(client, paint):
+    with client.websocket_connect("/ws?room=r") as ws:
+        assert ws.receive_json()["type"] == "state"
+        ws.send_json({"type": "subscribe", "x0": 0, "y0": 0, "x1": 4, "y1": 4})
+        paint(client, "r", [[1, 1], [5, 1]])
+        assert cells(ws.receive_json()) == {(1, 1): "x"}
+
+def test_state_view_matches_ws(client, paint):
+    def first(view):
+        with client.websocket_connect(f"/ws?room=r&view={view}") as ws:
+            return ws.receive_json()
+    unopened = client.get("/state?room=r&view=0,0,8,4").json()   # nothing stored: answered without the room
+    assert unopened.pop("version") == 0
+    assert unopened == {k: v for k, v in first("0,0,8,4").items() if k != "version"}
+    paint(client, "r", [[1, 1], [5, 1], [9, 1], [1, 5]])
+    assert client.get("/state?room=r&view=0,0,8,4").json() == first("0,0,8,4")
+    assert cells(first("0,0,8,4")) == {(1, 1): "x", (5, 1): "x"}
+
+@pytest.mark.parametrize("view, tiles", [
+    ("0,0,4,4", [[0, 0]]),
+    ("4,0,8,4", [[1, 0]]),                              # x1 and y1 are exclusive
+    ("3,3,5,5", [[0, 0], [1, 0], [0, 1], [1, 1]]),
+    ("-10,-10,100,100", [[x, y] for y in range(2) for x in range(4)]),
+    ("15,7,99,99", [[3, 1]]),
+    ("3,3,3,9", []),
+    ("20,0,30,8", []),
+])
+def test_view_is_clamped_to_the_canvas(client, view, tiles):
+    assert client.get(f"/state?room=r&view={view}").json()["tiles"] == tiles
+
+def test_malformed_view_means_whole_canvas(client):
+    assert client.get("/state?room=r&view=1,2,x").json()["type"] == "state"